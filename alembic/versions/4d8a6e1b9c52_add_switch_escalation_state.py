@@ -0,0 +1,32 @@
+"""Add switch escalation state
+
+Revision ID: 4d8a6e1b9c52
+Revises: 9b1f4c2e7d36
+Create Date: 2026-10-19 14:21:53.094417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4d8a6e1b9c52'
+down_revision: Union[str, None] = '9b1f4c2e7d36'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('deadman_switches', sa.Column('escalation_delay', sa.Interval(), nullable=True))
+    op.add_column('deadman_switches', sa.Column('escalation_wave', sa.Integer(), server_default='0', nullable=True))
+    op.add_column('deadman_switches', sa.Column('acknowledged_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('deadman_switches', 'acknowledged_at')
+    op.drop_column('deadman_switches', 'escalation_wave')
+    op.drop_column('deadman_switches', 'escalation_delay')
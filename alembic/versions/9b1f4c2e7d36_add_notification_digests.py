@@ -0,0 +1,51 @@
+"""Add notification digests
+
+Revision ID: 9b1f4c2e7d36
+Revises: c5e6dca73453
+Create Date: 2026-10-19 13:05:27.611834
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b1f4c2e7d36'
+down_revision: Union[str, None] = 'c5e6dca73453'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('notification_digests',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('recipient_email', sa.String(length=255), nullable=False),
+    sa.Column('subject', sa.String(length=500), nullable=True),
+    sa.Column('message', sa.Text(), nullable=False),
+    sa.Column('notification_count', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.Column('sent_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('error_message', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_notification_digests_id'), 'notification_digests', ['id'], unique=False)
+    op.create_index(op.f('ix_notification_digests_recipient_email'), 'notification_digests', ['recipient_email'], unique=False)
+    with op.batch_alter_table('notifications') as batch_op:
+        batch_op.add_column(sa.Column('digest_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_notifications_digest_id'), ['digest_id'], unique=False)
+        batch_op.create_foreign_key('fk_notifications_digest_id', 'notification_digests', ['digest_id'], ['id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('notifications') as batch_op:
+        batch_op.drop_constraint('fk_notifications_digest_id', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_notifications_digest_id'))
+        batch_op.drop_column('digest_id')
+    op.drop_index(op.f('ix_notification_digests_recipient_email'), table_name='notification_digests')
+    op.drop_index(op.f('ix_notification_digests_id'), table_name='notification_digests')
+    op.drop_table('notification_digests')
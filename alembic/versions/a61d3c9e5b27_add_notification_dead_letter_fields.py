@@ -0,0 +1,38 @@
+"""Add notification dead letter fields
+
+Revision ID: a61d3c9e5b27
+Revises: e2c9a7d40f18
+Create Date: 2026-10-19 17:02:11.480316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a61d3c9e5b27'
+down_revision: Union[str, None] = 'e2c9a7d40f18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('notifications') as batch_op:
+        batch_op.add_column(sa.Column('error_class', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('failed_at', sa.DateTime(timezone=True), nullable=True))
+        batch_op.add_column(sa.Column('replay_count', sa.Integer(), server_default='0', nullable=True))
+        batch_op.create_index(batch_op.f('ix_notifications_failed_at'), ['failed_at'], unique=False)
+    # Existing failures have no failure time; use when they were queued
+    op.execute("UPDATE notifications SET failed_at = created_at WHERE status = 'failed'")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('notifications') as batch_op:
+        batch_op.drop_index(batch_op.f('ix_notifications_failed_at'))
+        batch_op.drop_column('replay_count')
+        batch_op.drop_column('failed_at')
+        batch_op.drop_column('error_class')
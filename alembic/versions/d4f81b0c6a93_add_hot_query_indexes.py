@@ -0,0 +1,47 @@
+"""Add hot query indexes
+
+Revision ID: d4f81b0c6a93
+Revises: a61d3c9e5b27
+Create Date: 2026-10-19 18:41:27.115904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4f81b0c6a93'
+down_revision: Union[str, None] = 'a61d3c9e5b27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (index name, table, columns) for the queries listed in check_query_plans.py
+INDEXES = [
+    ('ix_deadman_switches_user_id_created_at', 'deadman_switches', ['user_id', 'created_at']),
+    ('ix_deadman_switches_status_next_check_in_due', 'deadman_switches', ['status', 'next_check_in_due']),
+    ('ix_check_ins_deadman_switch_id_check_in_time', 'check_ins', ['deadman_switch_id', 'check_in_time']),
+    ('ix_check_ins_user_id_check_in_time', 'check_ins', ['user_id', 'check_in_time']),
+    ('ix_check_ins_check_in_time', 'check_ins', ['check_in_time']),
+    ('ix_emergency_contacts_deadman_switch_id_priority', 'emergency_contacts', ['deadman_switch_id', 'priority']),
+    ('ix_notifications_status_scheduled_for', 'notifications', ['status', 'scheduled_for']),
+    ('ix_notifications_deadman_switch_id', 'notifications', ['deadman_switch_id']),
+    ('ix_notifications_created_at', 'notifications', ['created_at']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY on PostgreSQL so live tables stay writable; it cannot run
+    # inside a transaction, hence the autocommit block
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,46 @@
+"""Add webhook targets
+
+Revision ID: e2c9a7d40f18
+Revises: b7e3f05a1c84
+Create Date: 2026-10-19 16:14:36.208551
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2c9a7d40f18'
+down_revision: Union[str, None] = 'b7e3f05a1c84'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('deadman_switches', sa.Column('webhook_url', sa.String(length=500), nullable=True))
+    op.add_column('emergency_contacts', sa.Column('webhook_url', sa.String(length=500), nullable=True))
+    with op.batch_alter_table('notifications') as batch_op:
+        batch_op.add_column(sa.Column('webhook_url', sa.String(length=500), nullable=True))
+        batch_op.add_column(sa.Column('transport', sa.String(length=20), nullable=True))
+        batch_op.alter_column('recipient_email', existing_type=sa.String(length=255), nullable=True)
+    with op.batch_alter_table('notification_digests') as batch_op:
+        batch_op.add_column(sa.Column('webhook_url', sa.String(length=500), nullable=True))
+        batch_op.add_column(sa.Column('transport', sa.String(length=20), nullable=True))
+        batch_op.alter_column('recipient_email', existing_type=sa.String(length=255), nullable=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('notification_digests') as batch_op:
+        batch_op.alter_column('recipient_email', existing_type=sa.String(length=255), nullable=False)
+        batch_op.drop_column('transport')
+        batch_op.drop_column('webhook_url')
+    with op.batch_alter_table('notifications') as batch_op:
+        batch_op.alter_column('recipient_email', existing_type=sa.String(length=255), nullable=False)
+        batch_op.drop_column('transport')
+        batch_op.drop_column('webhook_url')
+    op.drop_column('emergency_contacts', 'webhook_url')
+    op.drop_column('deadman_switches', 'webhook_url')
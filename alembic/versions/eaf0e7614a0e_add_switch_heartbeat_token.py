@@ -0,0 +1,30 @@
+"""Add switch heartbeat token
+
+Revision ID: eaf0e7614a0e
+Revises: 35c52290d4e7
+Create Date: 2026-10-19 11:40:08.204417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'eaf0e7614a0e'
+down_revision: Union[str, None] = '35c52290d4e7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('deadman_switches', sa.Column('heartbeat_token_hash', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_deadman_switches_heartbeat_token_hash'), 'deadman_switches', ['heartbeat_token_hash'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_deadman_switches_heartbeat_token_hash'), table_name='deadman_switches')
+    op.drop_column('deadman_switches', 'heartbeat_token_hash')
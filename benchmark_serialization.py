@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark switch listing serialization
+
+Compares, for a listing of N switches, the per-item cost of:
+  * the old path: ORM object -> SwitchResponse -> FastAPI response_model
+    validation and serialization -> JSONResponse
+  * the fast path: column tuple -> dict -> FastJSONResponse
+
+Examples:
+    python benchmark_serialization.py
+    python benchmark_serialization.py --switches 10000 --rounds 20
+"""
+import argparse
+import asyncio
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+
+from deadman_switch.api import SwitchResponse, calculate_switch_status, router
+from deadman_switch.models import DeadmanSwitch
+from deadman_switch.serialization import SWITCH_COLUMNS, FastJSONResponse, orjson, switch_to_dict
+
+SwitchRow = namedtuple("SwitchRow", [column.key for column in SWITCH_COLUMNS])
+
+
+def make_switches(count: int):
+    now = datetime.utcnow()
+    rows, objects = [], []
+    for i in range(count):
+        values = dict(
+            id=i + 1,
+            name=f"Switch {i}",
+            description="Nightly backup check" if i % 2 else None,
+            check_in_interval=timedelta(hours=24),
+            grace_period=timedelta(hours=2),
+            status="active",
+            is_enabled=True,
+            last_check_in=now - timedelta(minutes=i) if i % 3 else None,
+            created_at=now - timedelta(days=30, minutes=i),
+            check_in_samples=0,
+            lateness_mean=0.0,
+            lateness_m2=0.0,
+        )
+        values["next_check_in_due"] = (values["last_check_in"] or values["created_at"]) + values["check_in_interval"]
+        rows.append(SwitchRow(**values))
+        objects.append(DeadmanSwitch(**values))
+    return rows, objects
+
+
+async def old_path(objects, field) -> bytes:
+    responses = []
+    for switch in objects:
+        status_info = await calculate_switch_status(switch)
+        responses.append(SwitchResponse(
+            id=switch.id,
+            name=switch.name,
+            description=switch.description,
+            check_in_interval_hours=int(switch.check_in_interval.total_seconds() // 3600),
+            grace_period_hours=int(switch.grace_period.total_seconds() // 3600),
+            status=switch.status,
+            is_enabled=switch.is_enabled,
+            last_check_in=switch.last_check_in,
+            next_check_in_due=status_info["next_check_in_due"],
+            created_at=switch.created_at,
+            is_overdue=status_info["is_overdue"]
+        ))
+    content = await serialize_response(field=field, response_content=responses, is_coroutine=True)
+    return JSONResponse(content).body
+
+
+async def fast_path(rows) -> bytes:
+    now = datetime.utcnow()
+    return FastJSONResponse([switch_to_dict(row, now) for row in rows]).body
+
+
+async def measure(label: str, make_body, count: int, rounds: int) -> float:
+    await make_body()  # warm up
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        await make_body()
+        timings.append(time.perf_counter() - started)
+    best = min(timings)
+    print(f"  {label:<10} {best * 1000:8.2f} ms per listing   {best / count * 1e6:7.2f} µs per switch")
+    return best
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--switches", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    route = next(r for r in router.routes if r.path == "/switches" and "GET" in r.methods)
+    rows, objects = make_switches(args.switches)
+
+    old_body = await old_path(objects, route.response_field)
+    new_body = await fast_path(rows)
+    if old_body != new_body:
+        print("❌ Fast path output differs from the response_model output")
+        sys.exit(1)
+
+    print(f"📊 Serializing {args.switches} switches (best of {args.rounds}, encoder: {'orjson' if orjson else 'json'})")
+    old = await measure("old", lambda: old_path(objects, route.response_field), args.switches, args.rounds)
+    new = await measure("fast", lambda: fast_path(rows), args.switches, args.rounds)
+    print(f"✅ Identical JSON, {old / new:.1f}x faster")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
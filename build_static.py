@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Build content-hashed, precompressed static assets
+
+Copies every file under static/ into static/dist/ with its content hash in
+the name, writes .gz (and .br when brotli is installed) siblings for text
+assets, and records the mapping in static/dist/manifest.json. Templates
+resolve asset URLs through that manifest via static_url().
+
+Examples:
+    python build_static.py
+    python build_static.py --static-dir /app/static
+"""
+import argparse
+import sys
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from deadman_switch.assets import DIST_DIR, STATIC_DIR, build
+from deadman_switch.compression import brotli
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--static-dir", default=STATIC_DIR)
+    args = parser.parse_args()
+
+    root = Path(args.static_dir)
+    if not root.is_dir():
+        print(f"❌ Static directory not found: {root}")
+        sys.exit(1)
+
+    manifest = build(args.static_dir)
+    for source, hashed in manifest.items():
+        target = root / hashed
+        variants = [
+            f"{suffix[1:]} {target.with_name(target.name + suffix).stat().st_size}B"
+            for suffix in (".br", ".gz")
+            if target.with_name(target.name + suffix).exists()
+        ]
+        print(f"  {source} -> {hashed} ({target.stat().st_size}B{', ' + ', '.join(variants) if variants else ''})")
+
+    print(f"✅ Built {len(manifest)} assets into {root / DIST_DIR}")
+    if brotli is None:
+        print("ℹ️  brotli is not installed; only gzip variants were written")
+
+
+if __name__ == "__main__":
+    main()
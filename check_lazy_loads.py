@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Render every HTML view with lazy relationship loads turned into errors
+
+Runs the app against a throwaway SQLite database with LAZY_LOAD_RAISE=true,
+seeds one admin, one user and a switch with a contact, check-in and
+notification, then requests each HTML page. A template that reaches a
+relationship its view did not declare in deadman_switch.loaders fails with
+a 500 here instead of issuing one query per row in production.
+
+Example:
+    python check_lazy_loads.py
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Must be set before the app is imported
+scratch_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{scratch_dir}/lazy_loads.db"
+os.environ["LAZY_LOAD_RAISE"] = "true"
+for flag in ("TRIGGER_MONITOR_ENABLED", "NOTIFICATION_DISPATCHER_ENABLED", "OUTBOX_RELAY_ENABLED",
+             "ACTIVITY_RECONCILER_ENABLED"):
+    os.environ[flag] = "false"
+os.environ.setdefault("CHECKIN_JOURNAL_DIR", f"{scratch_dir}/checkin_journal")
+os.environ.setdefault("CLUSTER_LOCK_PATH", f"{scratch_dir}/leader.lock")
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from fastapi.routing import APIRoute
+from fastapi.responses import HTMLResponse
+from fastapi.testclient import TestClient
+
+from deadman_switch.auth import create_access_token, get_password_hash
+from deadman_switch.database import AsyncSessionLocal
+from deadman_switch.main import app
+from deadman_switch.models import CheckIn, DeadmanSwitch, EmergencyContact, Notification, User, UserRole
+
+
+async def seed() -> int:
+    password = get_password_hash("check-lazy-loads")
+    async with AsyncSessionLocal() as db:
+        admin = User(username="admin", email="admin@example.com", full_name="Admin",
+                     hashed_password=password, role=UserRole.ADMIN)
+        user = User(username="user", email="user@example.com", full_name="User", hashed_password=password)
+        db.add_all([admin, user])
+        await db.flush()
+        switch = DeadmanSwitch(user_id=user.id, name="Backups", description="Nightly backup check")
+        db.add(switch)
+        await db.flush()
+        db.add_all([
+            EmergencyContact(deadman_switch_id=switch.id, name="Contact", email="contact@example.com"),
+            CheckIn(user_id=user.id, deadman_switch_id=switch.id, notes="ok"),
+            Notification(deadman_switch_id=switch.id, recipient_email="contact@example.com",
+                         subject="Switch triggered", message="Backups missed", notification_type="trigger"),
+        ])
+        await db.commit()
+        return switch.id
+
+
+def html_routes():
+    for route in app.routes:
+        if isinstance(route, APIRoute) and "GET" in route.methods and route.response_class is HTMLResponse:
+            yield route.path
+
+
+def main():
+    with TestClient(app) as client:
+        switch_id = client.portal.call(seed)
+        headers = {
+            username: {"Authorization": f"Bearer {create_access_token({'sub': username})}"}
+            for username in ("admin", "user")
+        }
+
+        failures = 0
+        paths = sorted(html_routes())
+        print(f"🔍 Rendering {len(paths)} HTML views with LAZY_LOAD_RAISE=true")
+        for path in paths:
+            url = path.replace("{switch_id}", str(switch_id)).replace("{token}", "invalid")
+            role = "admin" if path.startswith("/admin") else "user"
+            try:
+                response = client.get(url, headers=headers[role], follow_redirects=False)
+                status = response.status_code
+            except Exception as e:
+                status = f"{type(e).__name__}: {e}"
+            if isinstance(status, int) and status < 500:
+                print(f"  ✅ {url} ({status})")
+            else:
+                failures += 1
+                print(f"  ❌ {url}: {status}")
+
+    if failures:
+        print(f"❌ {failures} views failed; declare their relationships in deadman_switch/loaders.py")
+        sys.exit(1)
+    print("✅ No view lazy-loads a relationship")
+
+
+if __name__ == "__main__":
+    main()
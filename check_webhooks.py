@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Exercise the webhook transport against a local stub server
+
+Starts a small HTTP server on 127.0.0.1 that answers with scripted status
+codes, then checks retries, permanent failures, per-host concurrency limits
+and the circuit breaker.
+"""
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+# The stub server is on loopback, which webhook URLs may not target by default
+os.environ["WEBHOOK_ALLOWED_HOSTS"] = "127.0.0.1"
+
+from deadman_switch.webhooks import CircuitOpenError, WebhookError, WebhookTransport
+
+
+class StubServer:
+    """Answers POST /<status> with that status; /slow sleeps before a 200"""
+
+    def __init__(self):
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.script = []  # statuses to return for /scripted, in order
+        self._server = None
+
+    async def start(self) -> int:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                length = 0
+                while True:
+                    header = await reader.readline()
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = header.decode().partition(":")
+                    if name.lower() == "content-length":
+                        length = int(value)
+                await reader.readexactly(length)
+
+                self.requests += 1
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                path = request_line.split()[1].decode()
+                if path == "/slow":
+                    await asyncio.sleep(0.1)
+                    status = 200
+                elif path == "/scripted":
+                    status = self.script.pop(0) if self.script else 200
+                else:
+                    status = int(path.strip("/"))
+                self.in_flight -= 1
+
+                writer.write(f"HTTP/1.1 {status} X\r\nContent-Length: 0\r\n\r\n".encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def main():
+    stub = StubServer()
+    port = await stub.start()
+    base = f"http://127.0.0.1:{port}"
+    failures = 0
+
+    def check(label, ok):
+        nonlocal failures
+        print(f"{'✅' if ok else '❌'} {label}")
+        failures += 0 if ok else 1
+
+    transport = WebhookTransport(max_retries=3, backoff_base=0.01, breaker_threshold=3, breaker_reset=0.5)
+
+    # Plain success
+    response = await transport.post(f"{base}/200", {"ok": True})
+    check("2xx delivered", response.status_code == 200)
+
+    # Transient errors are retried
+    stub.script = [503, 502]
+    stub.requests = 0
+    await transport.post(f"{base}/scripted", {})
+    check("5xx retried until success (3 requests)", stub.requests == 3)
+
+    # 4xx is permanent
+    stub.requests = 0
+    try:
+        await transport.post(f"{base}/404", {})
+        check("4xx fails without retry", False)
+    except WebhookError:
+        check("4xx fails without retry", stub.requests == 1)
+
+    # Per-host concurrency limit
+    limited = WebhookTransport(per_host_concurrency=4)
+    stub.max_in_flight = 0
+    started = time.perf_counter()
+    await asyncio.gather(*(limited.post(f"{base}/slow", {}) for _ in range(16)))
+    check(
+        f"per-host concurrency capped at 4 (saw {stub.max_in_flight}, {time.perf_counter() - started:.2f}s)",
+        stub.max_in_flight <= 4
+    )
+    await limited.aclose()
+
+    # Circuit breaker opens after repeated failures and short-circuits
+    breaker_transport = WebhookTransport(max_retries=5, backoff_base=0.01, breaker_threshold=3, breaker_reset=0.5)
+    stub.requests = 0
+    try:
+        await breaker_transport.post(f"{base}/500", {})
+    except CircuitOpenError:
+        pass
+    check(f"circuit opened after 3 failures ({stub.requests} requests)", stub.requests == 3)
+    stub.requests = 0
+    try:
+        await breaker_transport.post(f"{base}/500", {})
+    except CircuitOpenError:
+        check("open circuit sends nothing", stub.requests == 0)
+
+    # After the reset timeout one probe goes through and closes the circuit
+    await asyncio.sleep(0.6)
+    await breaker_transport.post(f"{base}/200", {})
+    check("half-open probe closes the circuit", breaker_transport.breaker(f"127.0.0.1:{port}").state == "closed")
+
+    await breaker_transport.aclose()
+    await transport.aclose()
+    await stub.stop()
+
+    print()
+    if failures:
+        print(f"❌ {failures} check(s) failed")
+        sys.exit(1)
+    print("🎉 All webhook transport checks passed")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Inspect and rebalance the user shards configured in DATABASE_SHARD_URLS
+
+Users are placed on a consistent-hash ring when they register; users from
+before sharding (or from before a shard was added) stay where they are
+until moved. `rebalance` moves every user whose directory entry disagrees
+with the ring, one at a time, while the app keeps serving: each user's
+requests get a 503 for the few seconds their rows are being copied.
+
+Run `init` once after adding a shard (and before it takes traffic) so
+rows created on different shards never share an id; moved rows keep theirs.
+
+Examples:
+    python rebalance_shards.py status
+    python rebalance_shards.py init
+    python rebalance_shards.py move 42 1
+    python rebalance_shards.py rebalance --dry-run
+    python rebalance_shards.py rebalance --limit 100
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from sqlalchemy import func, select, text
+
+from deadman_switch.database import async_engine
+from deadman_switch.models import DeadmanSwitch, ShardAssignment, User
+from deadman_switch.shards import ID_MODELS, SHARD_ID_BLOCK, ShardMoveError, shard_router
+
+
+async def placements():
+    """(user_id, current shard, ring shard) for every user"""
+    async with shard_router.primary.session_factory() as db:
+        result = await db.execute(
+            select(User.id, func.coalesce(ShardAssignment.shard, 0))
+            .outerjoin(ShardAssignment, ShardAssignment.user_id == User.id)
+            .order_by(User.id)
+        )
+        return [(user_id, shard, shard_router.ring.shard_for(user_id)) for user_id, shard in result.all()]
+
+
+async def status(args) -> None:
+    rows = await placements()
+    switch_counts = await shard_router.gather(
+        lambda db: db.scalar(select(func.count(DeadmanSwitch.id)))
+    )
+    print(f"🗂️  {len(shard_router.shards)} shards, {len(rows)} users")
+    for shard in shard_router.shards:
+        users = sum(1 for _, current, _ in rows if current == shard.index)
+        wanted = sum(1 for _, _, ring in rows if ring == shard.index)
+        print(f"  shard {shard.index}: {users} users (ring: {wanted}), {switch_counts[shard.index]} switches")
+    misplaced = sum(1 for _, current, ring in rows if current != ring)
+    print(f"{'✅' if not misplaced else '⚠️ '} {misplaced} users to move")
+
+
+async def init(args) -> None:
+    for shard in shard_router.shards[1:]:
+        if shard.engine.dialect.name != "postgresql":
+            print(f"  ❌ shard {shard.index}: {shard.engine.dialect.name} has no id sequences to reserve; the app will not start")
+            continue
+        floor = shard.index * SHARD_ID_BLOCK
+        async with shard.engine.begin() as conn:
+            for model in ID_MODELS:
+                table = model.__tablename__
+                # Rows moved in from other shards keep ids from their blocks
+                await conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                    f"GREATEST((SELECT COALESCE(MAX(id), 0) FROM {table} WHERE id < :ceiling), :floor))"
+                ), {"floor": floor, "ceiling": floor + SHARD_ID_BLOCK})
+        print(f"  ✅ shard {shard.index}: ids start at {floor}")
+
+
+async def move(args) -> None:
+    if not 0 <= args.shard < len(shard_router.shards):
+        print(f"❌ No shard {args.shard}")
+        sys.exit(1)
+    try:
+        copied = await shard_router.move_user(args.user_id, args.shard)
+    except ShardMoveError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print(f"✅ User {args.user_id} is on shard {args.shard} ({copied} rows copied)")
+
+
+async def rebalance(args) -> None:
+    pending = [(user_id, current, ring) for user_id, current, ring in await placements() if current != ring]
+    if args.limit:
+        pending = pending[:args.limit]
+    print(f"🔀 {len(pending)} users to move{' (dry run)' if args.dry_run else ''}")
+    moved = skipped = 0
+    for user_id, current, ring in pending:
+        if args.dry_run:
+            print(f"  user {user_id}: shard {current} -> {ring}")
+            continue
+        try:
+            copied = await shard_router.move_user(user_id, ring)
+        except ShardMoveError as e:
+            skipped += 1
+            print(f"  ⏭️  {e}")
+            continue
+        moved += 1
+        print(f"  ✅ user {user_id}: shard {current} -> {ring} ({copied} rows)")
+    if not args.dry_run:
+        print(f"✅ Moved {moved} users, skipped {skipped}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="users and switches per shard")
+    commands.add_parser("init", help="reserve a distinct id range on each added shard")
+    move_parser = commands.add_parser("move", help="move one user to a shard")
+    move_parser.add_argument("user_id", type=int)
+    move_parser.add_argument("shard", type=int)
+    rebalance_parser = commands.add_parser("rebalance", help="move users to their shard on the ring")
+    rebalance_parser.add_argument("--limit", type=int, default=0, help="move at most this many users")
+    rebalance_parser.add_argument("--dry-run", action="store_true", help="list the moves without making them")
+    args = parser.parse_args()
+
+    if not shard_router.enabled:
+        print("❌ Only one database is configured; set DATABASE_SHARD_URLS")
+        sys.exit(1)
+    try:
+        await {"status": status, "init": init, "move": move, "rebalance": rebalance}[args.command](args)
+    finally:
+        await shard_router.dispose()
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
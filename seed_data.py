@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Bulk synthetic data generator for the Deadman Switch application
+
+Generates reproducible, realistic load-test data (users, switches, check-in
+histories, emergency contacts and notifications) and loads it with bulk
+executemany inserts, or PostgreSQL COPY when available.
+
+Examples:
+    python seed_data.py --users 1000 --seed 42
+    python seed_data.py --users 50000 --max-history 200 --overdue-fraction 0.05 --copy
+"""
+import argparse
+import csv
+import io
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add the src directory to the path
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from sqlalchemy import func, select, text
+
+from deadman_switch.database import engine
+from deadman_switch.models import (
+    Base, User, DeadmanSwitch, CheckIn, EmergencyContact, Notification,
+    UserRole, SwitchStatus, NotificationStatus
+)
+from deadman_switch.auth import get_password_hash
+
+# Tables in foreign key order; buffers are always flushed in this order
+TABLES = [
+    User.__table__,
+    DeadmanSwitch.__table__,
+    EmergencyContact.__table__,
+    CheckIn.__table__,
+    Notification.__table__,
+]
+
+INTERVAL_CHOICES = [1, 6, 12, 24, 48, 168]  # hours
+INTERVAL_WEIGHTS = [2, 4, 6, 60, 18, 10]
+GRACE_CHOICES = [0, 1, 2, 6, 24]  # hours
+GRACE_WEIGHTS = [5, 20, 45, 20, 10]
+RELATIONSHIPS = ["spouse", "friend", "lawyer", "sibling", "parent", "colleague", "ops on-call"]
+USER_AGENTS = [
+    "DeadmanSwitch/1.0 (iPhone; iOS 17.4)",
+    "DeadmanSwitch/1.0 (Android 14)",
+    "curl/8.5.0",
+    "Mozilla/5.0 (X11; Linux x86_64)",
+]
+
+
+class SeedGenerator:
+    """Reproducible generator of synthetic rows"""
+
+    def __init__(self, args, id_offsets: dict, password_hash: str):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.now = args.reference_time or datetime.utcnow().replace(microsecond=0)
+        self.password_hash = password_hash
+        self.next_id = dict(id_offsets)
+
+    def _id(self, table_name: str) -> int:
+        self.next_id[table_name] += 1
+        return self.next_id[table_name]
+
+    def _switch_count(self) -> int:
+        # Heavy-tailed: most users have a handful of switches, a few have hundreds
+        count = int(self.rng.paretovariate(1.3))
+        return max(1, min(self.args.max_switches, count))
+
+    def user_rows(self):
+        """Yield (table_name, row) pairs for one user and everything they own"""
+        user_id = self._id("users")
+        created_at = self.now - timedelta(days=self.rng.randint(30, 730))
+        yield "users", {
+            "id": user_id,
+            "email": f"loadtest_{user_id}@example.com",
+            "username": f"loadtest_{user_id}",
+            "hashed_password": self.password_hash,
+            "full_name": f"Load Test {user_id}",
+            "role": UserRole.CLIENT.value,
+            "is_active": self.rng.random() > 0.02,
+            "is_verified": self.rng.random() > 0.1,
+            "created_at": created_at,
+            "updated_at": None,
+            "last_login": self.now - timedelta(minutes=self.rng.randint(0, 60 * 24 * 30)),
+        }
+
+        for _ in range(self._switch_count()):
+            yield from self.switch_rows(user_id, created_at)
+
+    def switch_rows(self, user_id: int, user_created_at: datetime):
+        """Yield rows for one switch, its contacts, check-ins and notifications"""
+        rng = self.rng
+        switch_id = self._id("deadman_switches")
+        interval = timedelta(hours=rng.choices(INTERVAL_CHOICES, INTERVAL_WEIGHTS)[0])
+        grace = timedelta(hours=rng.choices(GRACE_CHOICES, GRACE_WEIGHTS)[0])
+        created_at = user_created_at + timedelta(
+            seconds=rng.randint(0, int((self.now - user_created_at).total_seconds()))
+        )
+        overdue = rng.random() < self.args.overdue_fraction
+        enabled = rng.random() > 0.05
+
+        # Walk forward from creation with jittered gaps
+        history = []
+        max_history = rng.randint(0, self.args.max_history)
+        cursor = created_at
+        while len(history) < max_history:
+            gap = interval.total_seconds() * max(0.05, rng.gauss(0.85, self.args.jitter))
+            cursor = cursor + timedelta(seconds=gap)
+            if cursor >= self.now:
+                break
+            history.append(cursor)
+
+        # History is generated from creation; keep the most recent window so
+        # last_check_in lands close to now for on-time switches
+        if history and not overdue:
+            shift = (self.now - history[-1]) - timedelta(seconds=rng.uniform(0, interval.total_seconds()))
+            history = [t + shift for t in history if t + shift > created_at]
+        elif overdue:
+            # Push the deadline into the past: last check-in older than interval + grace
+            cutoff = self.now - interval - grace - timedelta(minutes=rng.randint(1, 60 * 48))
+            history = [t for t in history if t < cutoff]
+            if not history and created_at > cutoff:
+                # Too new to have missed a deadline yet; make it older instead
+                created_at = cutoff - timedelta(minutes=rng.randint(0, 60 * 24))
+        if not history and not overdue and created_at + interval + grace <= self.now:
+            # An on-time switch old enough to have missed its first deadline
+            # needs a check-in within the current interval
+            history = [max(created_at, self.now - timedelta(seconds=rng.uniform(0, interval.total_seconds())))]
+
+        last_check_in = history[-1] if history else None
+        status = SwitchStatus.ACTIVE
+        triggered_at = None
+        if not enabled:
+            status = SwitchStatus.PAUSED
+        elif overdue:
+            status = SwitchStatus.TRIGGERED
+            triggered_at = (last_check_in or created_at) + interval + grace
+
+        yield "deadman_switches", {
+            "id": switch_id,
+            "user_id": user_id,
+            "name": f"Switch {switch_id}",
+            "description": None if rng.random() < 0.5 else f"Synthetic switch for user {user_id}",
+            "check_in_interval": interval,
+            "grace_period": grace,
+            "status": status.value,
+            "is_enabled": enabled,
+            "created_at": created_at,
+            "updated_at": None,
+            "last_check_in": last_check_in,
+            "next_check_in_due": (last_check_in or created_at) + interval,
+            "triggered_at": triggered_at,
+        }
+
+        contacts = []
+        for priority in range(1, rng.randint(0, 3) + 1):
+            contact_id = self._id("emergency_contacts")
+            email = f"contact_{contact_id}@example.com"
+            # A small pool of shared recipients (lawyers, on-call aliases)
+            if rng.random() < 0.1:
+                email = f"shared_{rng.randint(1, 50)}@example.com"
+            contacts.append(email)
+            yield "emergency_contacts", {
+                "id": contact_id,
+                "deadman_switch_id": switch_id,
+                "name": f"Contact {contact_id}",
+                "email": email,
+                "phone": None if rng.random() < 0.6 else f"+1555{rng.randint(1000000, 9999999)}",
+                "contact_relationship": rng.choice(RELATIONSHIPS),
+                "priority": priority,
+                "is_active": True,
+                "created_at": created_at,
+            }
+
+        for check_in_time in history:
+            yield "check_ins", {
+                "id": self._id("check_ins"),
+                "user_id": user_id,
+                "deadman_switch_id": switch_id,
+                "check_in_time": check_in_time,
+                "ip_address": f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+                "user_agent": rng.choice(USER_AGENTS),
+                "location": None,
+                "notes": None if rng.random() < 0.9 else "All good",
+            }
+
+        if status == SwitchStatus.TRIGGERED:
+            for email in contacts:
+                sent = rng.random() < 0.8
+                yield "notifications", {
+                    "id": self._id("notifications"),
+                    "deadman_switch_id": switch_id,
+                    "recipient_email": email,
+                    "recipient_phone": None,
+                    "subject": f"Deadman switch 'Switch {switch_id}' triggered",
+                    "message": f"Switch {switch_id} missed its check-in deadline.",
+                    "notification_type": "trigger",
+                    "status": (NotificationStatus.SENT if sent else rng.choice(
+                        [NotificationStatus.PENDING, NotificationStatus.FAILED]
+                    )).value,
+                    "scheduled_for": triggered_at,
+                    "sent_at": triggered_at + timedelta(seconds=rng.randint(1, 120)) if sent else None,
+                    "created_at": triggered_at,
+                    "error_message": None,
+                }
+
+
+class BulkLoader:
+    """Buffers rows per table and writes them with executemany or COPY"""
+
+    def __init__(self, conn, batch_size: int, use_copy: bool):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.use_copy = use_copy
+        self.buffers = {table.name: [] for table in TABLES}
+        self.pending = 0
+        self.counts = {table.name: 0 for table in TABLES}
+
+    def add(self, table_name: str, row: dict):
+        self.buffers[table_name].append(row)
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        for table in TABLES:
+            rows = self.buffers[table.name]
+            if not rows:
+                continue
+            if self.use_copy:
+                self._copy(table, rows)
+            else:
+                self.conn.execute(table.insert(), rows)
+            self.counts[table.name] += len(rows)
+            self.buffers[table.name] = []
+        self.conn.commit()
+        self.pending = 0
+
+    def _copy(self, table, rows):
+        columns = list(rows[0].keys())
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([_copy_value(row[column]) for column in columns])
+        buffer.seek(0)
+        cursor = self.conn.connection.dbapi_connection.cursor()
+        cursor.copy_expert(
+            f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            buffer
+        )
+        cursor.close()
+
+
+def _copy_value(value):
+    """Render a Python value for PostgreSQL CSV COPY input"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, timedelta):
+        return f"{int(value.total_seconds())} seconds"
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return value
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate synthetic load-test data")
+    parser.add_argument("--users", type=int, default=1000, help="number of users to create")
+    parser.add_argument("--seed", type=int, default=42, help="random seed for reproducible output")
+    parser.add_argument("--max-switches", type=int, default=500, help="maximum switches per user")
+    parser.add_argument("--max-history", type=int, default=200, help="maximum check-ins per switch")
+    parser.add_argument("--jitter", type=float, default=0.1, help="std-dev of check-in gap as fraction of interval")
+    parser.add_argument("--overdue-fraction", type=float, default=0.03, help="fraction of switches past their deadline")
+    parser.add_argument("--batch-size", type=int, default=20000, help="rows buffered per commit")
+    parser.add_argument("--reference-time", type=datetime.fromisoformat, default=None,
+                        help="treat this UTC time as 'now' (ISO format) for byte-identical reruns")
+    parser.add_argument("--copy", action="store_true", help="use PostgreSQL COPY instead of executemany")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    use_copy = args.copy and engine.dialect.name == "postgresql"
+    if args.copy and not use_copy:
+        print("⚠️  COPY is only available on PostgreSQL, falling back to executemany")
+
+    Base.metadata.create_all(engine)
+
+    with engine.connect() as conn:
+        if engine.dialect.name == "sqlite":
+            conn.exec_driver_sql("PRAGMA synchronous=OFF")
+            conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+
+        # Continue after existing rows so repeated runs never collide
+        id_offsets = {
+            table.name: conn.execute(select(func.coalesce(func.max(table.c.id), 0))).scalar()
+            for table in TABLES
+        }
+        conn.commit()
+
+        # bcrypt is deliberately slow; every synthetic user shares one hash
+        generator = SeedGenerator(args, id_offsets, get_password_hash("loadtest123"))
+        loader = BulkLoader(conn, args.batch_size, use_copy)
+
+        started = time.perf_counter()
+        for n in range(1, args.users + 1):
+            for table_name, row in generator.user_rows():
+                loader.add(table_name, row)
+            if n % 1000 == 0:
+                elapsed = time.perf_counter() - started
+                print(f"   {n}/{args.users} users, {loader.counts['check_ins']:,} check-ins ({elapsed:.1f}s)")
+        loader.flush()
+
+        if engine.dialect.name == "postgresql":
+            # Explicit ids bypass the serial sequences; move them past the new rows
+            for table in TABLES:
+                conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                    f"(SELECT COALESCE(MAX(id), 1) FROM {table.name}))"
+                ))
+            conn.commit()
+
+    elapsed = time.perf_counter() - started
+    total = sum(loader.counts.values())
+    print("✅ Synthetic data loaded")
+    for table_name, count in loader.counts.items():
+        print(f"   - {table_name}: {count:,}")
+    print(f"   {total:,} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} rows/s)")
+    print("   All synthetic users log in with password: loadtest123")
+
+
+if __name__ == "__main__":
+    main()
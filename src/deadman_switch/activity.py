@@ -0,0 +1,221 @@
+"""
+Per-User Activity Summary
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import bindparam, case, func, insert, select, union, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import AsyncSessionLocal
+from .metrics import metrics
+from .models import CheckIn, DeadmanSwitch, SwitchStatus, UserActivitySummary
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+ACTIVITY_RECONCILER_ENABLED = os.getenv("ACTIVITY_RECONCILER_ENABLED", "true").lower() == "true"
+ACTIVITY_RECONCILE_SECONDS = float(os.getenv("ACTIVITY_RECONCILE_SECONDS", 300))
+ACTIVITY_RECONCILE_BATCH_SIZE = int(os.getenv("ACTIVITY_RECONCILE_BATCH_SIZE", 500))
+
+DAY = timedelta(days=1)
+WEEK = timedelta(days=7)
+
+STATUS_COLUMNS = {
+    SwitchStatus.ACTIVE.value: "active_switches",
+    SwitchStatus.TRIGGERED.value: "triggered_switches",
+    SwitchStatus.PAUSED.value: "paused_switches",
+    SwitchStatus.DISABLED.value: "disabled_switches",
+}
+
+summary = UserActivitySummary.__table__
+
+
+def _empty_switch_counts() -> dict:
+    return {"switch_count": 0, "last_check_in": None, **{column: 0 for column in STATUS_COLUMNS.values()}}
+
+
+async def _switch_counts(db: AsyncSession, user_ids: List[int]) -> Dict[int, dict]:
+    """Switch counts by status and the latest check-in, from the switches table"""
+    result = await db.execute(
+        select(
+            DeadmanSwitch.user_id,
+            DeadmanSwitch.status,
+            func.count(DeadmanSwitch.id),
+            func.max(DeadmanSwitch.last_check_in)
+        )
+        .where(DeadmanSwitch.user_id.in_(user_ids))
+        .group_by(DeadmanSwitch.user_id, DeadmanSwitch.status)
+    )
+    counts = {user_id: _empty_switch_counts() for user_id in user_ids}
+    for user_id, status, count, last_check_in in result.all():
+        values = counts[user_id]
+        values["switch_count"] += count
+        if status in STATUS_COLUMNS:
+            values[STATUS_COLUMNS[status]] += count
+        # A switch's last_check_in is its newest check-in, so their max is the user's
+        if last_check_in is not None and (values["last_check_in"] is None or last_check_in > values["last_check_in"]):
+            values["last_check_in"] = last_check_in
+    return counts
+
+
+async def _check_in_counts(db: AsyncSession, user_ids: List[int], now: datetime) -> Dict[int, dict]:
+    """Check-ins in the last 24 hours and 7 days, read from the (user_id, check_in_time) index"""
+    result = await db.execute(
+        select(
+            CheckIn.user_id,
+            func.count(CheckIn.id),
+            func.sum(case((CheckIn.check_in_time >= now - DAY, 1), else_=0))
+        )
+        .where(CheckIn.user_id.in_(user_ids), CheckIn.check_in_time >= now - WEEK)
+        .group_by(CheckIn.user_id)
+    )
+    counts = {user_id: {"check_ins_24h": 0, "check_ins_7d": 0} for user_id in user_ids}
+    for user_id, week, day in result.all():
+        counts[user_id] = {"check_ins_24h": int(day or 0), "check_ins_7d": week}
+    return counts
+
+
+async def _write(db: AsyncSession, user_id: int, values: dict) -> None:
+    """Overwrite a summary row, creating it if needed"""
+    result = await db.execute(update(summary).where(summary.c.user_id == user_id).values(**values))
+    if result.rowcount:
+        return
+    try:
+        async with db.begin_nested():
+            await db.execute(insert(summary).values(user_id=user_id, **values))
+    except IntegrityError:
+        # Created concurrently; the reconciler settles any difference
+        metrics.inc("activity_summary_conflicts_total")
+
+
+async def _lock(db: AsyncSession, user_ids: List[int], now: datetime) -> None:
+    """Hold users' summary rows until commit.
+
+    Taken before counting, so a concurrent ``checked_in`` increment is either
+    committed first (and counted) or waits and applies on top of the rebuild.
+    """
+    if db.bind.dialect.name == "postgresql":
+        await db.execute(
+            select(summary.c.user_id)
+            .where(summary.c.user_id.in_(user_ids))
+            .order_by(summary.c.user_id)
+            .with_for_update()
+        )
+    else:
+        # SQLite has no row locks; writing first takes the database write lock
+        await db.execute(update(summary).where(summary.c.user_id.in_(user_ids)).values(reconciled_at=now))
+
+
+async def rebuild(db: AsyncSession, user_ids: List[int], now: datetime = None) -> int:
+    """Recompute users' summaries from their switches and check-ins"""
+    if not user_ids:
+        return 0
+    now = now or datetime.utcnow()
+    await _lock(db, user_ids, now)
+    switch_counts = await _switch_counts(db, user_ids)
+    check_in_counts = await _check_in_counts(db, user_ids, now)
+    for user_id in user_ids:
+        await _write(db, user_id, {**switch_counts[user_id], **check_in_counts[user_id], "reconciled_at": now})
+    return len(user_ids)
+
+
+async def switches_changed(db: AsyncSession, user_id: int) -> None:
+    """Recount a user's switches after one was created, deleted or changed status.
+
+    Call before committing, in the transaction that made the change.
+    """
+    await _lock(db, [user_id], datetime.utcnow())
+    counts = (await _switch_counts(db, [user_id]))[user_id]
+    result = await db.execute(update(summary).where(summary.c.user_id == user_id).values(**counts))
+    if not result.rowcount:
+        await rebuild(db, [user_id])
+
+
+async def checked_in(db: AsyncSession, check_in_times: Dict[int, List[datetime]]) -> None:
+    """Count new check-ins, keyed by user, into their summaries in the caller's transaction"""
+    check_in_times = {user_id: times for user_id, times in check_in_times.items() if times}
+    if not check_in_times:
+        return
+    now = datetime.utcnow()
+    existing = set((await db.execute(
+        select(summary.c.user_id).where(summary.c.user_id.in_(list(check_in_times)))
+    )).scalars().all())
+    updates = [
+        {
+            "b_user_id": user_id,
+            "b_day": sum(1 for t in times if t >= now - DAY),
+            "b_week": sum(1 for t in times if t >= now - WEEK),
+            "b_latest": max(times),
+        }
+        for user_id, times in check_in_times.items()
+        if user_id in existing
+    ]
+    if updates:
+        latest = bindparam("b_latest", type_=summary.c.last_check_in.type)
+        conn = await db.connection()
+        await conn.execute(
+            update(summary)
+            .where(summary.c.user_id == bindparam("b_user_id"))
+            .values(
+                check_ins_24h=summary.c.check_ins_24h + bindparam("b_day"),
+                check_ins_7d=summary.c.check_ins_7d + bindparam("b_week"),
+                last_check_in=case(
+                    (summary.c.last_check_in.is_(None), latest),
+                    (summary.c.last_check_in < latest, latest),
+                    else_=summary.c.last_check_in
+                )
+            ),
+            updates
+        )
+    # First activity for these users: count their whole history once
+    await rebuild(db, [user_id for user_id in check_in_times if user_id not in existing], now)
+
+
+class ActivityReconciler:
+    """Rebuilds every summary row on a schedule.
+
+    Check-ins and switch changes keep the rows current as they happen, but
+    nothing happens when a check-in ages out of the 24 hour or 7 day window;
+    each pass recomputes those windows (and repairs any drift) for every
+    user with switches or a summary row, ``batch_size`` users per query.
+    """
+
+    def __init__(
+        self,
+        interval: float = ACTIVITY_RECONCILE_SECONDS,
+        batch_size: int = ACTIVITY_RECONCILE_BATCH_SIZE,
+        session_factory=AsyncSessionLocal
+    ):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.session_factory = session_factory
+
+    async def reconcile_once(self) -> int:
+        """Rebuild all summaries; returns the number of users reconciled"""
+        async with self.session_factory() as db:
+            users = union(select(DeadmanSwitch.user_id), select(summary.c.user_id)).subquery()
+            user_ids = (await db.execute(select(users.c.user_id).order_by(users.c.user_id))).scalars().all()
+
+        now = datetime.utcnow()
+        for start in range(0, len(user_ids), self.batch_size):
+            async with self.session_factory() as db:
+                await rebuild(db, user_ids[start:start + self.batch_size], now)
+                await db.commit()
+        metrics.inc("activity_summary_reconciled_total", len(user_ids))
+        return len(user_ids)
+
+    async def run_forever(self) -> None:
+        while True:
+            try:
+                await self.reconcile_once()
+            except Exception:
+                logger.exception("Activity summary reconcile failed")
+            await asyncio.sleep(self.interval)
+
+
+activity_reconciler = ActivityReconciler()
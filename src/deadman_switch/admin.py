@@ -2,21 +2,25 @@
 Admin Interface Module
 """
 from datetime import datetime, timedelta
-from typing import List, Optional
-from fastapi import APIRouter, Depends, Request, Form, HTTPException
-from fastapi.templating import Jinja2Templates
+from typing import List, Optional, Tuple
+from urllib.parse import urlencode
+from fastapi import APIRouter, Depends, Request, Form, HTTPException, Query
 from fastapi.responses import HTMLResponse, RedirectResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, desc
-from sqlalchemy.orm import selectinload
 from pydantic import BaseModel
 
 from .database import get_db
-from .models import User, DeadmanSwitch, CheckIn, Notification, SystemSettings, UserRole, SwitchStatus
-from .auth import get_admin_user
-
-# Templates
-templates = Jinja2Templates(directory="templates")
+from .models import User, DeadmanSwitch, CheckIn, Notification, UserRole, SwitchStatus, UserActivitySummary
+from .auth import get_admin_user, token_cache
+from . import activity, dead_letters, outbox
+from .heartbeat import heartbeat_index
+from .forecast import deadline_index
+from .loaders import view_options
+from .regularity import miss_risk
+from .settings import settings_service
+from .shards import shard_router
+from .templating import templates
 
 # Router
 router = APIRouter()
@@ -43,13 +47,135 @@ class UserStats(BaseModel):
     created_at: datetime
 
 
+class ForecastBucket(BaseModel):
+    start: datetime
+    count: int
+
+
+class DeadlineForecast(BaseModel):
+    generated_at: datetime
+    hours: int
+    bucket_minutes: int
+    total: int
+    peak: int
+    overdue: int
+    tracked: int
+    index_loaded_at: Optional[datetime]
+    buckets: List[ForecastBucket]
+
+
+class DeadLetterFilters(BaseModel):
+    error_class: Optional[str] = None
+    transport: Optional[str] = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    switch_id: Optional[int] = None
+
+    def conditions(self) -> list:
+        return dead_letters.dead_letter_conditions(**self.model_dump())
+
+    def query_string(self) -> str:
+        return urlencode({k: v for k, v in self.model_dump(mode="json").items() if v is not None})
+
+
+class DeadLetterGroup(BaseModel):
+    error_class: Optional[str]
+    transport: Optional[str]
+    count: int
+
+
+class DeadLetterItem(BaseModel):
+    id: int
+    deadman_switch_id: int
+    transport: Optional[str]
+    recipient: Optional[str]
+    subject: Optional[str]
+    error_class: Optional[str]
+    error_message: Optional[str]
+    failed_at: Optional[datetime]
+    replay_count: int
+
+
+class DeadLetterPage(BaseModel):
+    total: int
+    groups: List[DeadLetterGroup]
+    items: List[DeadLetterItem]
+
+
+class DeadLetterActionResult(BaseModel):
+    action: str
+    affected: int
+
+
 # Utility functions
-async def get_dashboard_stats(db: AsyncSession) -> DashboardStats:
-    """Get dashboard statistics"""
-    # Total users
-    total_users_result = await db.execute(select(func.count(User.id)))
-    total_users = total_users_result.scalar()
-    
+def get_dead_letter_filters(
+    error_class: Optional[str] = Query(None),
+    transport: Optional[str] = Query(None),
+    since: Optional[str] = Query(None),
+    until: Optional[str] = Query(None),
+    switch_id: Optional[str] = Query(None)
+) -> DeadLetterFilters:
+    """Filter values from the query string; empty form fields mean no filter"""
+    try:
+        return DeadLetterFilters(
+            error_class=error_class or None,
+            transport=transport or None,
+            since=since or None,
+            until=until or None,
+            switch_id=switch_id or None
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid dead-letter filter")
+
+
+async def get_dead_letter_page(db: AsyncSession, filters: DeadLetterFilters, offset: int) -> DeadLetterPage:
+    """One page of dead letters, gathered from every shard"""
+    conditions = filters.conditions()
+    counts = {}
+    for shard_groups in await shard_router.gather(lambda session: dead_letters.summarize(session, conditions), db=db):
+        for error_class, transport, count in shard_groups:
+            counts[error_class, transport] = counts.get((error_class, transport), 0) + count
+    groups = [
+        DeadLetterGroup(error_class=error_class, transport=transport, count=count)
+        for (error_class, transport), count in sorted(counts.items(), key=lambda item: item[1], reverse=True)
+    ]
+    page_size = dead_letters.DEAD_LETTER_PAGE_SIZE
+    notifications = [
+        n for shard_rows in await shard_router.gather(
+            lambda session: dead_letters.list_dead_letters(session, conditions, limit=offset + page_size), db=db
+        )
+        for n in shard_rows
+    ]
+    notifications.sort(key=lambda n: (n.failed_at is not None, n.failed_at, n.id), reverse=True)
+    notifications = notifications[offset:offset + page_size]
+    return DeadLetterPage(
+        total=sum(group.count for group in groups),
+        groups=groups,
+        items=[
+            DeadLetterItem(
+                id=n.id,
+                deadman_switch_id=n.deadman_switch_id,
+                transport=n.transport,
+                recipient=n.webhook_url if n.transport == "webhook" else n.recipient_email,
+                subject=n.subject,
+                error_class=n.error_class,
+                error_message=n.error_message,
+                failed_at=n.failed_at,
+                replay_count=n.replay_count or 0
+            )
+            for n in notifications
+        ]
+    )
+
+
+async def act_on_dead_letters(db: AsyncSession, action, filters: DeadLetterFilters) -> int:
+    """Run ``dead_letters.replay`` or ``discard`` on every shard; rows affected in total"""
+    conditions = filters.conditions()
+    return sum(await shard_router.gather(lambda session: action(session, conditions), db=db))
+
+
+async def count_shard_activity(db: AsyncSession) -> Tuple[int, int, int, int]:
+    """(active switches, triggered switches, check-ins in 24h, pending notifications) on one shard"""
     # Active switches
     active_switches_result = await db.execute(
         select(func.count(DeadmanSwitch.id)).where(
@@ -81,6 +207,20 @@ async def get_dashboard_stats(db: AsyncSession) -> DashboardStats:
         )
     )
     pending_notifications = pending_notifications_result.scalar()
+
+    return active_switches, triggered_switches, recent_check_ins, pending_notifications
+
+
+async def get_dashboard_stats(db: AsyncSession) -> DashboardStats:
+    """Get dashboard statistics; users are counted on the primary, the rest on every shard"""
+    # Total users
+    total_users_result = await db.execute(select(func.count(User.id)))
+    total_users = total_users_result.scalar()
+
+    shard_counts = await shard_router.gather(count_shard_activity, db=db)
+    active_switches, triggered_switches, recent_check_ins, pending_notifications = (
+        sum(counts) for counts in zip(*shard_counts)
+    )
     
     return DashboardStats(
         total_users=total_users,
@@ -91,6 +231,51 @@ async def get_dashboard_stats(db: AsyncSession) -> DashboardStats:
     )
 
 
+def fetch_scalars(statement):
+    """``fn(session)`` for ShardRouter.gather that returns the statement's ORM rows"""
+    async def fetch(db: AsyncSession) -> list:
+        result = await db.execute(statement)
+        return result.scalars().all()
+    return fetch
+
+
+def merge_newest(results: List[list], key: str, limit: Optional[int] = None) -> list:
+    """Merge per-shard results, newest ``key`` first"""
+    rows = [row for shard_rows in results for row in shard_rows]
+    rows.sort(key=lambda row: (getattr(row, key) is not None, getattr(row, key)), reverse=True)
+    return rows[:limit]
+
+
+async def get_switch_db(switch_id: int, db: AsyncSession = Depends(get_db)):
+    """Session on the shard holding ``switch_id``; unknown switches fall through to a 404"""
+    shard = await shard_router.locate_switch(switch_id)
+    if shard is None or shard.index == 0:
+        yield db
+        return
+    async with shard.session_factory() as session:
+        yield session
+
+
+def get_deadline_forecast(hours: int, bucket_minutes: int) -> DeadlineForecast:
+    """Histogram of upcoming trigger deadlines from the deadline index"""
+    now = datetime.utcnow().replace(second=0, microsecond=0)
+    overdue, counts = deadline_index.histogram(hours, bucket_minutes, start=now)
+    return DeadlineForecast(
+        generated_at=now,
+        hours=hours,
+        bucket_minutes=bucket_minutes,
+        total=sum(counts),
+        peak=max(counts, default=0),
+        overdue=overdue,
+        tracked=len(deadline_index),
+        index_loaded_at=deadline_index.loaded_at,
+        buckets=[
+            ForecastBucket(start=now + timedelta(minutes=i * bucket_minutes), count=count)
+            for i, count in enumerate(counts)
+        ]
+    )
+
+
 # Routes
 @router.get("/dashboard", response_class=HTMLResponse)
 async def admin_dashboard(
@@ -102,23 +287,21 @@ async def admin_dashboard(
     stats = await get_dashboard_stats(db)
     
     # Recent triggered switches
-    triggered_switches_result = await db.execute(
+    triggered_switches = merge_newest(await shard_router.gather(fetch_scalars(
         select(DeadmanSwitch)
-        .options(selectinload(DeadmanSwitch.user))
+        .options(*view_options("admin.dashboard.triggered_switches"))
         .where(DeadmanSwitch.status == SwitchStatus.TRIGGERED)
         .order_by(desc(DeadmanSwitch.updated_at))
         .limit(10)
-    )
-    triggered_switches = triggered_switches_result.scalars().all()
+    ), db=db), "updated_at", 10)
 
     # Recent check-ins
-    recent_check_ins_result = await db.execute(
+    recent_check_ins = merge_newest(await shard_router.gather(fetch_scalars(
         select(CheckIn)
-        .options(selectinload(CheckIn.user), selectinload(CheckIn.deadman_switch))
+        .options(*view_options("admin.dashboard.recent_check_ins"))
         .order_by(desc(CheckIn.check_in_time))
         .limit(10)
-    )
-    recent_check_ins = recent_check_ins_result.scalars().all()
+    ), db=db), "check_in_time", 10)
     
     return templates.TemplateResponse(
         "admin/dashboard.html",
@@ -145,24 +328,21 @@ async def admin_users(
         .order_by(desc(User.created_at))
     )
     users = users_result.scalars().all()
+
+    # Switch counts and last check-ins come from the activity summaries on the users' shards
+    switch_counts, last_check_ins = {}, {}
+    for summaries in await shard_router.gather(fetch_scalars(select(UserActivitySummary)), db=db):
+        for summary in summaries:
+            switch_counts[summary.user_id] = switch_counts.get(summary.user_id, 0) + summary.switch_count
+            last_check_in = summary.last_check_in
+            if last_check_in is not None and (summary.user_id not in last_check_ins or last_check_in > last_check_ins[summary.user_id]):
+                last_check_ins[summary.user_id] = last_check_in
     
     # Get additional stats for each user
     user_stats = []
     for user in users:
-        # Count switches
-        switch_count_result = await db.execute(
-            select(func.count(DeadmanSwitch.id)).where(DeadmanSwitch.user_id == user.id)
-        )
-        switch_count = switch_count_result.scalar()
-        
-        # Last check-in
-        last_check_in_result = await db.execute(
-            select(CheckIn.check_in_time)
-            .where(CheckIn.user_id == user.id)
-            .order_by(desc(CheckIn.check_in_time))
-            .limit(1)
-        )
-        last_check_in = last_check_in_result.scalar()
+        switch_count = switch_counts.get(user.id, 0)
+        last_check_in = last_check_ins.get(user.id)
         
         user_stats.append(UserStats(
             id=user.id,
@@ -193,22 +373,56 @@ async def admin_switches(
     db: AsyncSession = Depends(get_db)
 ):
     """Admin switches management"""
-    switches_result = await db.execute(
+    switches = merge_newest(await shard_router.gather(fetch_scalars(
         select(DeadmanSwitch)
+        .options(*view_options("admin.switches"))
         .order_by(desc(DeadmanSwitch.created_at))
-    )
-    switches = switches_result.scalars().all()
+    ), db=db), "created_at")
+    now = datetime.utcnow()
+    miss_risks = {
+        switch.id: miss_risk(switch, switch.next_check_in_due, now)
+        for switch in switches
+    }
     
     return templates.TemplateResponse(
         "admin/switches.html",
         {
             "request": request,
             "user": admin_user,
-            "switches": switches
+            "switches": switches,
+            "miss_risks": miss_risks
         }
     )
 
 
+@router.get("/forecast", response_class=HTMLResponse)
+async def admin_forecast(
+    request: Request,
+    hours: int = Query(48, ge=1, le=720),
+    bucket_minutes: int = Query(60, ge=1, le=1440),
+    admin_user: User = Depends(get_admin_user)
+):
+    """Upcoming trigger deadlines, for pre-scaling notification workers"""
+    return templates.TemplateResponse(
+        "admin/forecast.html",
+        {
+            "request": request,
+            "user": admin_user,
+            "forecast": get_deadline_forecast(hours, bucket_minutes)
+        }
+    )
+
+
+@router.get("/api/forecast", response_model=DeadlineForecast)
+async def admin_forecast_api(
+    hours: int = Query(48, ge=1, le=720),
+    bucket_minutes: int = Query(60, ge=1, le=1440),
+    admin_user: User = Depends(get_admin_user)
+):
+    """Upcoming trigger deadlines as JSON"""
+    return get_deadline_forecast(hours, bucket_minutes)
+
+
 @router.get("/notifications", response_class=HTMLResponse)
 async def admin_notifications(
     request: Request,
@@ -218,6 +432,7 @@ async def admin_notifications(
     """Admin notifications management"""
     notifications_result = await db.execute(
         select(Notification)
+        .options(*view_options("admin.notifications"))
         .order_by(desc(Notification.created_at))
         .limit(100)
     )
@@ -233,26 +448,83 @@ async def admin_notifications(
     )
 
 
-@router.get("/settings", response_class=HTMLResponse)
-async def admin_settings(
+@router.get("/dead-letters", response_class=HTMLResponse)
+async def admin_dead_letters(
     request: Request,
+    offset: int = Query(0, ge=0),
+    filters: DeadLetterFilters = Depends(get_dead_letter_filters),
     admin_user: User = Depends(get_admin_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Admin system settings"""
-    settings_result = await db.execute(select(SystemSettings))
-    settings = settings_result.scalars().all()
-    
+    """Failed notifications, grouped by error class and transport"""
     return templates.TemplateResponse(
-        "admin/settings.html",
+        "admin/dead_letters.html",
         {
             "request": request,
             "user": admin_user,
-            "settings": settings
+            "filters": filters,
+            "query": filters.query_string(),
+            "offset": offset,
+            "page_size": dead_letters.DEAD_LETTER_PAGE_SIZE,
+            "replay_rate": dead_letters.DEAD_LETTER_REPLAY_RATE_PER_SECOND,
+            "page": await get_dead_letter_page(db, filters, offset)
         }
     )
 
 
+@router.post("/dead-letters/replay")
+async def replay_dead_letters(
+    filters: DeadLetterFilters = Depends(get_dead_letter_filters),
+    admin_user: User = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Re-enqueue every dead letter matching the filters"""
+    await act_on_dead_letters(db, dead_letters.replay, filters)
+    return RedirectResponse(url=f"/admin/dead-letters?{filters.query_string()}", status_code=302)
+
+
+@router.post("/dead-letters/discard")
+async def discard_dead_letters(
+    filters: DeadLetterFilters = Depends(get_dead_letter_filters),
+    admin_user: User = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Drop every dead letter matching the filters"""
+    await act_on_dead_letters(db, dead_letters.discard, filters)
+    return RedirectResponse(url=f"/admin/dead-letters?{filters.query_string()}", status_code=302)
+
+
+@router.get("/api/dead-letters", response_model=DeadLetterPage)
+async def admin_dead_letters_api(
+    offset: int = Query(0, ge=0),
+    filters: DeadLetterFilters = Depends(get_dead_letter_filters),
+    admin_user: User = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Failed notifications as JSON"""
+    return await get_dead_letter_page(db, filters, offset)
+
+
+@router.post("/api/dead-letters/replay", response_model=DeadLetterActionResult)
+async def admin_replay_dead_letters_api(
+    filters: DeadLetterFilters = Depends(get_dead_letter_filters),
+    admin_user: User = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Re-enqueue matching dead letters; returns how many were queued"""
+    return DeadLetterActionResult(action="replay", affected=await act_on_dead_letters(db, dead_letters.replay, filters))
+
+
+@router.post("/api/dead-letters/discard", response_model=DeadLetterActionResult)
+async def admin_discard_dead_letters_api(
+    filters: DeadLetterFilters = Depends(get_dead_letter_filters),
+    admin_user: User = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Drop matching dead letters; returns how many were discarded"""
+    return DeadLetterActionResult(action="discard", affected=await act_on_dead_letters(db, dead_letters.discard, filters))
+
+
 @router.post("/users/{user_id}/toggle-active")
 async def toggle_user_active(
     user_id: int,
@@ -268,6 +540,10 @@ async def toggle_user_active(
     
     user.is_active = not user.is_active
     await db.commit()
+
+    if not user.is_active:
+        # Cached claims would otherwise keep the user's tokens valid
+        token_cache.forget_user(user.username)
     
     return RedirectResponse(url="/admin/users", status_code=302)
 
@@ -276,7 +552,7 @@ async def toggle_user_active(
 async def toggle_switch_enabled(
     switch_id: int,
     admin_user: User = Depends(get_admin_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_switch_db)
 ):
     """Toggle switch enabled status"""
     switch_result = await db.execute(select(DeadmanSwitch).where(DeadmanSwitch.id == switch_id))
@@ -289,9 +565,16 @@ async def toggle_switch_enabled(
     if not switch.is_enabled:
         switch.status = SwitchStatus.DISABLED
     else:
+        # A re-enabled switch gets a full interval from now
         switch.status = SwitchStatus.ACTIVE
+        switch.next_check_in_due = datetime.utcnow() + switch.check_in_interval
+        switch.triggered_at = None
+    outbox.add_event(db, outbox.SWITCH_ENABLED if switch.is_enabled else outbox.SWITCH_DISABLED, switch_id)
+    await activity.switches_changed(db, switch.user_id)
     
     await db.commit()
+    heartbeat_index.invalidate(switch_id)
+    deadline_index.track(switch)
 
     return RedirectResponse(url="/admin/switches", status_code=302)
 
@@ -300,7 +583,7 @@ async def toggle_switch_enabled(
 async def delete_switch_admin(
     switch_id: int,
     admin_user: User = Depends(get_admin_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_switch_db)
 ):
     """Delete a switch (admin only)"""
     # Get switch
@@ -316,7 +599,11 @@ async def delete_switch_admin(
     await db.execute(
         DeadmanSwitch.__table__.delete().where(DeadmanSwitch.id == switch_id)
     )
+    outbox.add_event(db, outbox.SWITCH_DELETED, switch_id)
+    await activity.switches_changed(db, switch.user_id)
     await db.commit()
+    heartbeat_index.invalidate(switch_id)
+    deadline_index.discard(switch_id)
 
     return RedirectResponse(url="/admin/switches", status_code=302)
 
@@ -324,22 +611,16 @@ async def delete_switch_admin(
 @router.get("/settings", response_class=HTMLResponse)
 async def admin_settings(
     request: Request,
-    admin_user: User = Depends(get_admin_user),
-    db: AsyncSession = Depends(get_db)
+    admin_user: User = Depends(get_admin_user)
 ):
     """Admin settings page"""
-    # Get system settings
-    settings_result = await db.execute(
-        select(SystemSettings).order_by(SystemSettings.key)
-    )
-    settings = settings_result.scalars().all()
-
     return templates.TemplateResponse(
         "admin/settings.html",
         {
             "request": request,
             "user": admin_user,
-            "settings": settings
+            "settings": settings_service.items(),
+            "values": dict(settings_service.items())
         }
     )
 
@@ -347,34 +628,14 @@ async def admin_settings(
 @router.post("/settings/update")
 async def update_settings(
     request: Request,
-    admin_user: User = Depends(get_admin_user),
-    db: AsyncSession = Depends(get_db)
+    admin_user: User = Depends(get_admin_user)
 ):
     """Update system settings"""
     form = await request.form()
-    
-    for key, value in form.items():
-        if key.startswith("setting_"):
-            setting_key = key.replace("setting_", "")
-            
-            # Check if setting exists
-            setting_result = await db.execute(
-                select(SystemSettings).where(SystemSettings.key == setting_key)
-            )
-            setting = setting_result.scalar_one_or_none()
-            
-            if setting:
-                setting.value = value
-                setting.updated_at = datetime.utcnow()
-            else:
-                # Create new setting
-                new_setting = SystemSettings(
-                    key=setting_key,
-                    value=value,
-                    description=f"Setting for {setting_key}"
-                )
-                db.add(new_setting)
-    
-    await db.commit()
-    
+    await settings_service.update({
+        key[len("setting_"):]: value
+        for key, value in form.items()
+        if key.startswith("setting_")
+    })
+
     return RedirectResponse(url="/admin/settings", status_code=302)
@@ -1,19 +1,31 @@
 """
 API Module for Mobile App Integration
 """
-from datetime import datetime, timedelta
+import hashlib
+import hmac
+import secrets
+from datetime import datetime, timedelta, timezone
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Header, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc
+from sqlalchemy import select, desc, update
+from sqlalchemy.exc import IntegrityError
 from pydantic import BaseModel
 
-from .database import get_db
-from .models import User, DeadmanSwitch, CheckIn, EmergencyContact, SwitchStatus
-from .auth import get_current_active_user
+from . import activity, idempotency, outbox
+from .models import User, DeadmanSwitch, CheckIn, Device, EmergencyContact, SwitchStatus
+from .auth import get_current_active_user, get_user_db
+from .checkins import check_in_buffer, record_check_in, record_check_in_batch, use_write_behind
+from .heartbeat import HeartbeatTarget, generate_heartbeat_token, heartbeat_index, heartbeat_packet_key
+from .forecast import deadline_index
+from .serialization import (
+    CHECK_IN_COLUMNS, CONTACT_COLUMNS, SWITCH_COLUMNS, FastJSONResponse,
+    check_in_to_dict, contact_to_dict, switch_to_dict
+)
+from .webhooks import is_valid_webhook_url
 
 # Router
-router = APIRouter()
+router = APIRouter(default_response_class=FastJSONResponse)
 
 
 # Pydantic models for API
@@ -29,13 +41,14 @@ class SwitchResponse(BaseModel):
     next_check_in_due: Optional[datetime]
     created_at: datetime
     is_overdue: bool
+    miss_risk: Optional[float] = None  # 0-1 chance the pending check-in is missed; None until enough history
 
     class Config:
         from_attributes = True
 
 
 class CheckInResponse(BaseModel):
-    id: int
+    id: Optional[int]  # None while the check-in is still in the write-behind buffer
     check_in_time: datetime
     notes: Optional[str]
     location: Optional[str]
@@ -51,16 +64,60 @@ class EmergencyContactResponse(BaseModel):
     phone: Optional[str]
     contact_relationship: Optional[str]
     priority: int
+    webhook_url: Optional[str] = None
 
     class Config:
         from_attributes = True
 
 
+class HeartbeatTokenResponse(BaseModel):
+    token: str
+    heartbeat_url: str
+    packet_key: str  # HMAC key for raw UDP/TCP heartbeat packets
+
+
+class DeviceCreate(BaseModel):
+    name: str
+
+
+class DeviceResponse(BaseModel):
+    id: int
+    name: str
+    secret: Optional[str] = None  # only returned when the device is registered
+    last_sequence: int
+
+
+class OfflineCheckIn(BaseModel):
+    switch_id: int
+    sequence: int
+    check_in_time: datetime
+    notes: Optional[str] = None
+    location: Optional[str] = None
+    signature: str
+
+
+class SyncRequest(BaseModel):
+    check_ins: List[OfflineCheckIn]
+
+
+class SyncRejection(BaseModel):
+    sequence: int
+    reason: str
+
+
+class SyncResponse(BaseModel):
+    accepted: List[int]
+    rejected: List[SyncRejection]
+    last_sequence: int
+
+
 class SwitchCreate(BaseModel):
     name: str
     description: Optional[str] = None
     check_in_interval_hours: int = 24
     grace_period_hours: int = 2
+    escalation_delay_minutes: int = 60
+    webhook_url: Optional[str] = None
 
 
 class CheckInCreate(BaseModel):
@@ -74,6 +131,7 @@ class EmergencyContactCreate(BaseModel):
     phone: Optional[str] = None
     contact_relationship: Optional[str] = None
     priority: int = 1
+    webhook_url: Optional[str] = None
 
 
 # Utility functions
@@ -98,86 +156,104 @@ async def calculate_switch_status(switch: DeadmanSwitch) -> dict:
     }
 
 
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+
+def offline_check_in_time(item: OfflineCheckIn) -> datetime:
+    """The check-in time as naive UTC; times without an offset are taken as UTC"""
+    if item.check_in_time.tzinfo is None:
+        return item.check_in_time
+    return item.check_in_time.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def offline_check_in_signature(secret: str, device_id: int, item: OfflineCheckIn) -> str:
+    """HMAC-SHA256 a device computes over each queued check-in"""
+    message = ":".join([
+        str(device_id),
+        str(item.sequence),
+        str(item.switch_id),
+        offline_check_in_time(item).isoformat(),
+        item.notes or "",
+        item.location or "",
+    ])
+    return hmac.new(secret.encode(), message.encode(), hashlib.sha256).hexdigest()
+
+
+async def _commit_idempotent(db: AsyncSession, key_hash: Optional[str], response: BaseModel):
+    """Commit a write together with its idempotency record"""
+    if key_hash is None:
+        await db.commit()
+        return response
+
+    body = idempotency.record(db, key_hash, response)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # A concurrent retry with the same key won the race; discard our write
+        await db.rollback()
+        stored = await idempotency.lookup(db, key_hash)
+        if stored is None:
+            raise
+        return stored
+    await idempotency.remember(key_hash, body)
+    return response
+
+
 # API Routes
 @router.get("/switches", response_model=List[SwitchResponse])
 async def get_switches(
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Get all switches for current user"""
+    # Column tuples straight to JSON: no ORM identity map, no response_model re-validation
     switches_result = await db.execute(
-        select(DeadmanSwitch)
+        select(*SWITCH_COLUMNS)
         .where(DeadmanSwitch.user_id == current_user.id)
         .order_by(desc(DeadmanSwitch.created_at))
     )
-    switches = switches_result.scalars().all()
-    
-    # Add calculated fields
-    switch_responses = []
-    for switch in switches:
-        status_info = await calculate_switch_status(switch)
-        
-        switch_response = SwitchResponse(
-            id=switch.id,
-            name=switch.name,
-            description=switch.description,
-            check_in_interval_hours=int(switch.check_in_interval.total_seconds() // 3600),
-            grace_period_hours=int(switch.grace_period.total_seconds() // 3600),
-            status=switch.status,
-            is_enabled=switch.is_enabled,
-            last_check_in=switch.last_check_in,
-            next_check_in_due=status_info["next_check_in_due"],
-            created_at=switch.created_at,
-            is_overdue=status_info["is_overdue"]
-        )
-        switch_responses.append(switch_response)
-    
-    return switch_responses
+    now = datetime.utcnow()
+    return FastJSONResponse([switch_to_dict(row, now) for row in switches_result])
 
 
 @router.get("/switches/{switch_id}", response_model=SwitchResponse)
 async def get_switch(
     switch_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Get specific switch"""
     switch_result = await db.execute(
-        select(DeadmanSwitch)
+        select(*SWITCH_COLUMNS)
         .where(
             DeadmanSwitch.id == switch_id,
             DeadmanSwitch.user_id == current_user.id
         )
     )
-    switch = switch_result.scalar_one_or_none()
+    switch = switch_result.first()
     
     if not switch:
         raise HTTPException(status_code=404, detail="Switch not found")
     
-    status_info = await calculate_switch_status(switch)
-    
-    return SwitchResponse(
-        id=switch.id,
-        name=switch.name,
-        description=switch.description,
-        check_in_interval_hours=int(switch.check_in_interval.total_seconds() // 3600),
-        grace_period_hours=int(switch.grace_period.total_seconds() // 3600),
-        status=switch.status,
-        is_enabled=switch.is_enabled,
-        last_check_in=switch.last_check_in,
-        next_check_in_due=status_info["next_check_in_due"],
-        created_at=switch.created_at,
-        is_overdue=status_info["is_overdue"]
-    )
+    return FastJSONResponse(switch_to_dict(switch, datetime.utcnow()))
 
 
 @router.post("/switches", response_model=SwitchResponse)
 async def create_switch(
+    request: Request,
     switch_data: SwitchCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Create a new deadman switch"""
+    key_hash = None
+    if idempotency_key:
+        key_hash = idempotency.scoped_key(request, current_user.id, idempotency_key)
+        stored = await idempotency.lookup(db, key_hash)
+        if stored is not None:
+            return stored
+
     # Validation
     if switch_data.check_in_interval_hours < 1:
         raise HTTPException(
@@ -190,6 +266,18 @@ async def create_switch(
             status_code=400,
             detail="Grace period cannot be negative"
         )
+
+    if switch_data.escalation_delay_minutes < 0:
+        raise HTTPException(
+            status_code=400,
+            detail="Escalation delay cannot be negative"
+        )
+
+    if switch_data.webhook_url and not await is_valid_webhook_url(switch_data.webhook_url):
+        raise HTTPException(
+            status_code=400,
+            detail="Webhook URL must be a public http(s) URL"
+        )
     
     # Create switch
     switch = DeadmanSwitch(
@@ -198,18 +286,20 @@ async def create_switch(
         description=switch_data.description,
         check_in_interval=timedelta(hours=switch_data.check_in_interval_hours),
         grace_period=timedelta(hours=switch_data.grace_period_hours),
+        escalation_delay=timedelta(minutes=switch_data.escalation_delay_minutes),
+        webhook_url=switch_data.webhook_url,
         status=SwitchStatus.ACTIVE,
         is_enabled=True,
         next_check_in_due=datetime.utcnow() + timedelta(hours=switch_data.check_in_interval_hours)
     )
     
     db.add(switch)
-    await db.commit()
+    await db.flush()
     await db.refresh(switch)
     
     status_info = await calculate_switch_status(switch)
     
-    return SwitchResponse(
+    response = SwitchResponse(
         id=switch.id,
         name=switch.name,
         description=switch.description,
@@ -222,16 +312,32 @@ async def create_switch(
         created_at=switch.created_at,
         is_overdue=status_info["is_overdue"]
     )
+    outbox.add_event(db, outbox.SWITCH_CREATED, switch.id, user_id=current_user.id)
+    await activity.switches_changed(db, current_user.id)
+    committed = await _commit_idempotent(db, key_hash, response)
+    if committed is response:
+        # Not when a concurrent retry with the same key created the switch instead
+        deadline_index.track(switch)
+    return committed
 
 
 @router.post("/switches/{switch_id}/check-in", response_model=CheckInResponse)
 async def check_in(
+    request: Request,
     switch_id: int,
     check_in_data: CheckInCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Perform check-in for a switch"""
+    key_hash = None
+    if idempotency_key:
+        key_hash = idempotency.scoped_key(request, current_user.id, idempotency_key)
+        stored = await idempotency.lookup(db, key_hash)
+        if stored is not None:
+            return stored
+
     switch_result = await db.execute(
         select(DeadmanSwitch)
         .where(
@@ -247,32 +353,37 @@ async def check_in(
     if not switch.is_enabled:
         raise HTTPException(status_code=400, detail="Switch is disabled")
     
-    # Create check-in record
-    check_in_record = CheckIn(
-        user_id=current_user.id,
-        deadman_switch_id=switch_id,
-        check_in_time=datetime.utcnow(),
+    if use_write_behind():
+        check_in_time = await check_in_buffer.submit(
+            switch,
+            current_user.id,
+            notes=check_in_data.notes,
+            location=check_in_data.location
+        )
+        response = CheckInResponse(
+            id=None,
+            check_in_time=check_in_time,
+            notes=check_in_data.notes,
+            location=check_in_data.location
+        )
+        return await _commit_idempotent(db, key_hash, response)
+    
+    check_in_record = await record_check_in(
+        db,
+        switch,
+        current_user.id,
         notes=check_in_data.notes,
         location=check_in_data.location
     )
+    await db.flush()
     
-    # Update switch
-    switch.last_check_in = datetime.utcnow()
-    switch.next_check_in_due = datetime.utcnow() + switch.check_in_interval
-    if switch.status == SwitchStatus.TRIGGERED:
-        switch.status = SwitchStatus.ACTIVE
-        switch.triggered_at = None
-    
-    db.add(check_in_record)
-    await db.commit()
-    await db.refresh(check_in_record)
-    
-    return CheckInResponse(
+    response = CheckInResponse(
         id=check_in_record.id,
         check_in_time=check_in_record.check_in_time,
         notes=check_in_record.notes,
         location=check_in_record.location
     )
+    return await _commit_idempotent(db, key_hash, response)
 
 
 @router.get("/switches/{switch_id}/check-ins", response_model=List[CheckInResponse])
@@ -280,79 +391,55 @@ async def get_check_ins(
     switch_id: int,
     limit: int = 20,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Get check-in history for a switch"""
     # Verify switch ownership
     switch_result = await db.execute(
-        select(DeadmanSwitch)
+        select(DeadmanSwitch.id)
         .where(
             DeadmanSwitch.id == switch_id,
             DeadmanSwitch.user_id == current_user.id
         )
     )
-    switch = switch_result.scalar_one_or_none()
     
-    if not switch:
+    if switch_result.scalar_one_or_none() is None:
         raise HTTPException(status_code=404, detail="Switch not found")
     
     check_ins_result = await db.execute(
-        select(CheckIn)
+        select(*CHECK_IN_COLUMNS)
         .where(CheckIn.deadman_switch_id == switch_id)
         .order_by(desc(CheckIn.check_in_time))
         .limit(limit)
     )
-    check_ins = check_ins_result.scalars().all()
-    
-    return [
-        CheckInResponse(
-            id=check_in.id,
-            check_in_time=check_in.check_in_time,
-            notes=check_in.notes,
-            location=check_in.location
-        )
-        for check_in in check_ins
-    ]
+    return FastJSONResponse([check_in_to_dict(row) for row in check_ins_result])
 
 
 @router.get("/switches/{switch_id}/contacts", response_model=List[EmergencyContactResponse])
 async def get_emergency_contacts(
     switch_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Get emergency contacts for a switch"""
     # Verify switch ownership
     switch_result = await db.execute(
-        select(DeadmanSwitch)
+        select(DeadmanSwitch.id)
         .where(
             DeadmanSwitch.id == switch_id,
             DeadmanSwitch.user_id == current_user.id
         )
     )
-    switch = switch_result.scalar_one_or_none()
     
-    if not switch:
+    if switch_result.scalar_one_or_none() is None:
         raise HTTPException(status_code=404, detail="Switch not found")
     
     contacts_result = await db.execute(
-        select(EmergencyContact)
+        select(*CONTACT_COLUMNS)
         .where(EmergencyContact.deadman_switch_id == switch_id)
         .order_by(EmergencyContact.priority)
     )
-    contacts = contacts_result.scalars().all()
-    
-    return [
-        EmergencyContactResponse(
-            id=contact.id,
-            name=contact.name,
-            email=contact.email,
-            phone=contact.phone,
-            contact_relationship=contact.contact_relationship,
-            priority=contact.priority
-        )
-        for contact in contacts
-    ]
+    return FastJSONResponse([contact_to_dict(row) for row in contacts_result])
 
 
 @router.post("/switches/{switch_id}/contacts", response_model=EmergencyContactResponse)
@@ -360,7 +447,7 @@ async def add_emergency_contact(
     switch_id: int,
     contact_data: EmergencyContactCreate,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Add emergency contact to switch"""
     # Verify switch ownership
@@ -375,6 +462,9 @@ async def add_emergency_contact(
     
     if not switch:
         raise HTTPException(status_code=404, detail="Switch not found")
+
+    if contact_data.webhook_url and not await is_valid_webhook_url(contact_data.webhook_url):
+        raise HTTPException(status_code=400, detail="Webhook URL must be a public http(s) URL")
     
     contact = EmergencyContact(
         deadman_switch_id=switch_id,
@@ -382,7 +472,8 @@ async def add_emergency_contact(
         email=contact_data.email,
         phone=contact_data.phone,
         contact_relationship=contact_data.contact_relationship,
-        priority=contact_data.priority
+        priority=contact_data.priority,
+        webhook_url=contact_data.webhook_url
     )
     
     db.add(contact)
@@ -395,5 +486,147 @@ async def add_emergency_contact(
         email=contact.email,
         phone=contact.phone,
         contact_relationship=contact.contact_relationship,
-        priority=contact.priority
+        priority=contact.priority,
+        webhook_url=contact.webhook_url
+    )
+
+
+@router.post("/switches/{switch_id}/heartbeat-token", response_model=HeartbeatTokenResponse)
+async def rotate_heartbeat_token(
+    switch_id: int,
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_user_db)
+):
+    """Issue a new agent heartbeat token for a switch, replacing any previous one"""
+    switch_result = await db.execute(
+        select(DeadmanSwitch)
+        .where(
+            DeadmanSwitch.id == switch_id,
+            DeadmanSwitch.user_id == current_user.id
+        )
+    )
+    switch = switch_result.scalar_one_or_none()
+    
+    if not switch:
+        raise HTTPException(status_code=404, detail="Switch not found")
+    
+    # Only the hash is stored; the token is shown once
+    token, token_hash = generate_heartbeat_token()
+    switch.heartbeat_token_hash = token_hash
+    await db.commit()
+    heartbeat_index.store(token_hash, HeartbeatTarget(switch.id, switch.user_id, bool(switch.is_enabled)))
+    
+    return HeartbeatTokenResponse(
+        token=token,
+        heartbeat_url=str(request.url_for("heartbeat", switch_token=token)),
+        packet_key=heartbeat_packet_key(token_hash)
+    )
+
+
+@router.post("/devices", response_model=DeviceResponse)
+async def register_device(
+    device_data: DeviceCreate,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_user_db)
+):
+    """Register a device for offline check-in sync; the secret is shown once"""
+    device = Device(
+        user_id=current_user.id,
+        name=device_data.name,
+        secret=secrets.token_hex(32),
+        last_sequence=0
+    )
+    
+    db.add(device)
+    await db.commit()
+    await db.refresh(device)
+    
+    return DeviceResponse(
+        id=device.id,
+        name=device.name,
+        secret=device.secret,
+        last_sequence=device.last_sequence
+    )
+
+
+@router.post("/devices/{device_id}/sync", response_model=SyncResponse)
+async def sync_offline_check_ins(
+    device_id: int,
+    sync_data: SyncRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_user_db)
+):
+    """Accept a batch of device-signed check-ins queued while offline"""
+    device_result = await db.execute(
+        select(Device)
+        .where(
+            Device.id == device_id,
+            Device.user_id == current_user.id
+        )
+    )
+    device = device_result.scalar_one_or_none()
+    
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+    
+    # One query for every switch referenced by the batch
+    switch_ids = {item.switch_id for item in sync_data.check_ins}
+    switches_result = await db.execute(
+        select(DeadmanSwitch)
+        .where(
+            DeadmanSwitch.id.in_(switch_ids),
+            DeadmanSwitch.user_id == current_user.id
+        )
+    )
+    switches = {switch.id: switch for switch in switches_result.scalars().all()}
+    
+    now = datetime.utcnow()
+    last_sequence = device.last_sequence
+    accepted = []
+    rejected = []
+    for item in sorted(sync_data.check_ins, key=lambda i: i.sequence):
+        check_in_time = offline_check_in_time(item)
+        expected = offline_check_in_signature(device.secret, device.id, item)
+        if not hmac.compare_digest(expected, item.signature):
+            reason = "invalid signature"
+        elif item.sequence <= last_sequence:
+            reason = "sequence already used"
+        elif item.switch_id not in switches:
+            reason = "switch not found"
+        elif not switches[item.switch_id].is_enabled:
+            reason = "switch is disabled"
+        elif check_in_time > now + MAX_CLOCK_SKEW:
+            reason = "check-in time is in the future"
+        else:
+            last_sequence = item.sequence
+            accepted.append({
+                "switch_id": item.switch_id,
+                "check_in_time": check_in_time,
+                "notes": item.notes,
+                "location": item.location,
+                "sequence": item.sequence,
+            })
+            continue
+        rejected.append(SyncRejection(sequence=item.sequence, reason=reason))
+    
+    # Advance the sequence only from the value this batch was checked
+    # against; a concurrent sync of the same device that got there first
+    # leaves no row to update
+    result = await db.execute(
+        update(Device)
+        .where(Device.id == device.id, Device.last_sequence == device.last_sequence)
+        .values(last_sequence=last_sequence, last_sync_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Another sync for this device is in progress; retry")
+    await record_check_in_batch(db, switches, current_user.id, accepted)
+    await db.commit()
+    
+    return SyncResponse(
+        accepted=[item["sequence"] for item in accepted],
+        rejected=rejected,
+        last_sequence=last_sequence
     )
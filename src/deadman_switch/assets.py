@@ -0,0 +1,145 @@
+"""
+Static Asset Pipeline (content-hashed, precompressed files)
+"""
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from .compression import accepted_encodings, brotli, compress
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+STATIC_DIR = os.getenv("STATIC_DIR", "static")
+STATIC_CACHE_CONTROL = os.getenv("STATIC_CACHE_CONTROL", "public, max-age=300")  # unhashed files
+
+STATIC_URL_PREFIX = "/static"
+DIST_DIR = "dist"  # build output, relative to STATIC_DIR
+MANIFEST_FILE = "manifest.json"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+PRECOMPRESS_SUFFIXES = {".css", ".js", ".svg", ".json", ".txt", ".html", ".map", ".xml"}
+
+# Precompressed variants, in order of preference
+VARIANTS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def hashed_name(path: Path, data: bytes) -> str:
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    return f"{path.stem}.{digest}{path.suffix}"
+
+
+def build(static_dir: str = STATIC_DIR) -> Dict[str, str]:
+    """Copy every source asset into ``dist`` under a content-hashed name.
+
+    Text assets also get ``.gz`` (and ``.br`` when brotli is installed)
+    siblings compressed at the highest level. Returns the manifest mapping
+    source paths to hashed paths, which is also written to
+    ``dist/manifest.json``.
+    """
+    root = Path(static_dir)
+    dist = root / DIST_DIR
+    if dist.exists():
+        shutil.rmtree(dist)
+
+    manifest = {}
+    for source in sorted(root.rglob("*")):
+        if not source.is_file() or dist in source.parents:
+            continue
+        relative = source.relative_to(root)
+        data = source.read_bytes()
+        target = dist / relative.parent / hashed_name(relative, data)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(data)
+
+        if source.suffix in PRECOMPRESS_SUFFIXES:
+            for encoding, suffix in VARIANTS:
+                if encoding == "br" and brotli is None:
+                    continue
+                compressed = compress(data, encoding, level=11 if encoding == "br" else 9)
+                if len(compressed) < len(data):
+                    target.with_name(target.name + suffix).write_bytes(compressed)
+
+        manifest[relative.as_posix()] = target.relative_to(root).as_posix()
+
+    dist.mkdir(parents=True, exist_ok=True)
+    (dist / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    return manifest
+
+
+class AssetManifest:
+    """Maps source asset paths to their hashed build output"""
+
+    def __init__(self, static_dir: str = STATIC_DIR):
+        self.path = Path(static_dir) / DIST_DIR / MANIFEST_FILE
+        self._entries: Optional[Dict[str, str]] = None
+
+    def load(self) -> int:
+        try:
+            self._entries = json.loads(self.path.read_text())
+        except FileNotFoundError:
+            # Not built (development): serve the source files
+            self._entries = {}
+        return len(self._entries)
+
+    def url(self, path: str) -> str:
+        if self._entries is None:
+            self.load()
+        path = path.lstrip("/")
+        return f"{STATIC_URL_PREFIX}/{self._entries.get(path, path)}"
+
+
+asset_manifest = AssetManifest()
+
+
+def static_url(path: str) -> str:
+    """URL of a static asset; the hashed, cacheable copy once the assets are built"""
+    return asset_manifest.url(path)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that serves ``.br``/``.gz`` siblings when the client accepts them.
+
+    Files under ``dist`` have content-hashed names and are served with
+    immutable, year-long cache headers; everything else gets
+    ``STATIC_CACHE_CONTROL``.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._dist = os.path.realpath(os.path.join(self.directory, DIST_DIR)) if self.directory else None
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+        media_type = mimetypes.guess_type(str(full_path))[0] or "text/plain"
+
+        path, encoding, has_variants = full_path, None, False
+        for coding, suffix in VARIANTS:
+            try:
+                variant_stat = os.stat(f"{full_path}{suffix}")
+            except FileNotFoundError:
+                continue
+            has_variants = True
+            if encoding is None and coding in accepted:
+                path, stat_result, encoding = f"{full_path}{suffix}", variant_stat, coding
+
+        response = FileResponse(path, status_code=status_code, stat_result=stat_result, media_type=media_type)
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        if has_variants:
+            response.headers["Vary"] = "Accept-Encoding"
+        immutable = self._dist is not None and os.path.commonpath([os.path.realpath(full_path), self._dist]) == self._dist
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL if immutable else STATIC_CACHE_CONTROL
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
@@ -1,35 +1,132 @@
 """
 Authentication and Authorization Module
 """
+import hashlib
+import heapq
+import logging
 import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Form
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse, RedirectResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from passlib.context import CryptContext
-from jose import JWTError, jwt
 from pydantic import BaseModel, EmailStr
 
+from .cache import CACHE_BACKEND, create_cache
 from .database import get_db
-from .models import User, UserRole
+from .models import User, UserActivitySummary, UserRole
+from .shards import shard_router
+from .templating import templates
+
+logger = logging.getLogger(__name__)
 
 # Configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+TOKEN_DENYLIST_SIZE = int(os.getenv("TOKEN_DENYLIST_SIZE", 100000))
+
 
 # Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    """Password hashing context, built on first use to keep passlib out of startup"""
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
 
 # Security
 security = HTTPBearer(auto_error=False)
 
-# Templates
-templates = Jinja2Templates(directory="templates")
+
+class TokenClaimCache:
+    """Bounded LRU cache of verified JWT claims, keyed by a hash of the token.
+
+    Entries live until the token's ``exp``. Logged-out tokens are kept in
+    a denylist consulted on every lookup; it is per process and bounded by
+    ``denylist_size`` unexpired entries, beyond which new revocations are
+    refused rather than older ones forgotten. Logouts are also published to
+    the shared ``revoked_tokens`` cache with CACHE_BACKEND=redis (see
+    revoke_access_token). Deactivated users are refused from the database
+    on every request.
+    """
+
+    def __init__(self, maxsize: int = TOKEN_CACHE_SIZE, denylist_size: int = TOKEN_DENYLIST_SIZE):
+        self.maxsize = maxsize
+        self.denylist_size = denylist_size
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._denied: Dict[str, float] = {}  # token hash -> exp
+        self._denied_expiry: List[Tuple[float, str]] = []  # heap of (exp, token hash)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return cached claims, or None if missing or expired"""
+        with self._lock:
+            claims = self._entries.get(key)
+            if claims is None:
+                self.misses += 1
+                return None
+            if claims["exp"] <= time.time():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return claims
+
+    def put(self, key: str, claims: dict) -> None:
+        if "exp" not in claims:
+            return
+        with self._lock:
+            self._entries[key] = claims
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def is_revoked(self, key: str) -> bool:
+        return key in self._denied
+
+    def revoke_token(self, key: str, exp: float) -> bool:
+        """Deny a verified token (logout) until its ``exp``; False if the denylist is full"""
+        now = time.time()
+        with self._lock:
+            # Only expired entries may leave; an unexpired one would become valid again
+            while self._denied_expiry and self._denied_expiry[0][0] <= now:
+                denied_exp, denied_key = heapq.heappop(self._denied_expiry)
+                if self._denied.get(denied_key) == denied_exp:
+                    del self._denied[denied_key]
+            if key not in self._denied and len(self._denied) >= self.denylist_size:
+                return False
+            self._entries.pop(key, None)
+            self._denied[key] = exp
+            heapq.heappush(self._denied_expiry, (exp, key))
+            return True
+
+    def forget_user(self, username: str) -> None:
+        """Drop a user's cached claims, e.g. after deactivation"""
+        with self._lock:
+            for key in [k for k, c in self._entries.items() if c.get("sub") == username]:
+                del self._entries[key]
+
+
+token_cache = TokenClaimCache()
+# Logged-out token hashes, shared across workers with CACHE_BACKEND=redis
+revoked_tokens = create_cache("revoked_tokens", ACCESS_TOKEN_EXPIRE_MINUTES * 60, maxsize=TOKEN_DENYLIST_SIZE)
 
 # Router
 router = APIRouter()
@@ -69,26 +166,81 @@ class UserResponse(BaseModel):
 # Utility functions
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
     """Hash a password"""
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create a JWT access token"""
+    from jose import jwt  # deferred: pulls in the cryptography backend
+
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    # jti keeps tokens minted in the same second distinct for the denylist
+    to_encode.update({"exp": expire, "jti": secrets.token_hex(8)})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
+def decode_access_token(token: str) -> Optional[dict]:
+    """Return verified claims for a token, skipping signature checks on cache hits"""
+    key = token_cache.key(token)
+    claims = token_cache.get(key)
+    if claims is None:
+        from jose import JWTError, jwt
+
+        try:
+            claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            return None
+        token_cache.put(key, claims)
+    if token_cache.is_revoked(key):
+        return None
+    return claims
+
+
+async def revoke_access_token(token: str) -> bool:
+    """Log a token out; returns False if it stays valid because the denylist is full.
+
+    With CACHE_BACKEND=redis the logout reaches every worker. With the memory
+    backend it only takes effect on this worker, so under cluster mode other
+    workers keep accepting the token until it expires. Tokens that do not
+    verify are already unusable and are ignored.
+    """
+    claims = decode_access_token(token)
+    if claims is None:
+        return True
+    key = token_cache.key(token)
+    revoked = token_cache.revoke_token(key, claims["exp"])
+    ttl = claims["exp"] - time.time()
+    if CACHE_BACKEND == "redis" and ttl > 0:
+        await revoked_tokens.set(key, "1", ttl)
+        return True
+    if not revoked:
+        logger.warning("Token denylist is full (%d entries); logout refused", token_cache.denylist_size)
+    return revoked
+
+
+def get_request_token(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = None
+) -> Optional[str]:
+    """Extract the bearer token from the Authorization header or cookie"""
+    if credentials:
+        return credentials.credentials
+    cookie_token = request.cookies.get("access_token")
+    if cookie_token and cookie_token.startswith("Bearer "):
+        return cookie_token[7:]  # Remove "Bearer " prefix
+    return None
+
+
 async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
     """Get user by username"""
     result = await db.execute(select(User).where(User.username == username))
@@ -117,28 +269,20 @@ async def get_current_user(
     db: AsyncSession = Depends(get_db)
 ) -> Optional[User]:
     """Get current authenticated user"""
-    token = None
-
-    # Try to get token from Authorization header first
-    if credentials:
-        token = credentials.credentials
-    else:
-        # Try to get token from cookie
-        cookie_token = request.cookies.get("access_token")
-        if cookie_token and cookie_token.startswith("Bearer "):
-            token = cookie_token[7:]  # Remove "Bearer " prefix
-
+    token = get_request_token(request, credentials)
     if not token:
         return None
 
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            return None
-        token_data = TokenData(username=username)
-    except JWTError:
+    payload = decode_access_token(token)
+    if payload is None:
+        return None
+    if CACHE_BACKEND == "redis" and await revoked_tokens.get(token_cache.key(token)):
+        # Logged out through another worker
+        return None
+    username: str = payload.get("sub")
+    if username is None:
         return None
+    token_data = TokenData(username=username)
 
     user = await get_user_by_username(db, username=token_data.username)
     return user
@@ -167,6 +311,20 @@ async def get_admin_user(current_user: User = Depends(get_current_active_user))
     return current_user
 
 
+async def get_user_db(
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Session on the shard holding the current user's switches"""
+    shard = await shard_router.shard_for(current_user.id)
+    if shard.index == 0:
+        yield db
+        return
+    async with shard.session_factory() as session:
+        await shard_router.mirror_user(session, shard, current_user)
+        yield session
+
+
 # Routes
 @router.get("/login", response_class=HTMLResponse)
 async def login_page(request: Request):
@@ -267,6 +425,8 @@ async def register(
     )
     
     db.add(user)
+    await db.flush()
+    shard_router.assign(db, user.id)
     await db.commit()
     await db.refresh(user)
     
@@ -279,18 +439,24 @@ async def register(
 @router.get("/profile", response_class=HTMLResponse)
 async def profile_page(
     request: Request,
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_user_db)
 ):
     """User profile page"""
+    summary = await db.get(UserActivitySummary, current_user.id)
     return templates.TemplateResponse(
         "auth/profile.html",
-        {"request": request, "user": current_user}
+        {"request": request, "user": current_user, "summary": summary}
     )
 
 
 @router.post("/logout")
-async def logout():
+async def logout(request: Request):
     """Logout endpoint"""
+    token = get_request_token(request)
+    if token:
+        await revoke_access_token(token)
+
     response = RedirectResponse(url="/auth/login", status_code=302)
     response.delete_cookie(key="access_token")
     return response
@@ -318,6 +484,20 @@ async def login_for_access_token(
     return {"access_token": access_token, "token_type": "bearer"}
 
 
+@router.post("/api/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def api_logout(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)
+):
+    """Revoke the bearer token used for this request"""
+    token = get_request_token(request, credentials)
+    if token and not await revoke_access_token(token):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Logout is temporarily unavailable; the token remains valid until it expires"
+        )
+
+
 @router.get("/api/me", response_model=UserResponse)
 async def read_users_me(current_user: User = Depends(get_current_active_user)):
     """Get current user info"""
@@ -0,0 +1,108 @@
+"""
+TTL Caches (in-memory with optional Redis)
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")  # "memory" or "redis"
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+class TTLCache:
+    """Bounded per-process cache whose entries expire after a fixed TTL"""
+
+    def __init__(self, namespace: str, ttl: float, maxsize: int = 10000):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    async def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._set(key, value, ttl)
+
+    async def add(self, key: str, value: str = "1", ttl: Optional[float] = None) -> bool:
+        """Set only if absent; returns False when the key already exists"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return False
+            self._set(key, value, ttl)
+            return True
+
+    def _set(self, key: str, value: str, ttl: Optional[float]) -> None:
+        self._entries[key] = (time.monotonic() + (ttl or self.ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+class RedisTTLCache:
+    """TTL cache shared across workers; degrades to a local cache if Redis is down"""
+
+    def __init__(self, namespace: str, ttl: float, maxsize: int = 10000, url: str = REDIS_URL):
+        import redis.asyncio as redis
+
+        self.namespace = namespace
+        self.ttl = ttl
+        self._client = redis.from_url(url, decode_responses=True)
+        self._fallback = TTLCache(namespace, ttl, maxsize)
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _failed(self, e: Exception) -> None:
+        logger.warning("Redis cache %s unavailable, using local cache: %s", self.namespace, e)
+        metrics.inc("cache_backend_errors_total", cache=self.namespace)
+
+    async def get(self, key: str) -> Optional[str]:
+        try:
+            return await self._client.get(self._key(key))
+        except Exception as e:
+            self._failed(e)
+            return await self._fallback.get(key)
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        try:
+            await self._client.set(self._key(key), value, px=int((ttl or self.ttl) * 1000))
+        except Exception as e:
+            self._failed(e)
+            await self._fallback.set(key, value, ttl)
+
+    async def add(self, key: str, value: str = "1", ttl: Optional[float] = None) -> bool:
+        try:
+            added = await self._client.set(
+                self._key(key), value, px=int((ttl or self.ttl) * 1000), nx=True
+            )
+            return bool(added)
+        except Exception as e:
+            self._failed(e)
+            return await self._fallback.add(key, value, ttl)
+
+
+def create_cache(namespace: str, ttl: float, maxsize: int = 10000):
+    """Build the configured cache backend for a namespace"""
+    if CACHE_BACKEND == "redis":
+        return RedisTTLCache(namespace, ttl, maxsize)
+    return TTLCache(namespace, ttl, maxsize)
@@ -0,0 +1,125 @@
+"""
+Signed One-Click Check-in and Acknowledgement Links
+"""
+import base64
+import calendar
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from .auth import SECRET_KEY
+from .cache import create_cache
+from .models import DeadmanSwitch, Notification
+
+# Configuration
+BASE_URL = os.getenv("BASE_URL", "http://localhost:8000")
+CHECK_IN_LINK_TTL_HOURS = int(os.getenv("CHECK_IN_LINK_TTL_HOURS", 72))
+ACKNOWLEDGE_LINK_TTL_HOURS = int(os.getenv("ACKNOWLEDGE_LINK_TTL_HOURS", 168))
+
+# Nonces of links already used; entries only need to outlive the link itself
+used_nonces = create_cache("check-in-link-nonces", CHECK_IN_LINK_TTL_HOURS * 3600, maxsize=1000000)
+
+
+class CheckInClaim(NamedTuple):
+    switch_id: int
+    user_id: int
+    expires_at: int
+    nonce: str
+
+
+class AcknowledgeClaim(NamedTuple):
+    switch_id: int
+    contact_id: int
+    triggered_at: int
+    expires_at: int
+
+
+def _sign(payload: str, purpose: str = "check-in-link") -> str:
+    digest = hmac.new(SECRET_KEY.encode(), f"{purpose}:{payload}".encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+
+def create_check_in_token(switch: DeadmanSwitch, ttl_hours: int = CHECK_IN_LINK_TTL_HOURS) -> str:
+    """Token of the form switch_id.user_id.expires_at.nonce.signature"""
+    expires_at = int(time.time()) + ttl_hours * 3600
+    payload = f"{switch.id}.{switch.user_id}.{expires_at}.{secrets.token_urlsafe(12)}"
+    return f"{payload}.{_sign(payload)}"
+
+
+def build_check_in_url(switch: DeadmanSwitch) -> str:
+    return f"{BASE_URL}/client/quick-check-in/{create_check_in_token(switch)}"
+
+
+def verify_check_in_token(token: str) -> Optional[CheckInClaim]:
+    """Check signature and expiry without touching the database"""
+    payload, _, signature = token.rpartition(".")
+    if not payload or not hmac.compare_digest(_sign(payload), signature):
+        return None
+    try:
+        switch_id, user_id, expires_at, nonce = payload.split(".")
+        claim = CheckInClaim(int(switch_id), int(user_id), int(expires_at), nonce)
+    except ValueError:
+        return None
+    if claim.expires_at <= time.time():
+        return None
+    return claim
+
+
+async def consume(claim: CheckInClaim) -> bool:
+    """Mark a link as used; False if it was used before"""
+    ttl = max(1, claim.expires_at - time.time())
+    return await used_nonces.add(claim.nonce, ttl=ttl)
+
+
+async def is_used(claim: CheckInClaim) -> bool:
+    return await used_nonces.get(claim.nonce) is not None
+
+
+def build_acknowledge_url(
+    switch_id: int,
+    contact_id: int,
+    triggered_at: datetime,
+    ttl_hours: int = ACKNOWLEDGE_LINK_TTL_HOURS
+) -> str:
+    """Link letting an emergency contact stop further escalation waves.
+
+    Bound to the trigger (naive UTC ``triggered_at``) it was sent for, so
+    it cannot acknowledge a later trigger of the same switch.
+    """
+    trigger = calendar.timegm(triggered_at.utctimetuple())
+    payload = f"{switch_id}.{contact_id}.{trigger}.{int(time.time()) + ttl_hours * 3600}"
+    return f"{BASE_URL}/client/acknowledge/{payload}.{_sign(payload, 'acknowledge-link')}"
+
+
+def verify_acknowledge_token(token: str) -> Optional[AcknowledgeClaim]:
+    payload, _, signature = token.rpartition(".")
+    if not payload or not hmac.compare_digest(_sign(payload, "acknowledge-link"), signature):
+        return None
+    try:
+        claim = AcknowledgeClaim(*(int(part) for part in payload.split(".")))
+    except (TypeError, ValueError):
+        return None
+    if claim.expires_at <= time.time():
+        return None
+    return claim
+
+
+def build_reminder_notification(switch: DeadmanSwitch, recipient_email: str, notification_type: str = "warning") -> Notification:
+    """Reminder for the switch owner with a one-click check-in link"""
+    due = switch.next_check_in_due.strftime("%Y-%m-%d %H:%M UTC") if switch.next_check_in_due else "soon"
+    return Notification(
+        deadman_switch_id=switch.id,
+        recipient_email=recipient_email,
+        subject=f"Check-in reminder: {switch.name}",
+        message=(
+            f"Your switch '{switch.name}' is due for a check-in by {due}.\n\n"
+            f"Check in with one click (no sign-in needed):\n{build_check_in_url(switch)}\n\n"
+            f"This link expires in {CHECK_IN_LINK_TTL_HOURS} hours and can be used once."
+        ),
+        notification_type=notification_type,
+        scheduled_for=datetime.utcnow()
+    )
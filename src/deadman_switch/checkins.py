@@ -0,0 +1,559 @@
+"""
+Check-in Write Path (direct and write-behind)
+"""
+import asyncio
+import fcntl
+import glob
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import bindparam, case, insert, or_, select, update
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import activity, outbox, regularity
+from .database import AsyncSessionLocal
+from .escalation import escalation_scheduler
+from .forecast import deadline_index
+from .metrics import metrics
+from .models import CheckIn, DeadmanSwitch, OutboxEvent, SwitchStatus
+from .shards import ShardMovingError, shard_router
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CHECKIN_WRITE_BEHIND = os.getenv("CHECKIN_WRITE_BEHIND", "false").lower() == "true"
+CHECKIN_JOURNAL_DIR = os.getenv("CHECKIN_JOURNAL_DIR", "./checkin_journal")
+CHECKIN_FLUSH_INTERVAL_MS = int(os.getenv("CHECKIN_FLUSH_INTERVAL_MS", 200))
+CHECKIN_FLUSH_MAX_RECORDS = int(os.getenv("CHECKIN_FLUSH_MAX_RECORDS", 1000))
+
+# Entries the database rejects (or that cannot be parsed) are moved here,
+# inside CHECKIN_JOURNAL_DIR, instead of blocking every later flush
+CHECKIN_QUARANTINE_FILE = "quarantine.jsonl"
+REJECTED_ENTRY_ERRORS = (IntegrityError, DataError, KeyError, TypeError, ValueError)
+
+
+async def record_check_in(
+    db: AsyncSession,
+    switch: DeadmanSwitch,
+    user_id: int,
+    check_in_time: Optional[datetime] = None,
+    notes: Optional[str] = None,
+    location: Optional[str] = None,
+    ip_address: Optional[str] = None,
+    user_agent: Optional[str] = None
+) -> CheckIn:
+    """Add a check-in, the switch update and the user's summary to the caller's transaction"""
+    now = check_in_time or datetime.utcnow()
+    await _lock_switches(db, [switch.id])
+    check_in_record = CheckIn(
+        user_id=user_id,
+        deadman_switch_id=switch.id,
+        check_in_time=now,
+        notes=notes,
+        location=location,
+        ip_address=ip_address,
+        user_agent=user_agent
+    )
+
+    regularity.observe_check_ins(switch, [now])
+    switch.last_check_in = now
+    switch.next_check_in_due = now + switch.check_in_interval
+    rearmed = switch.status == SwitchStatus.TRIGGERED
+    if rearmed:
+        switch.status = SwitchStatus.ACTIVE
+        switch.triggered_at = None
+        escalation_scheduler.cancel(switch.id)
+    deadline_index.track(switch)
+
+    db.add(check_in_record)
+    outbox.add_event(
+        db, outbox.SWITCH_CHECKED_IN, switch.id,
+        user_id=user_id, check_in_time=now, next_check_in_due=switch.next_check_in_due
+    )
+    if rearmed:
+        await activity.switches_changed(db, user_id)
+    await activity.checked_in(db, {user_id: [now]})
+    return check_in_record
+
+
+async def _lock_switches(db: AsyncSession, switch_ids: List[int]) -> None:
+    """Reload switches under a row lock on PostgreSQL, so concurrent check-ins
+    fold into the current statistics instead of overwriting each other"""
+    if db.bind.dialect.name == "postgresql":
+        await db.execute(
+            select(DeadmanSwitch)
+            .where(DeadmanSwitch.id.in_(switch_ids))
+            .order_by(DeadmanSwitch.id)
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        )
+
+
+async def record_check_in_batch(
+    db: AsyncSession,
+    switches: Dict[int, DeadmanSwitch],
+    user_id: int,
+    items: List[dict]
+) -> None:
+    """Bulk-insert check-ins and move each switch forward once.
+
+    ``items`` need ``switch_id`` and ``check_in_time`` and may carry
+    ``notes``/``location``. Check-ins older than a switch's current
+    ``last_check_in`` are kept as history but do not move it backwards.
+    """
+    if not items:
+        return
+    await db.execute(insert(CheckIn.__table__), [
+        {
+            "user_id": user_id,
+            "deadman_switch_id": item["switch_id"],
+            "check_in_time": item["check_in_time"],
+            "notes": item.get("notes"),
+            "location": item.get("location"),
+            "user_agent": item.get("user_agent"),
+        }
+        for item in items
+    ])
+
+    await activity.checked_in(db, {user_id: [item["check_in_time"] for item in items]})
+
+    times: Dict[int, List[datetime]] = {}
+    for item in items:
+        times.setdefault(item["switch_id"], []).append(item["check_in_time"])
+
+    await _lock_switches(db, list(times))
+    rearmed = False
+    for switch_id, switch_times in times.items():
+        switch = switches[switch_id]
+        check_in_time = max(switch_times)
+        if switch.last_check_in is not None and switch.last_check_in >= check_in_time:
+            continue
+        regularity.observe_check_ins(switch, switch_times)
+        switch.last_check_in = check_in_time
+        switch.next_check_in_due = check_in_time + switch.check_in_interval
+        if switch.status == SwitchStatus.TRIGGERED:
+            switch.status = SwitchStatus.ACTIVE
+            switch.triggered_at = None
+            escalation_scheduler.cancel(switch_id)
+            rearmed = True
+        deadline_index.track(switch)
+        outbox.add_event(
+            db, outbox.SWITCH_CHECKED_IN, switch_id,
+            user_id=user_id, check_in_time=check_in_time, next_check_in_due=switch.next_check_in_due
+        )
+    if rearmed:
+        await activity.switches_changed(db, user_id)
+
+
+def use_write_behind() -> bool:
+    """Whether user check-ins should go through the write-behind buffer"""
+    return CHECKIN_WRITE_BEHIND and check_in_buffer.running
+
+
+class CheckInBuffer:
+    """Write-behind queue for check-ins.
+
+    A check-in is acknowledged once its journal line has been fsynced; fsyncs
+    are shared by every check-in written while one is in flight. A background
+    task drains the queue every ``flush_interval`` seconds or ``max_records``
+    entries in a single transaction, coalescing repeat check-ins to the same
+    switch into one ``last_check_in`` update. Journal segments are deleted only
+    after their batch commits (entries left from a partly written batch are
+    moved to a fresh segment first) and are replayed on startup, so delivery
+    is at-least-once across crashes. Each process holds an exclusive lock on the
+    segments it owns, so several processes can share one journal directory and
+    only orphaned segments are replayed. Check-ins for switches deleted in
+    the meantime are dropped, and an entry the database rejects is moved to
+    CHECKIN_QUARANTINE_FILE instead of holding back the entries behind it.
+    """
+
+    def __init__(
+        self,
+        journal_dir: str = CHECKIN_JOURNAL_DIR,
+        flush_interval: float = CHECKIN_FLUSH_INTERVAL_MS / 1000,
+        max_records: int = CHECKIN_FLUSH_MAX_RECORDS,
+        session_factory=AsyncSessionLocal
+    ):
+        self.journal_dir = journal_dir
+        self.flush_interval = flush_interval
+        self.max_records = max_records
+        self.session_factory = session_factory
+        self._pending: List[dict] = []
+        self._segments: List[str] = []  # segments whose entries are all in _pending
+        self._segment_handles: Dict[str, object] = {}  # open, locked handles of owned segments
+        self._journal = None
+        self._journal_path: Optional[str] = None
+        self._written = 0
+        self._synced = 0
+        self._sync_lock = asyncio.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self) -> None:
+        os.makedirs(self.journal_dir, exist_ok=True)
+        self._replay_segments()
+        self._open_segment()
+        if self._pending:
+            await self.flush()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.flush()
+        self._journal.close()
+        if self._journal_path and os.path.getsize(self._journal_path) == 0:
+            os.remove(self._journal_path)
+        for handle in self._segment_handles.values():
+            handle.close()
+        self._segment_handles = {}
+
+    async def submit(
+        self,
+        switch: DeadmanSwitch,
+        user_id: int,
+        check_in_time: Optional[datetime] = None,
+        notes: Optional[str] = None,
+        location: Optional[str] = None,
+        ip_address: Optional[str] = None,
+        user_agent: Optional[str] = None
+    ) -> datetime:
+        """Durably enqueue a check-in; returns its timestamp"""
+        now = check_in_time or datetime.utcnow()
+        await self.submit_entry({
+            "switch_id": switch.id,
+            "user_id": user_id,
+            "time": now.isoformat(),
+            "notes": notes,
+            "location": location,
+            "ip_address": ip_address,
+            "user_agent": user_agent,
+        })
+        return now
+
+    async def submit_entry(self, entry: dict) -> None:
+        await self.submit_entries([entry])
+
+    async def submit_entries(self, entries: List[dict]) -> None:
+        """Durably enqueue raw journal entries with a single fsync"""
+        if not entries:
+            return
+        self._journal.write("".join(json.dumps(e, separators=(",", ":")) + "\n" for e in entries))
+        self._pending.extend(entries)
+        self._written += len(entries)
+        seq = self._written
+        async with self._sync_lock:
+            # One fsync covers every line written before it started
+            if self._synced < seq:
+                target = self._written
+                self._journal.flush()
+                await asyncio.to_thread(os.fsync, self._journal.fileno())
+                self._synced = target
+        metrics.inc("checkin_buffer_enqueued_total", len(entries))
+        if len(self._pending) >= self.max_records:
+            self._wake.set()
+
+    async def flush(self) -> int:
+        """Write all pending check-ins in one transaction"""
+        async with self._flush_lock:
+            async with self._sync_lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, []
+                segments = self._segments + [self._journal_path]
+                self._segments = []
+                self._journal.flush()
+                await asyncio.to_thread(os.fsync, self._journal.fileno())
+                # Keep the rotated segment open (and locked) until its batch commits
+                self._segment_handles[self._journal_path] = self._journal
+                self._open_segment()
+
+            started = time.perf_counter()
+            total = len(batch)
+            try:
+                try:
+                    deferred = await self._write_batch(batch)
+                except REJECTED_ENTRY_ERRORS:
+                    logger.exception("Check-in batch rejected; writing %d entries one at a time", len(batch))
+                    deferred = await self._write_isolated(batch)
+            except Exception:
+                logger.exception("Check-in flush failed; %d entries kept for retry", len(batch))
+                metrics.inc("checkin_buffer_flush_errors_total")
+                self._pending = batch + self._pending
+                self._segments = await self._carry_over(batch, segments, total) + self._segments
+                return 0
+            if deferred:
+                # Users mid-move between shards; kept for the next flush
+                self._pending = deferred + self._pending
+                self._segments = await self._carry_over(deferred, segments, total) + self._segments
+                metrics.inc("checkin_buffer_flushed_total", total - len(deferred))
+                return total - len(deferred)
+
+            self._remove_segments(segments)
+            metrics.inc("checkin_buffer_flushed_total", total)
+            metrics.set("checkin_buffer_last_flush_seconds", time.perf_counter() - started)
+            return total
+
+    async def _carry_over(self, entries: List[dict], segments: List[str], total: int) -> List[str]:
+        """Journal the ``entries`` left from a partly written batch of ``total``.
+
+        They go to a fresh segment and the batch's ``segments`` are deleted,
+        so a replay after a crash does not write the committed entries
+        twice. Returns the segments now holding ``entries``.
+        """
+        if len(entries) == total:
+            return segments  # nothing was written; the segments are still exact
+        path = None
+        try:
+            if entries:
+                path = self._segment_path()
+                handle = self._segment_handles[path] = open(path, "a", encoding="utf-8")
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                handle.write("".join(json.dumps(e, separators=(",", ":")) + "\n" for e in entries))
+                handle.flush()
+                await asyncio.to_thread(os.fsync, handle.fileno())
+        except OSError:
+            logger.exception("Could not rewrite the journal; keeping %d segments as they are", len(segments))
+            if path is not None:
+                self._remove_segments([path])
+            return segments
+        self._remove_segments(segments)
+        return [path] if path else []
+
+    def _remove_segments(self, segments: List[str]) -> None:
+        for segment in segments:
+            handle = self._segment_handles.pop(segment, None)
+            if handle is not None:
+                handle.close()
+            try:
+                os.remove(segment)
+            except OSError:
+                logger.exception("Could not remove flushed journal segment %s", segment)
+
+    async def _write_isolated(self, batch: List[dict]) -> List[dict]:
+        """Write entries one by one, quarantining those the database rejects.
+
+        Written and quarantined entries are removed from ``batch`` as they
+        go, so any other error still retries only the remainder.
+        """
+        deferred = []
+        for entry in list(batch):
+            try:
+                deferred.extend(await self._write_batch([entry]))
+            except REJECTED_ENTRY_ERRORS as e:
+                self._quarantine(entry, e)
+            batch[:] = [pending for pending in batch if pending is not entry]
+        return deferred
+
+    def _quarantine(self, entry: dict, error: Exception) -> None:
+        """Set aside an entry that can never be written, for inspection"""
+        logger.error("Quarantining check-in for switch %s: %s", entry.get("switch_id"), error)
+        metrics.inc("checkin_buffer_quarantined_total")
+        with open(os.path.join(self.journal_dir, CHECKIN_QUARANTINE_FILE), "a", encoding="utf-8") as f:
+            f.write(json.dumps({"entry": entry, "error": str(error)}, separators=(",", ":"), default=str) + "\n")
+
+    async def _write_batch(self, batch: List[dict]) -> List[dict]:
+        """Write a batch, one transaction per shard; returns entries deferred by a move.
+
+        Entries written to a shard are removed from ``batch``, so a failure
+        on a later shard retries only what was not committed.
+        """
+        if not shard_router.enabled:
+            await self._write_shard_batch(self.session_factory, batch)
+            return []
+        by_shard, deferred = {}, []
+        for entry in batch:
+            try:
+                shard = await shard_router.shard_for(entry["user_id"])
+            except ShardMovingError:
+                deferred.append(entry)
+                continue
+            by_shard.setdefault(shard.index, []).append(entry)
+        for index, entries in by_shard.items():
+            await self._write_shard_batch(shard_router.shards[index].session_factory, entries)
+            written = set(map(id, entries))
+            batch[:] = [entry for entry in batch if id(entry) not in written]
+        return deferred
+
+    async def _write_shard_batch(self, session_factory, batch: List[dict]) -> None:
+        is_triggered = DeadmanSwitch.status == SwitchStatus.TRIGGERED
+        async with session_factory() as db:
+            # Current state of the batch's switches: which still exist, owners
+            # whose status counts change on re-arm, and the statistics the new
+            # gaps are folded into. Locked on PostgreSQL so a switch cannot be
+            # deleted between this check and the insert.
+            query = select(
+                DeadmanSwitch.id, DeadmanSwitch.user_id, DeadmanSwitch.status, DeadmanSwitch.is_enabled,
+                DeadmanSwitch.last_check_in, DeadmanSwitch.next_check_in_due, DeadmanSwitch.check_in_interval,
+                *(getattr(DeadmanSwitch, column) for column in regularity.STAT_COLUMNS)
+            ).where(DeadmanSwitch.id.in_({entry["switch_id"] for entry in batch}))
+            if db.bind.dialect.name == "postgresql":
+                query = query.with_for_update()
+            switches = {row.id: row for row in await db.execute(query)}
+
+            deleted = [entry for entry in batch if entry["switch_id"] not in switches]
+            if deleted:
+                # Deleted after the check-in was accepted; the row would fail its foreign key
+                logger.warning("Dropping %d buffered check-ins for deleted switches", len(deleted))
+                metrics.inc("checkin_buffer_dropped_total", len(deleted))
+            disabled = [
+                entry for entry in batch
+                if entry["switch_id"] in switches and not switches[entry["switch_id"]].is_enabled
+            ]
+            if disabled:
+                # Disabled after the check-in was accepted; the check-in routes refuse those
+                logger.warning("Dropping %d buffered check-ins for disabled switches", len(disabled))
+                metrics.inc("checkin_buffer_dropped_total", len(disabled))
+            if deleted or disabled:
+                batch = [
+                    entry for entry in batch
+                    if entry["switch_id"] in switches and switches[entry["switch_id"]].is_enabled
+                ]
+                if not batch:
+                    return
+
+            rows = []
+            latest: Dict[int, datetime] = {}
+            switch_times: Dict[int, List[datetime]] = {}
+            check_in_times: Dict[int, List[datetime]] = {}  # user_id -> times
+            for entry in batch:
+                check_in_time = datetime.fromisoformat(entry["time"])
+                check_in_times.setdefault(entry["user_id"], []).append(check_in_time)
+                rows.append({
+                    "user_id": entry["user_id"],
+                    "deadman_switch_id": entry["switch_id"],
+                    "check_in_time": check_in_time,
+                    "notes": entry.get("notes"),
+                    "location": entry.get("location"),
+                    "ip_address": entry.get("ip_address"),
+                    "user_agent": entry.get("user_agent"),
+                })
+                switch_times.setdefault(entry["switch_id"], []).append(check_in_time)
+                current = latest.get(entry["switch_id"])
+                if current is None or check_in_time > current:
+                    latest[entry["switch_id"]] = check_in_time
+            rearmed_users = {
+                row.user_id for switch_id, row in switches.items()
+                if switch_id in latest and row.status == SwitchStatus.TRIGGERED
+            }
+
+            switch_updates = []
+            for switch_id, check_in_time in latest.items():
+                row = switches[switch_id]
+                stats = regularity.advance(
+                    regularity.stats_of(row), row.last_check_in, row.next_check_in_due,
+                    row.check_in_interval, switch_times[switch_id]
+                )
+                switch_updates.append({
+                    "b_id": switch_id,
+                    "b_time": check_in_time,
+                    # The current interval; the entry's may predate an edit
+                    "b_due": check_in_time + row.check_in_interval,
+                    "b_prev_samples": row.check_in_samples,
+                    **{f"b_{column}": value for column, value in stats.items()},
+                })
+
+            # Statistics only apply over the values they were computed from
+            same_stats = DeadmanSwitch.check_in_samples == bindparam("b_prev_samples")
+            conn = await db.connection()
+            await conn.execute(insert(CheckIn.__table__), rows)
+            await conn.execute(
+                update(DeadmanSwitch.__table__)
+                .where(
+                    DeadmanSwitch.id == bindparam("b_id"),
+                    or_(
+                        DeadmanSwitch.last_check_in.is_(None),
+                        DeadmanSwitch.last_check_in < bindparam("b_time")
+                    )
+                )
+                .values(
+                    last_check_in=bindparam("b_time"),
+                    next_check_in_due=bindparam("b_due"),
+                    status=case((is_triggered, SwitchStatus.ACTIVE.value), else_=DeadmanSwitch.status),
+                    triggered_at=case((is_triggered, None), else_=DeadmanSwitch.triggered_at),
+                    **{
+                        column: case((same_stats, bindparam(f"b_{column}")), else_=getattr(DeadmanSwitch, column))
+                        for column in regularity.STAT_COLUMNS
+                    }
+                ),
+                switch_updates
+            )
+            await conn.execute(insert(OutboxEvent.__table__), [
+                outbox.event_row(
+                    outbox.SWITCH_CHECKED_IN, row["b_id"],
+                    check_in_time=row["b_time"], next_check_in_due=row["b_due"]
+                )
+                for row in switch_updates
+            ])
+            await activity.checked_in(db, check_in_times)
+            for user_id in rearmed_users:
+                await activity.switches_changed(db, user_id)
+            await db.commit()
+
+        for update_row in switch_updates:
+            deadline_index.checked_in(update_row["b_id"], update_row["b_due"])
+            escalation_scheduler.cancel(update_row["b_id"])
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Check-in flush loop error")
+                metrics.inc("checkin_buffer_flush_errors_total")
+
+    def _segment_path(self) -> str:
+        return os.path.join(self.journal_dir, f"checkins-{time.time_ns()}-{os.getpid()}.journal")
+
+    def _open_segment(self) -> None:
+        self._journal_path = self._segment_path()
+        self._journal = open(self._journal_path, "a", encoding="utf-8")
+        fcntl.flock(self._journal.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _replay_segments(self) -> None:
+        """Load entries left behind by processes that are no longer running"""
+        replayed = 0
+        for segment in sorted(glob.glob(os.path.join(self.journal_dir, "checkins-*.journal"))):
+            handle = open(segment, encoding="utf-8")
+            try:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Owned by a live process sharing this directory
+                handle.close()
+                continue
+            for line in handle:
+                try:
+                    self._pending.append(json.loads(line))
+                    replayed += 1
+                except json.JSONDecodeError:
+                    # A torn final line was never acknowledged
+                    logger.warning("Skipping unreadable journal line in %s", segment)
+            self._segments.append(segment)
+            self._segment_handles[segment] = handle
+        if replayed:
+            logger.info("Replaying %d journaled check-ins", replayed)
+            metrics.inc("checkin_buffer_replayed_total", replayed)
+
+
+check_in_buffer = CheckInBuffer()
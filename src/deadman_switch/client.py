@@ -4,18 +4,23 @@ Client Interface Module
 from datetime import datetime, timedelta
 from typing import List, Optional
 from fastapi import APIRouter, Depends, Request, Form, HTTPException
-from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse, RedirectResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, desc, update
 from pydantic import BaseModel
 
-from .database import get_db
-from .models import User, DeadmanSwitch, CheckIn, EmergencyContact, SwitchStatus
-from .auth import get_current_active_user
-
-# Templates
-templates = Jinja2Templates(directory="templates")
+from .models import User, DeadmanSwitch, CheckIn, EmergencyContact, SwitchStatus, UserActivitySummary
+from .auth import get_current_active_user, get_user_db
+from .checkins import check_in_buffer, record_check_in, use_write_behind
+from . import activity, outbox
+from .heartbeat import heartbeat_index
+from .forecast import deadline_index
+from .escalation import escalation_scheduler_for
+from .webhooks import is_valid_webhook_url
+from .loaders import view_options
+from .shards import shard_router
+from . import check_in_links
+from .templating import templates
 
 # Router
 router = APIRouter()
@@ -62,12 +67,13 @@ async def is_switch_overdue(switch: DeadmanSwitch) -> bool:
 async def client_dashboard(
     request: Request,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Client dashboard"""
     # Get user's switches
     switches_result = await db.execute(
         select(DeadmanSwitch)
+        .options(*view_options("client.switches"))
         .where(DeadmanSwitch.user_id == current_user.id)
         .order_by(desc(DeadmanSwitch.created_at))
     )
@@ -89,11 +95,13 @@ async def client_dashboard(
     # Get recent check-ins
     recent_check_ins_result = await db.execute(
         select(CheckIn)
+        .options(*view_options("client.check_ins"))
         .where(CheckIn.user_id == current_user.id)
         .order_by(desc(CheckIn.check_in_time))
         .limit(10)
     )
     recent_check_ins = recent_check_ins_result.scalars().all()
+    summary = await db.get(UserActivitySummary, current_user.id)
     
     return templates.TemplateResponse(
         "client/dashboard.html",
@@ -101,7 +109,8 @@ async def client_dashboard(
             "request": request,
             "user": current_user,
             "switches": switch_data,
-            "recent_check_ins": recent_check_ins
+            "recent_check_ins": recent_check_ins,
+            "summary": summary
         }
     )
 
@@ -110,11 +119,12 @@ async def client_dashboard(
 async def client_switches(
     request: Request,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Client switches management"""
     switches_result = await db.execute(
         select(DeadmanSwitch)
+        .options(*view_options("client.switches"))
         .where(DeadmanSwitch.user_id == current_user.id)
         .order_by(desc(DeadmanSwitch.created_at))
     )
@@ -152,7 +162,7 @@ async def create_switch(
     grace_period: int = Form(2),
     grace_period_unit: str = Form("hours"),
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Create a new deadman switch"""
     # Convert time units to hours
@@ -200,8 +210,12 @@ async def create_switch(
     )
     
     db.add(switch)
+    await db.flush()
+    outbox.add_event(db, outbox.SWITCH_CREATED, switch.id, user_id=current_user.id)
+    await activity.switches_changed(db, current_user.id)
     await db.commit()
     await db.refresh(switch)
+    deadline_index.track(switch)
     
     return RedirectResponse(url="/client/switches", status_code=302)
 
@@ -211,11 +225,23 @@ async def switch_detail(
     switch_id: int,
     request: Request,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Switch detail page"""
+    return await _render_switch_detail(request, switch_id, current_user, db)
+
+
+async def _render_switch_detail(
+    request: Request,
+    switch_id: int,
+    current_user: User,
+    db: AsyncSession,
+    error: Optional[str] = None,
+    status_code: int = 200
+) -> HTMLResponse:
     switch_result = await db.execute(
         select(DeadmanSwitch)
+        .options(*view_options("client.switch_detail"))
         .where(
             DeadmanSwitch.id == switch_id,
             DeadmanSwitch.user_id == current_user.id
@@ -229,6 +255,7 @@ async def switch_detail(
     # Get emergency contacts
     contacts_result = await db.execute(
         select(EmergencyContact)
+        .options(*view_options("client.contacts"))
         .where(EmergencyContact.deadman_switch_id == switch_id)
         .order_by(EmergencyContact.priority)
     )
@@ -237,6 +264,7 @@ async def switch_detail(
     # Get check-in history
     check_ins_result = await db.execute(
         select(CheckIn)
+        .options(*view_options("client.check_ins"))
         .where(CheckIn.deadman_switch_id == switch_id)
         .order_by(desc(CheckIn.check_in_time))
         .limit(20)
@@ -256,8 +284,10 @@ async def switch_detail(
             "contacts": contacts,
             "check_ins": check_ins,
             "next_check_in": next_check_in,
-            "is_overdue": is_overdue
-        }
+            "is_overdue": is_overdue,
+            "error": error
+        },
+        status_code=status_code
     )
 
 
@@ -266,7 +296,7 @@ async def check_in(
     switch_id: int,
     notes: str = Form(""),
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Perform check-in for a switch"""
     switch_result = await db.execute(
@@ -284,49 +314,141 @@ async def check_in(
     if not switch.is_enabled:
         raise HTTPException(status_code=400, detail="Switch is disabled")
     
-    # Create check-in record
-    check_in_record = CheckIn(
-        user_id=current_user.id,
-        deadman_switch_id=switch_id,
-        check_in_time=datetime.utcnow(),
-        notes=notes if notes else None
+    if use_write_behind():
+        await check_in_buffer.submit(switch, current_user.id, notes=notes if notes else None)
+    else:
+        await record_check_in(db, switch, current_user.id, notes=notes if notes else None)
+        await db.commit()
+
+    return RedirectResponse(url=f"/client/switches/{switch_id}", status_code=302)
+
+
+@router.get("/quick-check-in/{token}", response_class=HTMLResponse)
+async def quick_check_in_page(request: Request, token: str):
+    """Confirmation page for a signed check-in link (GET never checks in, so link scanners can't)"""
+    claim = check_in_links.verify_check_in_token(token)
+    if claim is None:
+        error = "This check-in link is invalid or has expired."
+    elif await check_in_links.is_used(claim):
+        error = "This check-in link has already been used."
+    else:
+        error = None
+
+    return templates.TemplateResponse(
+        "client/quick_check_in.html",
+        {"request": request, "token": None if error else token, "error": error},
+        status_code=400 if error else 200
     )
 
-    # Update switch using SQL update
-    now = datetime.utcnow()
-    next_check_in = now + switch.check_in_interval
 
-    update_values = {
-        "last_check_in": now,
-        "next_check_in_due": next_check_in
-    }
+@router.post("/quick-check-in/{token}", response_class=HTMLResponse)
+async def quick_check_in(request: Request, token: str):
+    """Check in via a signed link; the token stands in for the session"""
+    claim = check_in_links.verify_check_in_token(token)
+    if claim is None:
+        error = "This check-in link is invalid or has expired."
+    else:
+        # Resolved first, so a user mid-move gets a retry page without spending the link
+        shard = await shard_router.shard_for(claim.user_id)
+        if await check_in_links.consume(claim):
+            async with shard.session_factory() as db:
+                return await _quick_check_in(request, db, claim)
+        error = "This check-in link has already been used."
 
-    if switch.status == SwitchStatus.TRIGGERED:
-        update_values["status"] = SwitchStatus.ACTIVE
-        update_values["triggered_at"] = None
+    return templates.TemplateResponse(
+        "client/quick_check_in.html",
+        {"request": request, "token": None, "error": error},
+        status_code=400
+    )
 
-    await db.execute(
-        update(DeadmanSwitch)
-        .where(DeadmanSwitch.id == switch_id)
-        .values(**update_values)
+
+async def _quick_check_in(request: Request, db: AsyncSession, claim: check_in_links.CheckInClaim):
+    switch_result = await db.execute(
+        select(DeadmanSwitch)
+        .where(
+            DeadmanSwitch.id == claim.switch_id,
+            DeadmanSwitch.user_id == claim.user_id
+        )
+    )
+    switch = switch_result.scalar_one_or_none()
+    error = None
+    if not switch:
+        error = "Switch not found."
+    elif not switch.is_enabled:
+        error = "This switch is disabled."
+
+    if error:
+        return templates.TemplateResponse(
+            "client/quick_check_in.html",
+            {"request": request, "token": None, "error": error},
+            status_code=400
+        )
+
+    user_agent = request.headers.get("user-agent")
+    ip_address = request.client.host if request.client else None
+    if use_write_behind():
+        await check_in_buffer.submit(switch, claim.user_id, ip_address=ip_address, user_agent=user_agent)
+    else:
+        await record_check_in(db, switch, claim.user_id, ip_address=ip_address, user_agent=user_agent)
+        await db.commit()
+
+    return templates.TemplateResponse(
+        "client/quick_check_in.html",
+        {"request": request, "token": None, "success": f"Checked in to {switch.name}. See you next time!"}
     )
 
-    db.add(check_in_record)
-    await db.commit()
 
-    return RedirectResponse(url=f"/client/switches/{switch_id}", status_code=302)
+@router.get("/acknowledge/{token}", response_class=HTMLResponse)
+async def acknowledge_page(request: Request, token: str):
+    """Confirmation page for an emergency contact's acknowledgement link"""
+    claim = check_in_links.verify_acknowledge_token(token)
+    error = None if claim else "This link is invalid or has expired."
+    return templates.TemplateResponse(
+        "client/acknowledge.html",
+        {"request": request, "token": None if error else token, "error": error},
+        status_code=400 if error else 200
+    )
+
+
+@router.post("/acknowledge/{token}", response_class=HTMLResponse)
+async def acknowledge(request: Request, token: str):
+    """Stop notifying further contacts of a triggered switch"""
+    claim = check_in_links.verify_acknowledge_token(token)
+    if claim is None:
+        return templates.TemplateResponse(
+            "client/acknowledge.html",
+            {"request": request, "token": None, "error": "This link is invalid or has expired."},
+            status_code=400
+        )
+
+    shard = await shard_router.locate_switch(claim.switch_id)
+    acknowledged = await escalation_scheduler_for(shard or shard_router.primary).acknowledge(
+        claim.switch_id, datetime.utcfromtimestamp(claim.triggered_at)
+    )
+    if not acknowledged:
+        return templates.TemplateResponse(
+            "client/acknowledge.html",
+            {"request": request, "token": None, "error": "This alert is no longer active or was already acknowledged."},
+            status_code=409
+        )
+    return templates.TemplateResponse(
+        "client/acknowledge.html",
+        {"request": request, "token": None, "success": "Thank you. No further contacts will be notified."}
+    )
 
 
 @router.post("/switches/{switch_id}/contacts/add")
 async def add_emergency_contact(
     switch_id: int,
+    request: Request,
     name: str = Form(...),
     email: str = Form(""),
     phone: str = Form(""),
     contact_relationship: str = Form(""),
     priority: int = Form(1),
+    webhook_url: str = Form(""),
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Add emergency contact to switch"""
     switch_result = await db.execute(
@@ -340,6 +462,12 @@ async def add_emergency_contact(
     
     if not switch:
         raise HTTPException(status_code=404, detail="Switch not found")
+
+    if webhook_url and not await is_valid_webhook_url(webhook_url):
+        return await _render_switch_detail(
+            request, switch_id, current_user, db,
+            error="Webhook URL must be a public http(s) URL", status_code=400
+        )
     
     contact = EmergencyContact(
         deadman_switch_id=switch_id,
@@ -347,7 +475,8 @@ async def add_emergency_contact(
         email=email if email else None,
         phone=phone if phone else None,
         contact_relationship=contact_relationship if contact_relationship else None,
-        priority=priority
+        priority=priority,
+        webhook_url=webhook_url if webhook_url else None
     )
     
     db.add(contact)
@@ -360,7 +489,7 @@ async def add_emergency_contact(
 async def toggle_switch(
     switch_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Toggle switch enabled/disabled"""
     switch_result = await db.execute(
@@ -385,15 +514,22 @@ async def toggle_switch(
             .values(is_enabled=False, status=SwitchStatus.PAUSED)
         )
     else:
-        # Calculate next check-in time based on current interval
-        interval_hours = int(switch.check_in_interval.total_seconds() // 3600)
-        next_check_in = datetime.utcnow() + timedelta(hours=interval_hours)
+        # A re-enabled switch gets a full interval from now
         await db.execute(
             update(DeadmanSwitch)
             .where(DeadmanSwitch.id == switch_id)
-            .values(is_enabled=True, status=SwitchStatus.ACTIVE, next_check_in_due=next_check_in)
+            .values(
+                is_enabled=True,
+                status=SwitchStatus.ACTIVE,
+                next_check_in_due=datetime.utcnow() + switch.check_in_interval,
+                triggered_at=None
+            )
         )
+    outbox.add_event(db, outbox.SWITCH_ENABLED if new_enabled else outbox.SWITCH_DISABLED, switch_id)
+    await activity.switches_changed(db, current_user.id)
     await db.commit()
+    heartbeat_index.invalidate(switch_id)
+    deadline_index.track(switch)
 
     return RedirectResponse(url="/client/switches", status_code=302)
 
@@ -402,7 +538,7 @@ async def toggle_switch(
 async def disable_switch(
     switch_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Disable a switch"""
     # Get switch
@@ -423,7 +559,11 @@ async def disable_switch(
         .where(DeadmanSwitch.id == switch_id)
         .values(is_enabled=False, status=SwitchStatus.PAUSED)
     )
+    outbox.add_event(db, outbox.SWITCH_DISABLED, switch_id)
+    await activity.switches_changed(db, current_user.id)
     await db.commit()
+    heartbeat_index.invalidate(switch_id)
+    deadline_index.track(switch)
 
     return RedirectResponse(url=f"/client/switches/{switch_id}", status_code=302)
 
@@ -432,7 +572,7 @@ async def disable_switch(
 async def enable_switch(
     switch_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Enable a switch"""
     # Get switch
@@ -447,13 +587,22 @@ async def enable_switch(
     if not switch:
         raise HTTPException(status_code=404, detail="Switch not found")
 
-    # Update switch status using SQL update
+    # Update switch status using SQL update; a re-enabled switch gets a full interval from now
     await db.execute(
         update(DeadmanSwitch)
         .where(DeadmanSwitch.id == switch_id)
-        .values(is_enabled=True, status=SwitchStatus.ACTIVE)
+        .values(
+            is_enabled=True,
+            status=SwitchStatus.ACTIVE,
+            next_check_in_due=datetime.utcnow() + switch.check_in_interval,
+            triggered_at=None
+        )
     )
+    outbox.add_event(db, outbox.SWITCH_ENABLED, switch_id)
+    await activity.switches_changed(db, current_user.id)
     await db.commit()
+    heartbeat_index.invalidate(switch_id)
+    deadline_index.track(switch)
 
     return RedirectResponse(url=f"/client/switches/{switch_id}", status_code=302)
 
@@ -462,7 +611,7 @@ async def enable_switch(
 async def test_notifications(
     switch_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Test notifications for a switch"""
     # Get switch
@@ -477,8 +626,10 @@ async def test_notifications(
     if not switch:
         raise HTTPException(status_code=404, detail="Switch not found")
 
-    # TODO: Implement actual notification testing
-    # For now, just redirect back with a success message
+    # Queue a reminder carrying a one-click check-in link to the owner
+    db.add(check_in_links.build_reminder_notification(switch, current_user.email, notification_type="test"))
+    await db.commit()
+
     return RedirectResponse(url=f"/client/switches/{switch_id}?test=success", status_code=302)
 
 
@@ -487,12 +638,12 @@ async def edit_switch_form(
     switch_id: int,
     request: Request,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Edit switch form"""
     # Get switch
     result = await db.execute(
-        select(DeadmanSwitch).where(
+        select(DeadmanSwitch).options(*view_options("client.switch_detail")).where(
             DeadmanSwitch.id == switch_id,
             DeadmanSwitch.user_id == current_user.id
         )
@@ -552,7 +703,7 @@ async def edit_switch(
     grace_period: int = Form(2),
     grace_period_unit: str = Form("hours"),
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Update switch"""
     # Get switch
@@ -589,7 +740,10 @@ async def edit_switch(
             grace_period=timedelta(hours=grace_period_hours)
         )
     )
+    outbox.add_event(db, outbox.SWITCH_UPDATED, switch_id)
     await db.commit()
+    heartbeat_index.invalidate(switch_id)
+    deadline_index.track(switch)
 
     return RedirectResponse(url=f"/client/switches/{switch_id}", status_code=302)
 
@@ -598,7 +752,7 @@ async def edit_switch(
 async def delete_switch(
     switch_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_user_db)
 ):
     """Delete a switch"""
     # Get switch
@@ -617,6 +771,10 @@ async def delete_switch(
     await db.execute(
         DeadmanSwitch.__table__.delete().where(DeadmanSwitch.id == switch_id)
     )
+    outbox.add_event(db, outbox.SWITCH_DELETED, switch_id)
+    await activity.switches_changed(db, current_user.id)
     await db.commit()
+    heartbeat_index.invalidate(switch_id)
+    deadline_index.discard(switch_id)
 
     return RedirectResponse(url="/client/switches", status_code=302)
@@ -0,0 +1,160 @@
+"""
+Multi-Process Serving and Per-Host Leadership
+"""
+import asyncio
+import fcntl
+import logging
+import os
+from typing import Awaitable, Callable, Optional
+
+from .database import async_engine, engine
+from .metrics import metrics
+from .shards import shard_router
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+SERVER_MODE = os.getenv(
+    "SERVER_MODE", "cluster" if os.getenv("ENVIRONMENT") == "production" else "single"
+)  # "single" (one uvicorn process) or "cluster" (gunicorn + uvicorn workers)
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 0))  # 0 = one worker per available CPU
+SERVER_PRELOAD = os.getenv("SERVER_PRELOAD", "true").lower() == "true"
+SERVER_TIMEOUT_SECONDS = int(os.getenv("SERVER_TIMEOUT_SECONDS", 60))
+SERVER_GRACEFUL_TIMEOUT_SECONDS = int(os.getenv("SERVER_GRACEFUL_TIMEOUT_SECONDS", 30))
+SERVER_KEEPALIVE_SECONDS = int(os.getenv("SERVER_KEEPALIVE_SECONDS", 5))
+CLUSTER_LOCK_PATH = os.getenv("CLUSTER_LOCK_PATH", "./deadman-switch-leader.lock")
+CLUSTER_LEADER_POLL_SECONDS = float(os.getenv("CLUSTER_LEADER_POLL_SECONDS", 5))
+
+# Set by the gunicorn master once it has done the one-time startup work
+CLUSTER_WORKER_ENV = "DEADMAN_SWITCH_CLUSTER_WORKER"
+
+
+def is_cluster_worker() -> bool:
+    return os.getenv(CLUSTER_WORKER_ENV) == "1"
+
+
+def worker_count() -> int:
+    """WEB_CONCURRENCY, or one async worker per CPU this process may run on"""
+    if WEB_CONCURRENCY > 0:
+        return WEB_CONCURRENCY
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    return max(1, cpus)
+
+
+class LeaderLock:
+    """Exclusive flock that elects one process per host to run singleton loops.
+
+    Every worker competes for the lock; the holder runs the duties and the
+    others poll, so when the leader exits (crash, rolling reload) another
+    worker takes over within ``poll_interval``. The kernel drops the lock
+    with the process, so a dead leader never blocks the cluster.
+    """
+
+    def __init__(self, path: str = CLUSTER_LOCK_PATH, poll_interval: float = CLUSTER_LEADER_POLL_SECONDS):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._handle = None
+
+    @property
+    def held(self) -> bool:
+        return self._handle is not None
+
+    def try_acquire(self) -> bool:
+        if self._handle is not None:
+            return True
+        handle = open(self.path, "a+")
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            handle.close()
+            return False
+        handle.truncate(0)
+        handle.write(f"{os.getpid()}\n")
+        handle.flush()
+        self._handle = handle
+        return True
+
+    def release(self) -> None:
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    async def lead(self, duties: Callable[[], Awaitable[None]]) -> None:
+        """Run ``duties()`` whenever this process holds the lock, until cancelled"""
+        while True:
+            if not self.try_acquire():
+                await asyncio.sleep(self.poll_interval)
+                continue
+            logger.info("Process %d is the leader", os.getpid())
+            metrics.set("cluster_leader", 1)
+            try:
+                await duties()
+            except Exception:
+                logger.exception("Leader duties failed; stepping down")
+            finally:
+                metrics.set("cluster_leader", 0)
+                self.release()
+            await asyncio.sleep(self.poll_interval)
+
+
+leader_lock = LeaderLock()
+
+
+def serve(app_path: str, host: str, port: int, prepare: Callable[[], Awaitable[None]], workers: Optional[int] = None) -> None:
+    """Run ``app_path`` under gunicorn with uvicorn workers.
+
+    ``prepare`` (schema setup and the like) runs once in the master before
+    any worker is forked, instead of once per worker. With SERVER_PRELOAD
+    the app is imported once in the master and shared copy-on-write.
+    SIGHUP starts a fresh set of workers and then gracefully stops the old
+    ones; with the app preloaded that picks up configuration, not code, so
+    deploy new code with SIGUSR2 (re-exec the master) followed by SIGQUIT
+    to the old master.
+    """
+    from gunicorn.app.base import BaseApplication
+    from gunicorn.util import import_app
+
+    def on_starting(server) -> None:
+        asyncio.run(_prepare_once(prepare))
+        os.environ[CLUSTER_WORKER_ENV] = "1"
+
+    def post_fork(server, worker) -> None:
+        # Never share pooled connections across processes
+        engine.dispose(close=False)
+        for shard in shard_router.shards:
+            shard.engine.sync_engine.dispose(close=False)
+
+    options = {
+        "bind": f"{host}:{port}",
+        "workers": workers or worker_count(),
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": SERVER_PRELOAD,
+        "timeout": SERVER_TIMEOUT_SECONDS,
+        "graceful_timeout": SERVER_GRACEFUL_TIMEOUT_SECONDS,
+        "keepalive": SERVER_KEEPALIVE_SECONDS,
+        "on_starting": on_starting,
+        "post_fork": post_fork,
+    }
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return import_app(app_path)
+
+    logger.info("Starting %d workers on %s", options["workers"], options["bind"])
+    Server().run()
+
+
+async def _prepare_once(prepare: Callable[[], Awaitable[None]]) -> None:
+    try:
+        await prepare()
+    finally:
+        # Connections were opened on this short-lived loop; workers open their own
+        await async_engine.dispose()
+        await shard_router.dispose()
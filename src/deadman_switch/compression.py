@@ -0,0 +1,179 @@
+"""
+Response Compression Middleware (gzip, and brotli when installed)
+"""
+import gzip
+import os
+import zlib
+from typing import Optional, Set
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from .metrics import metrics
+
+try:
+    import brotli  # optional: pip install brotli
+except ImportError:
+    brotli = None
+
+# Configuration
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 500))  # bytes
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", 6))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 4))
+COMPRESSION_CONTENT_TYPES = tuple(
+    t.strip() for t in os.getenv(
+        "COMPRESSION_CONTENT_TYPES",
+        "text/,application/json,application/javascript,application/xml,image/svg+xml"
+    ).split(",") if t.strip()
+)
+
+
+def accepted_encodings(header: str) -> Set[str]:
+    """Codings from an Accept-Encoding header, minus any refused with q=0"""
+    accepted = set()
+    for part in header.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip())
+    return accepted
+
+
+def choose_encoding(header: str) -> Optional[str]:
+    accepted = accepted_encodings(header)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class _GzipStream:
+    def __init__(self, level: int = COMPRESSION_GZIP_LEVEL):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        # Sync-flush each chunk so streamed responses are not held back
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _BrotliStream:
+    def __init__(self, quality: int = COMPRESSION_BROTLI_QUALITY):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+def compress(data: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    """One-shot compression; used for whole bodies and by the static build"""
+    if encoding == "br":
+        return brotli.compress(data, quality=COMPRESSION_BROTLI_QUALITY if level is None else level)
+    return gzip.compress(data, COMPRESSION_GZIP_LEVEL if level is None else level, mtime=0)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses the client accepts compressed.
+
+    Only bodies of at least ``minimum_size`` bytes with a matching content
+    type are compressed; responses that already carry a Content-Encoding
+    (such as precompressed static files) pass through untouched. Streaming
+    responses are compressed chunk by chunk.
+    """
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = COMPRESSION_MIN_SIZE,
+        content_types: tuple = COMPRESSION_CONTENT_TYPES
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.content_types = content_types
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not COMPRESSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+    def compressible(self, headers: MutableHeaders) -> bool:
+        if "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "")
+        return any(content_type.startswith(t) for t in self.content_types)
+
+
+class _CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self._send = send
+        self._start = None
+        self._stream = None
+        self._passthrough = False
+
+    async def send(self, message) -> None:
+        if message["type"] == "http.response.start":
+            self._start = message
+            return
+        if message["type"] != "http.response.body" or self._passthrough:
+            await self._flush_start()
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self._stream is None:
+            headers = MutableHeaders(raw=self._start["headers"])
+            if not self.middleware.compressible(headers) or (
+                not more_body and len(body) < self.middleware.minimum_size
+            ):
+                self._passthrough = True
+                await self._flush_start()
+                await self._send(message)
+                return
+
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            metrics.inc("responses_compressed_total", encoding=self.encoding)
+            if not more_body:
+                compressed = compress(body, self.encoding)
+                headers["Content-Length"] = str(len(compressed))
+                await self._flush_start()
+                await self._send({"type": "http.response.body", "body": compressed})
+                return
+            del headers["Content-Length"]
+            self._stream = _BrotliStream() if self.encoding == "br" else _GzipStream()
+            await self._flush_start()
+
+        chunk = self._stream.compress(body)
+        if not more_body:
+            chunk += self._stream.finish()
+        await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+    async def _flush_start(self) -> None:
+        if self._start is not None:
+            await self._send(self._start)
+            self._start = None
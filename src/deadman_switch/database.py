@@ -1,44 +1,68 @@
 """
 Database Configuration and Session Management
 """
+import logging
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy import Column, MetaData, String, Table, create_engine, inspect, select
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
+from .metrics import metrics
 from .models import Base
 
+logger = logging.getLogger(__name__)
+
 # Database URL from environment or default to SQLite
 DATABASE_URL = os.getenv(
     "DATABASE_URL", 
     "sqlite:///./deadman_switch.db"
 )
 
-# For async operations, convert sqlite to aiosqlite
-if DATABASE_URL.startswith("sqlite"):
-    ASYNC_DATABASE_URL = DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://")
-else:
+# "strict" refuses to start on a schema revision mismatch, "warn" only logs it
+DB_SCHEMA_CHECK = os.getenv("DB_SCHEMA_CHECK", "warn")
+
+# Alembic revision the models match; bump together with every new migration
+SCHEMA_REVISION = "a9a9feead260"
+# The initial migration, matching tables created before the app stamped revisions
+BASELINE_REVISION = "2afd24b4fb9e"
+
+alembic_version = Table(
+    "alembic_version",
+    MetaData(),
+    Column("version_num", String(32), primary_key=True),
+)
+
+
+def async_database_url(url: str) -> str:
+    """The async-driver form of a database URL"""
+    if url.startswith("sqlite"):
+        # For async operations, convert sqlite to aiosqlite
+        return url.replace("sqlite://", "sqlite+aiosqlite://")
     # For PostgreSQL in production
-    ASYNC_DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
+    return url.replace("postgresql://", "postgresql+asyncpg://")
 
-# Create engines
-if DATABASE_URL.startswith("sqlite"):
-    # SQLite configuration
-    engine = create_engine(
-        DATABASE_URL,
-        connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
-    )
-    async_engine = create_async_engine(
-        ASYNC_DATABASE_URL,
-        connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
-    )
-else:
+
+def _engine_args(url: str) -> dict:
+    if url.startswith("sqlite"):
+        # SQLite configuration. An in-memory database only exists on a single shared
+        # connection; file databases get a pool so background loops (outbox relay,
+        # dispatcher, trigger monitor) don't interleave statements with requests.
+        pool_args = {"poolclass": StaticPool} if ":memory:" in url else {}
+        return {"connect_args": {"check_same_thread": False}, **pool_args}
     # PostgreSQL configuration
-    engine = create_engine(DATABASE_URL)
-    async_engine = create_async_engine(ASYNC_DATABASE_URL)
+    return {}
+
+
+def create_async_engine_for(url: str) -> AsyncEngine:
+    return create_async_engine(async_database_url(url), **_engine_args(url))
+
+
+ASYNC_DATABASE_URL = async_database_url(DATABASE_URL)
+
+# Create engines
+engine = create_engine(DATABASE_URL, **_engine_args(DATABASE_URL))
+async_engine = create_async_engine_for(DATABASE_URL)
 
 # Create session makers
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -47,10 +71,45 @@ AsyncSessionLocal = sessionmaker(
 )
 
 
-async def init_db():
-    """Initialize the database"""
-    async with async_engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+class SchemaRevisionError(RuntimeError):
+    """The database is not at the revision these models expect"""
+
+
+async def init_db(bind: AsyncEngine = async_engine) -> str:
+    """Check the schema revision with a single query.
+
+    An empty database (a fresh development database) gets its tables
+    created and is stamped at SCHEMA_REVISION, so later starts skip
+    ``create_all``. Application tables without a revision are refused, as
+    stamping them would skip migrations they never had. Anything else
+    should be migrated with ``alembic upgrade head`` before the app starts.
+    """
+    async with bind.connect() as conn:
+        tables = set(await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_table_names()))
+        revision = None
+        if alembic_version.name in tables:
+            revision = (await conn.execute(select(alembic_version.c.version_num))).scalar()
+
+    if revision is None:
+        if "users" in tables:
+            raise SchemaRevisionError(
+                "Database has application tables but no schema revision; run "
+                f"`alembic stamp {BASELINE_REVISION} && alembic upgrade head`"
+            )
+        logger.warning("Database has no schema revision; creating tables at %s", SCHEMA_REVISION)
+        async with bind.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(alembic_version.create, checkfirst=True)
+            await conn.execute(alembic_version.insert().values(version_num=SCHEMA_REVISION))
+        revision = SCHEMA_REVISION
+
+    metrics.set("schema_revision_current", int(revision == SCHEMA_REVISION))
+    if revision != SCHEMA_REVISION:
+        message = f"Database schema is at {revision}, expected {SCHEMA_REVISION}; run `alembic upgrade head`"
+        if DB_SCHEMA_CHECK == "strict":
+            raise SchemaRevisionError(message)
+        logger.error(message)
+    return revision
 
 
 async def get_async_session():
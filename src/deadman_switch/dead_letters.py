@@ -0,0 +1,118 @@
+"""
+Dead-Letter Queue for Failed Notifications
+"""
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import desc, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .metrics import metrics
+from .models import Notification, NotificationStatus
+from .notifications import NOTIFICATION_POLL_SECONDS
+
+# Configuration
+DEAD_LETTER_REPLAY_RATE_PER_SECOND = float(os.getenv("DEAD_LETTER_REPLAY_RATE_PER_SECOND", 50))
+DEAD_LETTER_PAGE_SIZE = int(os.getenv("DEAD_LETTER_PAGE_SIZE", 100))
+
+
+def dead_letter_conditions(
+    error_class: Optional[str] = None,
+    transport: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    switch_id: Optional[int] = None
+) -> list:
+    """WHERE clauses selecting failed notifications; shared by the view and the bulk actions"""
+    conditions = [Notification.status == NotificationStatus.FAILED]
+    if error_class:
+        conditions.append(Notification.error_class == error_class)
+    if transport:
+        conditions.append(Notification.transport == transport)
+    if since is not None:
+        conditions.append(Notification.failed_at >= since)
+    if until is not None:
+        conditions.append(Notification.failed_at < until)
+    if switch_id is not None:
+        conditions.append(Notification.deadman_switch_id == switch_id)
+    return conditions
+
+
+async def summarize(db: AsyncSession, conditions: list) -> List[Tuple[Optional[str], Optional[str], int]]:
+    """(error_class, transport, count) for the matching dead letters, largest first"""
+    result = await db.execute(
+        select(Notification.error_class, Notification.transport, func.count(Notification.id))
+        .where(*conditions)
+        .group_by(Notification.error_class, Notification.transport)
+        .order_by(desc(func.count(Notification.id)))
+    )
+    return [tuple(row) for row in result.all()]
+
+
+async def list_dead_letters(
+    db: AsyncSession,
+    conditions: list,
+    limit: int = DEAD_LETTER_PAGE_SIZE,
+    offset: int = 0
+) -> List[Notification]:
+    result = await db.execute(
+        select(Notification)
+        .where(*conditions)
+        .order_by(desc(Notification.failed_at), desc(Notification.id))
+        .limit(limit)
+        .offset(offset)
+    )
+    return result.scalars().all()
+
+
+async def replay(
+    db: AsyncSession,
+    conditions: list,
+    rate: float = DEAD_LETTER_REPLAY_RATE_PER_SECOND,
+    step: float = NOTIFICATION_POLL_SECONDS
+) -> int:
+    """Re-enqueue matching dead letters, spread out at ``rate`` per second.
+
+    Rows are split into id ranges of ``rate * step`` notifications and each
+    range is scheduled ``step`` seconds after the previous one, so the
+    dispatcher picks them up a poll at a time instead of all at once. One
+    UPDATE per range, one commit in total.
+    """
+    ids = (await db.execute(
+        select(Notification.id).where(*conditions).order_by(Notification.id)
+    )).scalars().all()
+    if not ids:
+        return 0
+
+    chunk = max(1, int(rate * step))
+    now = datetime.utcnow()
+    for n, start in enumerate(range(0, len(ids), chunk)):
+        first, last = ids[start], ids[min(start + chunk, len(ids)) - 1]
+        await db.execute(
+            update(Notification)
+            .where(*conditions, Notification.id.between(first, last))
+            .values(
+                status=NotificationStatus.PENDING,
+                scheduled_for=now + timedelta(seconds=n * step),
+                digest_id=None,
+                replay_count=func.coalesce(Notification.replay_count, 0) + 1
+            )
+            .execution_options(synchronize_session=False)
+        )
+    await db.commit()
+    metrics.inc("dead_letters_replayed_total", len(ids))
+    return len(ids)
+
+
+async def discard(db: AsyncSession, conditions: list) -> int:
+    """Drop matching dead letters with a single UPDATE"""
+    result = await db.execute(
+        update(Notification)
+        .where(*conditions)
+        .values(status=NotificationStatus.DISCARDED)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    metrics.inc("dead_letters_discarded_total", result.rowcount)
+    return result.rowcount
@@ -0,0 +1,339 @@
+"""
+Trigger Detection and Priority-Wave Escalation
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import DateTime, func, literal, select, update
+
+from . import activity, outbox
+from .check_in_links import build_acknowledge_url
+from .database import AsyncSessionLocal
+from .forecast import deadline_index
+from .metrics import metrics
+from .models import DeadmanSwitch, EmergencyContact, Notification, SwitchStatus
+from .settings import settings_service
+from .shards import Shard
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+TRIGGER_MONITOR_ENABLED = os.getenv("TRIGGER_MONITOR_ENABLED", "true").lower() == "true"
+TRIGGER_CHECK_INTERVAL_SECONDS = float(os.getenv("TRIGGER_CHECK_INTERVAL_SECONDS", 60))
+TRIGGER_BATCH_SIZE = int(os.getenv("TRIGGER_BATCH_SIZE", 1000))  # overridable by the trigger_batch_size setting
+
+DEFAULT_ESCALATION_DELAY = timedelta(hours=1)
+
+
+def _naive_utc(moment: datetime) -> datetime:
+    if moment.tzinfo is not None:
+        return moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def _past_trigger_deadline(dialect: str, now: datetime):
+    """SQL for ``next_check_in_due + grace_period < now``.
+
+    SQLite stores intervals as an offset from the epoch, so the grace period
+    is added in julian days there.
+    """
+    grace_period = func.coalesce(DeadmanSwitch.grace_period, timedelta())
+    if dialect == "postgresql":
+        return DeadmanSwitch.next_check_in_due + grace_period < now
+    grace_days = func.julianday(grace_period) - func.julianday(literal(datetime(1970, 1, 1), DateTime()))
+    return func.julianday(DeadmanSwitch.next_check_in_due) + grace_days < func.julianday(literal(now, DateTime()))
+
+
+def _escalation_delay(delay: Optional[timedelta]) -> timedelta:
+    return delay if delay is not None else DEFAULT_ESCALATION_DELAY
+
+
+def _priority(contact: EmergencyContact) -> int:
+    return contact.priority if contact.priority is not None else 1
+
+
+def build_escalation_notifications(switch: DeadmanSwitch, contact: EmergencyContact, wave: int) -> List[Notification]:
+    """One notification per channel (email, webhook) the contact has"""
+    subject = f"Deadman switch triggered: {switch.name}"
+    triggered_at = _naive_utc(switch.triggered_at) if switch.triggered_at else datetime.utcnow()
+    message = (
+        f"Hello {contact.name},\n\n"
+        f"You are listed as an emergency contact for '{switch.name}', which was triggered "
+        f"after its owner missed a check-in.\n\n"
+        f"{switch.description or ''}\n\n"
+        f"If you are handling this, let us know so other contacts are not notified:\n"
+        f"{build_acknowledge_url(switch.id, contact.id, triggered_at)}"
+    )
+    notifications = []
+    if contact.email:
+        notifications.append(Notification(
+            deadman_switch_id=switch.id,
+            recipient_email=contact.email,
+            recipient_phone=contact.phone,
+            transport="email",
+            subject=subject,
+            message=message,
+            notification_type=f"trigger-wave-{wave}",
+            scheduled_for=datetime.utcnow()
+        ))
+    if contact.webhook_url:
+        notifications.append(Notification(
+            deadman_switch_id=switch.id,
+            webhook_url=contact.webhook_url,
+            transport="webhook",
+            subject=subject,
+            message=message,
+            notification_type=f"trigger-wave-{wave}",
+            scheduled_for=datetime.utcnow()
+        ))
+    return notifications
+
+
+def build_switch_webhook_notification(switch: DeadmanSwitch) -> Notification:
+    return Notification(
+        deadman_switch_id=switch.id,
+        webhook_url=switch.webhook_url,
+        transport="webhook",
+        subject=f"Deadman switch triggered: {switch.name}",
+        message=f"Switch '{switch.name}' (id {switch.id}) was triggered after a missed check-in.",
+        notification_type="trigger",
+        scheduled_for=datetime.utcnow()
+    )
+
+
+class EscalationScheduler:
+    """Notifies emergency contacts one priority level at a time.
+
+    Wave 1 (the lowest ``priority`` value) is notified when a switch
+    triggers; each later wave waits ``escalation_delay`` and is skipped once
+    the switch is checked in or acknowledged. Pending waves are event-loop
+    timers keyed by switch id, so a check-in cancels one in O(1). Each wave
+    is claimed with a conditional update on ``escalation_wave``, so several
+    workers scheduling the same switch still notify each wave once.
+    """
+
+    def __init__(self, check_interval: float = TRIGGER_CHECK_INTERVAL_SECONDS, session_factory=AsyncSessionLocal):
+        self.check_interval = check_interval
+        self.session_factory = session_factory
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    def schedule(self, switch_id: int, delay: float) -> None:
+        self.cancel(switch_id)
+        loop = asyncio.get_running_loop()
+        self._timers[switch_id] = loop.call_later(max(0.0, delay), self._fire, switch_id)
+
+    def cancel(self, switch_id: int) -> bool:
+        """Drop the pending wave of a re-armed or acknowledged switch"""
+        handle = self._timers.pop(switch_id, None)
+        if handle is None:
+            return False
+        handle.cancel()
+        metrics.inc("escalation_waves_cancelled_total")
+        return True
+
+    def _fire(self, switch_id: int) -> None:
+        self._timers.pop(switch_id, None)
+        task = asyncio.create_task(self.advance(switch_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def load(self) -> int:
+        """Reschedule the next wave of every unacknowledged triggered switch"""
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(
+                    DeadmanSwitch.id,
+                    DeadmanSwitch.triggered_at,
+                    DeadmanSwitch.escalation_wave,
+                    DeadmanSwitch.escalation_delay
+                ).where(
+                    DeadmanSwitch.status == SwitchStatus.TRIGGERED,
+                    DeadmanSwitch.acknowledged_at.is_(None)
+                )
+            )
+            rows = result.all()
+        now = datetime.utcnow()
+        for row in rows:
+            # Wave n + 1 is due n delays after the trigger
+            triggered_at = _naive_utc(row.triggered_at) if row.triggered_at else now
+            due = triggered_at + (row.escalation_wave or 0) * _escalation_delay(row.escalation_delay)
+            self.schedule(row.id, (due - now).total_seconds())
+        return len(rows)
+
+    async def advance(self, switch_id: int) -> int:
+        """Notify the next priority level; returns the wave number sent, or 0"""
+        async with self.session_factory() as db:
+            switch_result = await db.execute(select(DeadmanSwitch).where(DeadmanSwitch.id == switch_id))
+            switch = switch_result.scalar_one_or_none()
+            if switch is None or switch.status != SwitchStatus.TRIGGERED or switch.acknowledged_at is not None:
+                return 0
+
+            contacts_result = await db.execute(
+                select(EmergencyContact)
+                .where(
+                    EmergencyContact.deadman_switch_id == switch_id,
+                    EmergencyContact.is_active == True
+                )
+                .order_by(EmergencyContact.priority, EmergencyContact.id)
+            )
+            contacts = contacts_result.scalars().all()
+            levels = sorted({_priority(contact) for contact in contacts})
+            wave = switch.escalation_wave or 0
+            # A switch-level webhook alone still makes one wave
+            total_waves = max(len(levels), 1 if switch.webhook_url else 0)
+            if wave >= total_waves:
+                return 0
+
+            claimed = await db.execute(
+                update(DeadmanSwitch)
+                .where(
+                    DeadmanSwitch.id == switch_id,
+                    DeadmanSwitch.escalation_wave == wave,
+                    DeadmanSwitch.status == SwitchStatus.TRIGGERED,
+                    DeadmanSwitch.acknowledged_at.is_(None)
+                )
+                .values(escalation_wave=wave + 1)
+                .execution_options(synchronize_session=False)
+            )
+            if claimed.rowcount != 1:
+                return 0
+
+            notifications: List[Notification] = []
+            for contact in contacts:
+                if levels and _priority(contact) == levels[wave]:
+                    notifications.extend(build_escalation_notifications(switch, contact, wave + 1))
+            if wave == 0 and switch.webhook_url:
+                notifications.append(build_switch_webhook_notification(switch))
+            db.add_all(notifications)
+            delay = _escalation_delay(switch.escalation_delay).total_seconds()
+            await db.commit()
+
+        metrics.inc("escalation_waves_total")
+        metrics.inc("escalation_notifications_total", len(notifications))
+        if wave + 1 < total_waves:
+            self.schedule(switch_id, delay)
+        return wave + 1
+
+    async def trigger(self, switch_id: int, next_check_in_due: Optional[datetime] = None) -> bool:
+        """Trigger an active switch and send its first wave.
+
+        ``next_check_in_due`` guards against a check-in that landed after the
+        switch was found overdue.
+        """
+        conditions = [
+            DeadmanSwitch.id == switch_id,
+            DeadmanSwitch.status == SwitchStatus.ACTIVE,
+            DeadmanSwitch.is_enabled == True,
+        ]
+        if next_check_in_due is not None:
+            conditions.append(DeadmanSwitch.next_check_in_due == next_check_in_due)
+        now = datetime.utcnow()
+        async with self.session_factory() as db:
+            result = await db.execute(
+                update(DeadmanSwitch)
+                .where(*conditions)
+                .values(
+                    status=SwitchStatus.TRIGGERED,
+                    triggered_at=now,
+                    escalation_wave=0,
+                    acknowledged_at=None
+                )
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount != 1:
+                return False
+            outbox.add_event(db, outbox.SWITCH_TRIGGERED, switch_id, triggered_at=now)
+            user_id = await db.scalar(select(DeadmanSwitch.user_id).where(DeadmanSwitch.id == switch_id))
+            await activity.switches_changed(db, user_id)
+            await db.commit()
+
+        deadline_index.discard(switch_id)
+        metrics.inc("switches_triggered_total")
+        logger.info("Switch %d triggered", switch_id)
+        await self.advance(switch_id)
+        return True
+
+    async def acknowledge(self, switch_id: int, triggered_at: datetime) -> bool:
+        """Stop escalating a triggered switch, if it is still the trigger at ``triggered_at`` (whole seconds)"""
+        now = datetime.utcnow()
+        async with self.session_factory() as db:
+            result = await db.execute(
+                update(DeadmanSwitch)
+                .where(
+                    DeadmanSwitch.id == switch_id,
+                    DeadmanSwitch.status == SwitchStatus.TRIGGERED,
+                    DeadmanSwitch.triggered_at >= triggered_at,
+                    DeadmanSwitch.triggered_at < triggered_at + timedelta(seconds=1),
+                    DeadmanSwitch.acknowledged_at.is_(None)
+                )
+                .values(acknowledged_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                outbox.add_event(db, outbox.SWITCH_ACKNOWLEDGED, switch_id, acknowledged_at=now)
+            await db.commit()
+        self.cancel(switch_id)
+        return result.rowcount == 1
+
+    async def check_overdue(self) -> int:
+        """Trigger enabled switches past ``next_check_in_due + grace_period``, oldest first.
+
+        At most ``trigger_batch_size`` switches are triggered per call; the
+        rest are picked up by the next check.
+        """
+        batch_size = settings_service.get_int("trigger_batch_size", TRIGGER_BATCH_SIZE)
+        now = datetime.utcnow()
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(DeadmanSwitch.id, DeadmanSwitch.next_check_in_due)
+                .where(
+                    DeadmanSwitch.status == SwitchStatus.ACTIVE,
+                    DeadmanSwitch.is_enabled == True,
+                    DeadmanSwitch.next_check_in_due < now,
+                    _past_trigger_deadline(db.bind.dialect.name, now)
+                )
+                .order_by(DeadmanSwitch.next_check_in_due)
+                .limit(batch_size)
+            )
+            rows = result.all()
+
+        triggered = 0
+        for row in rows:
+            if await self.trigger(row.id, row.next_check_in_due):
+                triggered += 1
+        return triggered
+
+    async def run_forever(self) -> None:
+        while True:
+            try:
+                await self.check_overdue()
+            except Exception:
+                logger.exception("Trigger check failed")
+            await asyncio.sleep(self.check_interval)
+
+    async def stop(self) -> None:
+        for handle in self._timers.values():
+            handle.cancel()
+        self._timers = {}
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+escalation_scheduler = EscalationScheduler()
+_shard_schedulers: Dict[int, EscalationScheduler] = {0: escalation_scheduler}
+
+
+def escalation_scheduler_for(shard: Shard) -> EscalationScheduler:
+    """The scheduler for one shard's switches; the primary's is ``escalation_scheduler``"""
+    scheduler = _shard_schedulers.get(shard.index)
+    if scheduler is None:
+        scheduler = _shard_schedulers[shard.index] = EscalationScheduler(session_factory=shard.session_factory)
+    return scheduler
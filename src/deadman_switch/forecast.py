@@ -0,0 +1,134 @@
+"""
+Trigger Deadline Forecast
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from .metrics import metrics
+from .models import DeadmanSwitch, SwitchStatus
+from .shards import ShardRouter, shard_router
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+DEADLINE_INDEX_REFRESH_SECONDS = int(os.getenv("DEADLINE_INDEX_REFRESH_SECONDS", 300))
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _minute(moment: datetime) -> int:
+    """Whole UTC minutes since the epoch"""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return (moment - EPOCH) // timedelta(minutes=1)
+
+
+class DeadlineIndex:
+    """Per-minute counts of upcoming trigger deadlines.
+
+    A switch's deadline is ``next_check_in_due + grace_period`` (i.e.
+    ``last_check_in + check_in_interval + grace_period``) and only enabled,
+    active switches are counted. Check-ins and switch edits update the index
+    in place; a periodic reload picks up changes made by other workers.
+    Switches on every shard are indexed.
+    """
+
+    def __init__(self, refresh_interval: float = DEADLINE_INDEX_REFRESH_SECONDS, shards: ShardRouter = shard_router):
+        self.refresh_interval = refresh_interval
+        self.shards = shards
+        self._switches: Dict[int, Tuple[int, timedelta]] = {}  # switch_id -> (deadline minute, grace)
+        self._buckets: Dict[int, int] = {}  # deadline minute -> switch count
+        self.loaded_at: Optional[datetime] = None
+
+    def __len__(self) -> int:
+        return len(self._switches)
+
+    async def load(self) -> int:
+        """Rebuild the index from the switches table"""
+        rows = await self.shards.scatter(
+            select(
+                DeadmanSwitch.id,
+                DeadmanSwitch.next_check_in_due,
+                DeadmanSwitch.grace_period
+            ).where(
+                DeadmanSwitch.is_enabled == True,
+                DeadmanSwitch.status == SwitchStatus.ACTIVE,
+                DeadmanSwitch.next_check_in_due.is_not(None)
+            )
+        )
+
+        switches, buckets = {}, {}
+        for row in rows:
+            minute = _minute(row.next_check_in_due + row.grace_period)
+            switches[row.id] = (minute, row.grace_period)
+            buckets[minute] = buckets.get(minute, 0) + 1
+        self._switches, self._buckets = switches, buckets
+        self.loaded_at = datetime.utcnow()
+        metrics.set("deadline_index_size", len(switches))
+        return len(switches)
+
+    async def refresh_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.load()
+            except Exception:
+                logger.exception("Deadline index refresh failed")
+
+    def track(self, switch: DeadmanSwitch) -> None:
+        """Re-index a switch after it was created, edited or checked in"""
+        if not switch.is_enabled or switch.status != SwitchStatus.ACTIVE or switch.next_check_in_due is None:
+            self.discard(switch.id)
+            return
+        self._place(switch.id, _minute(switch.next_check_in_due + switch.grace_period), switch.grace_period)
+
+    def checked_in(self, switch_id: int, next_check_in_due: datetime) -> None:
+        """Move a tracked switch after a buffered check-in, never backwards"""
+        entry = self._switches.get(switch_id)
+        if entry is None:
+            return
+        minute = _minute(next_check_in_due + entry[1])
+        if minute > entry[0]:
+            self._place(switch_id, minute, entry[1])
+
+    def discard(self, switch_id: int) -> None:
+        entry = self._switches.pop(switch_id, None)
+        if entry is not None:
+            self._decrement(entry[0])
+
+    def _place(self, switch_id: int, minute: int, grace: timedelta) -> None:
+        self.discard(switch_id)
+        self._switches[switch_id] = (minute, grace)
+        self._buckets[minute] = self._buckets.get(minute, 0) + 1
+
+    def _decrement(self, minute: int) -> None:
+        count = self._buckets[minute] - 1
+        if count:
+            self._buckets[minute] = count
+        else:
+            del self._buckets[minute]
+
+    def histogram(self, hours: int, bucket_minutes: int, start: Optional[datetime] = None) -> Tuple[int, List[int]]:
+        """Return (overdue count, per-bucket deadline counts) for the next ``hours``"""
+        first = _minute(start or datetime.utcnow())
+        overdue = sum(count for minute, count in self._buckets.items() if minute < first)
+        counts = [0] * -(-hours * 60 // bucket_minutes)
+        end = first + hours * 60
+        if end - first < len(self._buckets):
+            for minute in range(first, end):
+                count = self._buckets.get(minute)
+                if count:
+                    counts[(minute - first) // bucket_minutes] += count
+        else:
+            for minute, count in self._buckets.items():
+                if first <= minute < end:
+                    counts[(minute - first) // bucket_minutes] += count
+        return overdue, counts
+
+
+deadline_index = DeadlineIndex()
@@ -0,0 +1,192 @@
+"""
+Heartbeat Ingestion for Machine Agents
+"""
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import select
+
+from .auth import SECRET_KEY
+from .cache import TTLCache
+from .checkins import check_in_buffer
+from .metrics import metrics
+from .models import DeadmanSwitch
+from .shards import ShardRouter, shard_router
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+HEARTBEAT_INDEX_TTL_SECONDS = int(os.getenv("HEARTBEAT_INDEX_TTL_SECONDS", 300))
+
+# Router
+router = APIRouter()
+
+
+class HeartbeatTarget(NamedTuple):
+    switch_id: int
+    user_id: int
+    is_enabled: bool
+
+
+def generate_heartbeat_token() -> Tuple[str, str]:
+    """Return a new (token, token_hash) pair; only the hash is stored"""
+    token = secrets.token_urlsafe(32)
+    return token, hash_heartbeat_token(token)
+
+
+def hash_heartbeat_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+@lru_cache(maxsize=65536)
+def heartbeat_packet_key(token_hash: str) -> str:
+    """Key agents sign raw heartbeat packets with, issued alongside the token.
+
+    Derived from the stored hash with SECRET_KEY, so a leaked database
+    alone is not enough to forge packets.
+    """
+    return hmac.new(SECRET_KEY.encode(), f"heartbeat-packet:{token_hash}".encode(), hashlib.sha256).hexdigest()
+
+
+class HeartbeatIndex:
+    """In-memory map of token hash -> switch, so heartbeats skip the database.
+
+    Every worker reloads the whole index each ``ttl / 2`` seconds, so changes
+    made by other workers (disabling, rotating or deleting) are picked up
+    within that window; the worker that makes a change invalidates its own
+    entry immediately.
+    Tokens are looked up on every shard.
+    """
+
+    def __init__(self, ttl: float = HEARTBEAT_INDEX_TTL_SECONDS, shards: ShardRouter = shard_router):
+        self.ttl = ttl
+        self.shards = shards
+        self._by_hash: Dict[str, Tuple[float, HeartbeatTarget]] = {}
+        self._hash_by_switch: Dict[int, str] = {}
+        self._misses = TTLCache("heartbeat-misses", ttl=60, maxsize=100000)
+
+    async def load(self) -> int:
+        """Rebuild the index from every switch that has a heartbeat token"""
+        rows = await self.shards.scatter(
+            select(
+                DeadmanSwitch.id,
+                DeadmanSwitch.user_id,
+                DeadmanSwitch.is_enabled,
+                DeadmanSwitch.heartbeat_token_hash
+            ).where(DeadmanSwitch.heartbeat_token_hash.is_not(None))
+        )
+        expires = time.monotonic() + self.ttl
+        by_hash: Dict[str, Tuple[float, HeartbeatTarget]] = {}
+        hash_by_switch: Dict[int, str] = {}
+        for row in rows:
+            by_hash[row.heartbeat_token_hash] = (expires, HeartbeatTarget(row.id, row.user_id, bool(row.is_enabled)))
+            hash_by_switch[row.id] = row.heartbeat_token_hash
+        # Replace rather than merge, so rotated and deleted tokens drop out
+        self._by_hash = by_hash
+        self._hash_by_switch = hash_by_switch
+        metrics.set("heartbeat_index_size", len(self._by_hash))
+        return len(rows)
+
+    def store(self, token_hash: str, target: HeartbeatTarget) -> None:
+        """Map a token hash to its switch, replacing the switch's previous token"""
+        old_hash = self._hash_by_switch.get(target.switch_id)
+        if old_hash and old_hash != token_hash:
+            self._by_hash.pop(old_hash, None)
+        self._by_hash[token_hash] = (time.monotonic() + self.ttl, target)
+        self._hash_by_switch[target.switch_id] = token_hash
+
+    def lookup_switch(self, switch_id: int) -> Optional[Tuple[str, HeartbeatTarget]]:
+        """Memory-only lookup of (token_hash, target) by switch id"""
+        token_hash = self._hash_by_switch.get(switch_id)
+        if token_hash is None:
+            return None
+        entry = self._by_hash.get(token_hash)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return token_hash, entry[1]
+
+    async def refresh_forever(self) -> None:
+        """Reload the whole index well before entries go stale"""
+        while True:
+            await asyncio.sleep(self.ttl / 2)
+            try:
+                await self.load()
+            except Exception:
+                logger.exception("Heartbeat index refresh failed")
+
+    def invalidate(self, switch_id: int) -> None:
+        """Forget a switch after it was changed, rotated or deleted"""
+        token_hash = self._hash_by_switch.pop(switch_id, None)
+        if token_hash:
+            self._by_hash.pop(token_hash, None)
+
+    def lookup(self, token_hash: str) -> Optional[HeartbeatTarget]:
+        """Memory-only lookup; None if unknown or stale"""
+        entry = self._by_hash.get(token_hash)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+
+    async def resolve(self, token: str) -> Optional[HeartbeatTarget]:
+        token_hash = hash_heartbeat_token(token)
+        target = self.lookup(token_hash)
+        if target is not None:
+            return target
+        # Unknown tokens are remembered briefly so guessing cannot hammer the DB
+        if await self._misses.get(token_hash):
+            return None
+
+        rows = await self.shards.scatter(
+            select(
+                DeadmanSwitch.id,
+                DeadmanSwitch.user_id,
+                DeadmanSwitch.is_enabled
+            ).where(DeadmanSwitch.heartbeat_token_hash == token_hash)
+        )
+        row = rows[0] if rows else None
+        if row is None:
+            await self._misses.set(token_hash, "1")
+            return None
+        target = HeartbeatTarget(row.id, row.user_id, bool(row.is_enabled))
+        self.store(token_hash, target)
+        return target
+
+
+heartbeat_index = HeartbeatIndex()
+
+
+async def submit_heartbeat(target: HeartbeatTarget, check_in_time: Optional[datetime] = None) -> None:
+    """Feed a heartbeat into the buffered check-in write path"""
+    await check_in_buffer.submit_entry({
+        "switch_id": target.switch_id,
+        "user_id": target.user_id,
+        "time": (check_in_time or datetime.utcnow()).isoformat(),
+        "user_agent": "heartbeat",
+    })
+    metrics.inc("heartbeats_accepted_total")
+
+
+# Routes
+@router.api_route("/{switch_token}", methods=["GET", "POST"], response_class=PlainTextResponse)
+async def heartbeat(switch_token: str):
+    """Record a check-in for the switch owning this token; no session required"""
+    target = await heartbeat_index.resolve(switch_token)
+    if target is None:
+        metrics.inc("heartbeats_rejected_total", reason="unknown")
+        raise HTTPException(status_code=404, detail="Unknown heartbeat token")
+    if not target.is_enabled:
+        metrics.inc("heartbeats_rejected_total", reason="disabled")
+        raise HTTPException(status_code=400, detail="Switch is disabled")
+
+    await submit_heartbeat(target)
+    return "OK"
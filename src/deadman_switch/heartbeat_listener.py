@@ -0,0 +1,215 @@
+"""
+Raw UDP/TCP Heartbeat Listener
+
+Packets are single ASCII lines (newline-terminated over TCP):
+
+    <switch_id>:<unix_timestamp>:<nonce>:<signature>
+
+where ``signature`` is the hex HMAC-SHA256 of ``<switch_id>:<unix_timestamp>:<nonce>``
+keyed with the switch's packet key, issued with its heartbeat token. Packets are
+validated entirely in memory (token index, clock skew window, nonce cache)
+and accepted heartbeats are batched into the journaled check-in buffer.
+"""
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from .cache import TTLCache
+from .checkins import check_in_buffer
+from .heartbeat import heartbeat_index, heartbeat_packet_key
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+HEARTBEAT_LISTEN_HOST = os.getenv("HEARTBEAT_LISTEN_HOST", "0.0.0.0")
+HEARTBEAT_UDP_PORT = int(os.getenv("HEARTBEAT_UDP_PORT", 0))  # 0 disables
+HEARTBEAT_TCP_PORT = int(os.getenv("HEARTBEAT_TCP_PORT", 0))  # 0 disables
+HEARTBEAT_MAX_SKEW_SECONDS = int(os.getenv("HEARTBEAT_MAX_SKEW_SECONDS", 30))
+HEARTBEAT_BATCH_INTERVAL_MS = int(os.getenv("HEARTBEAT_BATCH_INTERVAL_MS", 50))
+
+MAX_PACKET_BYTES = 256
+
+
+def sign_heartbeat(switch_id: int, packet_key: str, timestamp: Optional[int] = None, nonce: Optional[str] = None) -> bytes:
+    """Build a signed heartbeat packet (used by agents and for local testing)"""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    nonce = nonce or secrets.token_hex(8)
+    message = f"{switch_id}:{timestamp}:{nonce}"
+    signature = hmac.new(packet_key.encode(), message.encode(), hashlib.sha256).hexdigest()
+    return f"{message}:{signature}\n".encode()
+
+
+class HeartbeatListener:
+    """Validates heartbeat packets and feeds them to the check-in buffer in batches"""
+
+    def __init__(
+        self,
+        host: str = HEARTBEAT_LISTEN_HOST,
+        udp_port: int = HEARTBEAT_UDP_PORT,
+        tcp_port: int = HEARTBEAT_TCP_PORT,
+        max_skew: int = HEARTBEAT_MAX_SKEW_SECONDS,
+        batch_interval: float = HEARTBEAT_BATCH_INTERVAL_MS / 1000,
+        index=heartbeat_index,
+        buffer=check_in_buffer
+    ):
+        self.host = host
+        self.udp_port = udp_port
+        self.tcp_port = tcp_port
+        self.max_skew = max_skew
+        self.batch_interval = batch_interval
+        self.index = index
+        self.buffer = buffer
+        self._nonces = TTLCache("heartbeat-nonces", ttl=2 * max_skew, maxsize=1000000)
+        self._batch: Dict[int, tuple] = {}  # switch_id -> (target, timestamp), latest wins
+        self._transport = None
+        self._server = None
+        self._tasks = []
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.udp_port or self.tcp_port)
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self.udp_port:
+            self._transport, _ = await loop.create_datagram_endpoint(
+                lambda: _DatagramProtocol(self), local_addr=(self.host, self.udp_port)
+            )
+            self.udp_port = self._transport.get_extra_info("sockname")[1]
+        if self.tcp_port:
+            self._server = await asyncio.start_server(self._handle_stream, self.host, self.tcp_port)
+            self.tcp_port = self._server.sockets[0].getsockname()[1]
+        self._tasks = [asyncio.create_task(self._drain_forever())]
+        logger.info("Heartbeat listener on %s (udp=%s, tcp=%s)", self.host, self.udp_port, self.tcp_port)
+
+    async def stop(self) -> None:
+        if self._transport is not None:
+            self._transport.close()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.drain()
+
+    async def accept(self, packet: bytes) -> Optional[str]:
+        """Validate one packet; returns None if accepted, else the rejection reason"""
+        reason = await self._validate(packet)
+        metrics.inc("heartbeat_packets_total", outcome=reason or "accepted")
+        return reason
+
+    async def _validate(self, packet: bytes) -> Optional[str]:
+        if len(packet) > MAX_PACKET_BYTES:
+            return "oversized"
+        try:
+            switch_id, timestamp, nonce, signature = packet.decode("ascii").strip().split(":")
+            switch_id, timestamp = int(switch_id), int(timestamp)
+        except ValueError:
+            return "malformed"
+
+        if abs(time.time() - timestamp) > self.max_skew:
+            return "stale"
+        entry = self.index.lookup_switch(switch_id)
+        if entry is None:
+            return "unknown"
+        token_hash, target = entry
+        message = f"{switch_id}:{timestamp}:{nonce}".encode()
+        expected = hmac.new(heartbeat_packet_key(token_hash).encode(), message, hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(expected, signature):
+            return "bad-signature"
+        if not target.is_enabled:
+            return "disabled"
+        if not await self._nonces.add(f"{switch_id}:{nonce}"):
+            return "replayed"
+
+        current = self._batch.get(switch_id)
+        if current is None or timestamp >= current[1]:
+            self._batch[switch_id] = (target, timestamp)
+        return None
+
+    async def drain(self) -> int:
+        """Submit the current batch; repeat heartbeats per switch collapse to one check-in"""
+        if not self._batch:
+            return 0
+        batch, self._batch = self._batch, {}
+        entries = [
+            {
+                "switch_id": target.switch_id,
+                "user_id": target.user_id,
+                "time": datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None).isoformat(),
+                "user_agent": "heartbeat-packet",
+            }
+            for target, timestamp in batch.values()
+        ]
+        await self.buffer.submit_entries(entries)
+        return len(entries)
+
+    async def _drain_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.batch_interval)
+            try:
+                await self.drain()
+            except Exception:
+                logger.exception("Heartbeat batch submit failed")
+
+    async def _handle_stream(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                reason = await self.accept(line)
+                writer.write(b"OK\n" if reason is None else f"ERR {reason}\n".encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, listener: HeartbeatListener):
+        self.listener = listener
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        # Fire and forget: UDP senders get no reply
+        asyncio.ensure_future(self.listener.accept(data))
+
+
+heartbeat_listener = HeartbeatListener()
+
+
+async def run_standalone() -> None:
+    """Run the listener in its own process, sharing the journal directory with the app"""
+    await check_in_buffer.start()
+    await heartbeat_index.load()
+    await heartbeat_listener.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await heartbeat_listener.stop()
+        await check_in_buffer.stop()
+
+
+def main():
+    """Entry point for a dedicated heartbeat listener process"""
+    logging.basicConfig(level=logging.INFO)
+    if not heartbeat_listener.enabled:
+        raise SystemExit("Set HEARTBEAT_UDP_PORT and/or HEARTBEAT_TCP_PORT")
+    try:
+        asyncio.run(run_standalone())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
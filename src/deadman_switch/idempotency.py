@@ -0,0 +1,86 @@
+"""
+Idempotency-Key Support for Retried API Writes
+"""
+import hashlib
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+from pydantic import BaseModel
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .cache import create_cache
+from .metrics import metrics
+from .models import IdempotencyKey
+
+# Configuration
+IDEMPOTENCY_CACHE_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_CACHE_TTL_SECONDS", 3600))
+IDEMPOTENCY_RETENTION_HOURS = int(os.getenv("IDEMPOTENCY_RETENTION_HOURS", 72))
+
+# Hot keys are answered from here without touching the database
+response_cache = create_cache("idempotency", IDEMPOTENCY_CACHE_TTL_SECONDS)
+
+
+def scoped_key(request: Request, user_id: int, idempotency_key: str) -> str:
+    """Client keys are only unique per user and route"""
+    raw = f"{user_id}:{request.method}:{request.url.path}:{idempotency_key}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _replay(status_code: int, body: str) -> Response:
+    metrics.inc("idempotency_replays_total")
+    return Response(
+        content=body,
+        status_code=status_code,
+        media_type="application/json",
+        headers={"Idempotent-Replayed": "true"}
+    )
+
+
+async def lookup(db: AsyncSession, key_hash: str) -> Optional[Response]:
+    """Return the stored response for a key, checking the cache before the table"""
+    cached = await response_cache.get(key_hash)
+    if cached is not None:
+        status_code, _, body = cached.partition(":")
+        return _replay(int(status_code), body)
+
+    result = await db.execute(
+        select(IdempotencyKey.status_code, IdempotencyKey.response_body).where(
+            IdempotencyKey.key_hash == key_hash,
+            IdempotencyKey.expires_at > datetime.utcnow()
+        )
+    )
+    row = result.first()
+    if row is None:
+        return None
+    await response_cache.set(key_hash, f"{row.status_code}:{row.response_body}")
+    return _replay(row.status_code, row.response_body)
+
+
+def record(db: AsyncSession, key_hash: str, response: BaseModel, status_code: int = 200) -> str:
+    """Stage the response in the caller's transaction; returns the serialized body"""
+    body = response.model_dump_json()
+    db.add(IdempotencyKey(
+        key_hash=key_hash,
+        status_code=status_code,
+        response_body=body,
+        expires_at=datetime.utcnow() + timedelta(hours=IDEMPOTENCY_RETENTION_HOURS)
+    ))
+    return body
+
+
+async def remember(key_hash: str, body: str, status_code: int = 200) -> None:
+    """Cache a committed response"""
+    await response_cache.set(key_hash, f"{status_code}:{body}")
+
+
+async def purge_expired(db: AsyncSession) -> int:
+    """Delete persisted keys past their retention window"""
+    result = await db.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.expires_at <= datetime.utcnow())
+    )
+    await db.commit()
+    return result.rowcount
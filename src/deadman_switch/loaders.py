@@ -0,0 +1,42 @@
+"""
+Relationship Loading Strategies for Views
+"""
+import os
+from typing import Tuple
+
+from sqlalchemy.orm import joinedload, raiseload
+
+from .models import CheckIn, DeadmanSwitch, Notification
+
+# Configuration
+# Raise on any relationship a view did not declare instead of lazy loading it;
+# turn on in development and checks (see check_lazy_loads.py)
+LAZY_LOAD_RAISE = os.getenv("LAZY_LOAD_RAISE", "false").lower() == "true"
+
+# Relationships each template renders, keyed by view. Many-to-one targets
+# are joined into the same query (joinedload); collections would each take
+# one extra SELECT ... IN (selectinload). Views that render no relationships
+# are still listed so LAZY_LOAD_RAISE guards them.
+VIEW_LOADERS = {
+    "admin.dashboard.triggered_switches": (joinedload(DeadmanSwitch.user),),
+    "admin.dashboard.recent_check_ins": (joinedload(CheckIn.user), joinedload(CheckIn.deadman_switch)),
+    "admin.switches": (joinedload(DeadmanSwitch.user),),
+    "admin.notifications": (joinedload(Notification.deadman_switch).joinedload(DeadmanSwitch.user),),
+    "client.switches": (),
+    "client.check_ins": (),
+    "client.switch_detail": (),
+    "client.contacts": (),
+}
+
+
+def view_options(view: str) -> Tuple:
+    """Loader options for a view's query: ``select(...).options(*view_options(view))``.
+
+    With LAZY_LOAD_RAISE every other relationship of the loaded rows, and
+    of the objects at the end of each declared path, raises on access.
+    """
+    options = VIEW_LOADERS[view]
+    if not LAZY_LOAD_RAISE:
+        return options
+    return tuple(option.raiseload("*") for option in options) + (raiseload("*"),)
+
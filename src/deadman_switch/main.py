@@ -1,29 +1,120 @@
 """
 Deadman Switch Application - Main Entry Point
 """
+import time
+
+_import_started = time.perf_counter()
+
+import asyncio
 import os
 import uvicorn
 from fastapi import FastAPI, Request
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
 
 from .database import init_db
+from . import cluster, idempotency
+from .activity import ACTIVITY_RECONCILER_ENABLED, ActivityReconciler, activity_reconciler
+from .checkins import check_in_buffer
+from .escalation import TRIGGER_MONITOR_ENABLED, escalation_scheduler_for
+from .forecast import deadline_index
+from .heartbeat import heartbeat_index, router as heartbeat_router
+from .heartbeat_listener import heartbeat_listener
 from .auth import router as auth_router
 from .admin import router as admin_router
 from .client import router as client_router
 from .api import router as api_router
+from .metrics import router as metrics_router
+from .notifications import NOTIFICATION_DISPATCHER_ENABLED, NotificationDispatcher, notification_dispatcher
+from .outbox import OUTBOX_RELAY_ENABLED, OutboxRelay, outbox_relay
+from .webhooks import webhook_transport
+from .assets import STATIC_DIR, PrecompressedStaticFiles, asset_manifest
+from .compression import CompressionMiddleware
+from .ratelimit import RateLimitMiddleware
+from .settings import settings_service
+from .shards import SHARD_DIRECTORY_POLL_SECONDS, ShardMovingError, shard_router
+from .startup import startup_timer
+from .templating import templates
+
+
+async def prepare_database() -> None:
+    """One-time startup work; the cluster master runs it before forking workers"""
+    for shard in shard_router.shards:
+        await init_db(shard.engine)
+        async with shard.session_factory() as db:
+            await idempotency.purge_expired(db)
+
+
+async def run_leader_duties() -> None:
+    """Loops that must run once per host, not once per worker; one set per shard"""
+    tasks = []
+    schedulers = [escalation_scheduler_for(shard) for shard in shard_router.shards]
+    for shard in shard_router.shards:
+        if NOTIFICATION_DISPATCHER_ENABLED:
+            dispatcher = notification_dispatcher if shard.index == 0 else NotificationDispatcher(session_factory=shard.session_factory)
+            tasks.append(asyncio.create_task(dispatcher.run_forever()))
+        if TRIGGER_MONITOR_ENABLED:
+            scheduler = schedulers[shard.index]
+            await scheduler.load()
+            tasks.append(asyncio.create_task(scheduler.run_forever()))
+        if OUTBOX_RELAY_ENABLED:
+            relay = outbox_relay if shard.index == 0 else OutboxRelay(session_factory=shard.session_factory)
+            tasks.append(asyncio.create_task(relay.run_forever()))
+        if ACTIVITY_RECONCILER_ENABLED:
+            reconciler = activity_reconciler if shard.index == 0 else ActivityReconciler(session_factory=shard.session_factory)
+            tasks.append(asyncio.create_task(reconciler.run_forever()))
+    if heartbeat_listener.enabled:
+        await heartbeat_listener.start()
+    try:
+        if tasks:
+            await asyncio.gather(*tasks)
+        else:
+            await asyncio.Future()  # hold leadership until cancelled
+    finally:
+        for task in tasks:
+            task.cancel()
+        for scheduler in schedulers:
+            await scheduler.stop()
+        if heartbeat_listener.enabled:
+            await heartbeat_listener.stop()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager"""
     # Startup
-    await init_db()
+    with startup_timer.phase("database"):
+        if not cluster.is_cluster_worker():
+            await prepare_database()
+        # Heartbeats always use the buffer; user check-ins only with CHECKIN_WRITE_BEHIND.
+        # Starting it replays any journal left by a crash before accepting traffic.
+        await check_in_buffer.start()
+    with startup_timer.phase("indexes"):
+        await shard_router.load()
+        await heartbeat_index.load()
+        await deadline_index.load()
+        await settings_service.load()
+    with startup_timer.phase("templates"):
+        asset_manifest.load()
+        templates.warm_up()
+    startup_timer.report()
+    # In-memory indexes live in every worker; the schedulers run in one
+    background = [
+        asyncio.create_task(deadline_index.refresh_forever()),
+        asyncio.create_task(heartbeat_index.refresh_forever()),
+        asyncio.create_task(settings_service.refresh_forever()),
+        asyncio.create_task(shard_router.refresh_forever()),
+        asyncio.create_task(cluster.leader_lock.lead(run_leader_duties))
+    ]
     yield
     # Shutdown
-    pass
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+    await webhook_transport.aclose()
+    await check_in_buffer.stop()
+    await shard_router.dispose()
 
 
 # Create FastAPI app
@@ -43,17 +134,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mount static files
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Reject abusive login/check-in traffic before it reaches the DB or bcrypt
+app.add_middleware(RateLimitMiddleware)
+
+# Compress HTML and JSON responses (outermost, so it sees the final body)
+app.add_middleware(CompressionMiddleware)
+
+# Mount static files; hashed, precompressed copies come from build_static.py
+app.mount("/static", PrecompressedStaticFiles(directory=STATIC_DIR), name="static")
+
+
+@app.exception_handler(ShardMovingError)
+async def shard_moving_handler(request: Request, exc: ShardMovingError):
+    """A user's rows are mid-move between databases; ask the client to retry"""
+    message = "Your data is being moved; please retry shortly"
+    headers = {"Retry-After": str(max(1, round(SHARD_DIRECTORY_POLL_SECONDS)))}
+    path = request.url.path
+    if "/api/" in path or path.startswith("/hb/"):
+        return JSONResponse(status_code=503, content={"detail": message}, headers=headers)
+    return templates.TemplateResponse(
+        "unavailable.html", {"request": request, "message": message}, status_code=503, headers=headers
+    )
 
-# Templates
-templates = Jinja2Templates(directory="templates")
 
 # Include routers
 app.include_router(auth_router, prefix="/auth", tags=["authentication"])
 app.include_router(admin_router, prefix="/admin", tags=["admin"])
 app.include_router(client_router, prefix="/client", tags=["client"])
 app.include_router(api_router, prefix="/api/v1", tags=["api"])
+app.include_router(heartbeat_router, prefix="/hb", tags=["heartbeat"])
+app.include_router(metrics_router, tags=["metrics"])
 
 
 @app.get("/")
@@ -68,10 +178,17 @@ async def health_check():
     return {"status": "healthy", "version": "0.1.0"}
 
 
+startup_timer.record("import", time.perf_counter() - _import_started)
+
+
 def main():
     """Main entry point for the application"""
     port = int(os.getenv("PORT", 8000))
     host = os.getenv("HOST", "0.0.0.0")
+
+    if cluster.SERVER_MODE == "cluster":
+        cluster.serve("deadman_switch.main:app", host, port, prepare=prepare_database)
+        return
     
     uvicorn.run(
         "deadman_switch.main:app",
@@ -0,0 +1,74 @@
+"""
+In-process Metrics Registry
+"""
+import hmac
+import os
+import threading
+from collections import defaultdict
+from typing import Dict, Tuple
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+# Configuration
+# Bearer token scrapers must send; /metrics is not served while unset
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Router
+router = APIRouter()
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+class Metrics:
+    """Counters and gauges rendered in Prometheus text format"""
+
+    def __init__(self):
+        self._counters: Dict[str, Dict[LabelSet, float]] = defaultdict(dict)
+        self._gauges: Dict[str, Dict[LabelSet, float]] = defaultdict(dict)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _labels(labels: dict) -> LabelSet:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """Increment a counter"""
+        key = self._labels(labels)
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        """Set a gauge"""
+        with self._lock:
+            self._gauges[name][self._labels(labels)] = value
+
+    def get(self, name: str, **labels) -> float:
+        key = self._labels(labels)
+        series = self._counters.get(name) or self._gauges.get(name) or {}
+        return series.get(key, 0)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for kind, families in (("counter", self._counters), ("gauge", self._gauges)):
+                for name in sorted(families):
+                    lines.append(f"# TYPE {name} {kind}")
+                    for labels, value in families[name].items():
+                        label_str = ",".join(f'{k}="{v}"' for k, v in labels)
+                        lines.append(f"{name}{{{label_str}}} {value}" if label_str else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint(request: Request):
+    """Prometheus scrape endpoint, opt-in through METRICS_TOKEN"""
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(request.headers.get("authorization", ""), f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    return metrics.render()
@@ -3,7 +3,7 @@ Database Models for Deadman Switch Application
 """
 from datetime import datetime, timedelta
 from enum import Enum
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text, Interval
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text, Interval, Index, Float
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -27,6 +27,14 @@ class NotificationStatus(str, Enum):
     PENDING = "pending"
     SENT = "sent"
     FAILED = "failed"
+    DIGESTED = "digested"  # folded into a NotificationDigest
+    SENDING = "sending"  # claimed by a dispatcher; delivery in flight
+    DISCARDED = "discarded"  # dead letter dropped by an admin
+
+
+class ShardState(str, Enum):
+    ACTIVE = "active"
+    MOVING = "moving"  # being copied to another shard; requests get a 503
 
 
 class User(Base):
@@ -47,10 +55,15 @@ class User(Base):
     # Relationships
     deadman_switches = relationship("DeadmanSwitch", back_populates="user", cascade="all, delete-orphan")
     check_ins = relationship("CheckIn", back_populates="user", cascade="all, delete-orphan")
+    devices = relationship("Device", back_populates="user", cascade="all, delete-orphan")
 
 
 class DeadmanSwitch(Base):
     __tablename__ = "deadman_switches"
+    __table_args__ = (
+        Index("ix_deadman_switches_user_id_created_at", "user_id", "created_at"),  # a user's switch list
+        Index("ix_deadman_switches_status_next_check_in_due", "status", "next_check_in_due"),  # trigger monitor
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -65,6 +78,18 @@ class DeadmanSwitch(Base):
     last_check_in = Column(DateTime(timezone=True))
     next_check_in_due = Column(DateTime(timezone=True))
     triggered_at = Column(DateTime(timezone=True))
+    heartbeat_token_hash = Column(String(64), unique=True, index=True)  # sha256 of the agent heartbeat token
+    escalation_delay = Column(Interval, default=timedelta(hours=1))  # Wait before notifying the next priority level
+    escalation_wave = Column(Integer, default=0, server_default="0")  # Priority levels notified since the trigger
+    acknowledged_at = Column(DateTime(timezone=True))  # A contact took over; stops further waves
+    webhook_url = Column(String(500))  # Also POSTed to when the switch triggers
+    # Running check-in regularity statistics (see regularity.py), updated per check-in
+    check_in_samples = Column(Integer, nullable=False, default=0, server_default="0")  # Gaps observed
+    gap_mean = Column(Float, nullable=False, default=0.0, server_default="0")  # Seconds between check-ins
+    gap_m2 = Column(Float, nullable=False, default=0.0, server_default="0")  # Welford sum of squared deviations
+    lateness_mean = Column(Float, nullable=False, default=0.0, server_default="0")  # Past the due date, in intervals
+    lateness_m2 = Column(Float, nullable=False, default=0.0, server_default="0")
+    late_check_ins = Column(Integer, nullable=False, default=0, server_default="0")  # Landed in the grace period
     
     # Relationships
     user = relationship("User", back_populates="deadman_switches")
@@ -75,6 +100,11 @@ class DeadmanSwitch(Base):
 
 class CheckIn(Base):
     __tablename__ = "check_ins"
+    __table_args__ = (
+        Index("ix_check_ins_deadman_switch_id_check_in_time", "deadman_switch_id", "check_in_time"),
+        Index("ix_check_ins_user_id_check_in_time", "user_id", "check_in_time"),
+        Index("ix_check_ins_check_in_time", "check_in_time"),  # admin recent activity
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -90,8 +120,26 @@ class CheckIn(Base):
     deadman_switch = relationship("DeadmanSwitch", back_populates="check_ins")
 
 
+class Device(Base):
+    __tablename__ = "devices"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    name = Column(String(255), nullable=False)
+    secret = Column(String(64), nullable=False)  # HMAC key for device-signed offline check-ins
+    last_sequence = Column(Integer, default=0, nullable=False)  # highest accepted sequence number
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_sync_at = Column(DateTime(timezone=True))
+    
+    # Relationships
+    user = relationship("User", back_populates="devices")
+
+
 class EmergencyContact(Base):
     __tablename__ = "emergency_contacts"
+    __table_args__ = (
+        Index("ix_emergency_contacts_deadman_switch_id_priority", "deadman_switch_id", "priority"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     deadman_switch_id = Column(Integer, ForeignKey("deadman_switches.id"), nullable=False)
@@ -100,6 +148,7 @@ class EmergencyContact(Base):
     phone = Column(String(20))
     contact_relationship = Column(String(100))  # e.g., "spouse", "friend", "lawyer"
     priority = Column(Integer, default=1)  # 1 = highest priority
+    webhook_url = Column(String(500))
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
@@ -109,11 +158,18 @@ class EmergencyContact(Base):
 
 class Notification(Base):
     __tablename__ = "notifications"
+    __table_args__ = (
+        Index("ix_notifications_status_scheduled_for", "status", "scheduled_for"),  # dispatcher poll
+        Index("ix_notifications_deadman_switch_id", "deadman_switch_id"),
+        Index("ix_notifications_created_at", "created_at"),  # admin log
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     deadman_switch_id = Column(Integer, ForeignKey("deadman_switches.id"), nullable=False)
-    recipient_email = Column(String(255), nullable=False)
+    recipient_email = Column(String(255))
     recipient_phone = Column(String(20))
+    webhook_url = Column(String(500))
+    transport = Column(String(20), default="email")  # "email" or "webhook"
     subject = Column(String(500))
     message = Column(Text, nullable=False)
     notification_type = Column(String(50))  # "warning", "trigger", "test"
@@ -122,9 +178,34 @@ class Notification(Base):
     sent_at = Column(DateTime(timezone=True))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     error_message = Column(Text)
+    error_class = Column(String(100))  # exception type of the last failed delivery
+    failed_at = Column(DateTime(timezone=True), index=True)
+    replay_count = Column(Integer, default=0, server_default="0")
+    digest_id = Column(Integer, ForeignKey("notification_digests.id"), index=True)
+    claimed_at = Column(DateTime(timezone=True))  # when a dispatcher marked it sending
     
     # Relationships
     deadman_switch = relationship("DeadmanSwitch", back_populates="notifications")
+    digest = relationship("NotificationDigest", back_populates="notifications")
+
+
+class NotificationDigest(Base):
+    __tablename__ = "notification_digests"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    recipient_email = Column(String(255), index=True)
+    webhook_url = Column(String(500))
+    transport = Column(String(20), default="email")
+    subject = Column(String(500))
+    message = Column(Text, nullable=False)
+    notification_count = Column(Integer, nullable=False)  # rows folded in, duplicates included
+    status = Column(String(20), default=NotificationStatus.PENDING)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True))
+    error_message = Column(Text)
+    
+    # Relationships
+    notifications = relationship("Notification", back_populates="digest")
 
 
 class SystemSettings(Base):
@@ -136,3 +217,50 @@ class SystemSettings(Base):
     description = Column(Text)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    key_hash = Column(String(64), unique=True, nullable=False)  # sha256 of user, route and client key
+    status_code = Column(Integer, nullable=False)
+    response_body = Column(Text, nullable=False)  # compact JSON of the original response
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class OutboxEvent(Base):
+    __tablename__ = "outbox_events"
+    
+    id = Column(Integer, primary_key=True, index=True)  # delivery order
+    event_type = Column(String(50), nullable=False)  # e.g. "switch.checked_in", "switch.triggered"
+    switch_id = Column(Integer, nullable=False)  # no FK: events outlive deleted switches
+    payload = Column(Text, nullable=False)  # compact JSON
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    delivered_at = Column(DateTime(timezone=True), index=True)
+
+
+class ShardAssignment(Base):
+    __tablename__ = "shard_directory"  # lives on the primary database only
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    shard = Column(Integer, nullable=False)  # index into the configured databases, 0 = primary
+    state = Column(String(20), nullable=False, default=ShardState.ACTIVE)
+    updated_at = Column(DateTime(timezone=True), nullable=False, index=True)  # set explicitly; workers poll by it
+
+
+class UserActivitySummary(Base):
+    __tablename__ = "user_activity_summary"  # on the user's shard, next to their switches
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    switch_count = Column(Integer, nullable=False, default=0, server_default="0")
+    active_switches = Column(Integer, nullable=False, default=0, server_default="0")
+    triggered_switches = Column(Integer, nullable=False, default=0, server_default="0")
+    paused_switches = Column(Integer, nullable=False, default=0, server_default="0")
+    disabled_switches = Column(Integer, nullable=False, default=0, server_default="0")
+    last_check_in = Column(DateTime(timezone=True))
+    check_ins_24h = Column(Integer, nullable=False, default=0, server_default="0")
+    check_ins_7d = Column(Integer, nullable=False, default=0, server_default="0")
+    reconciled_at = Column(DateTime(timezone=True))  # the windowed counts only shrink here
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
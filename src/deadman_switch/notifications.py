@@ -0,0 +1,286 @@
+"""
+Notification Dispatch with Per-Recipient Digests
+"""
+import asyncio
+import logging
+import os
+import smtplib
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import or_, select, update
+
+from .database import AsyncSessionLocal
+from .metrics import metrics
+from .models import Notification, NotificationDigest, NotificationStatus
+from .webhooks import webhook_transport
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+NOTIFICATION_DISPATCHER_ENABLED = os.getenv("NOTIFICATION_DISPATCHER_ENABLED", "true").lower() == "true"
+NOTIFICATION_TRANSPORT = os.getenv("NOTIFICATION_TRANSPORT", "log")  # "log" or "smtp"
+NOTIFICATION_POLL_SECONDS = float(os.getenv("NOTIFICATION_POLL_SECONDS", 10))
+NOTIFICATION_DIGEST_WINDOW_SECONDS = int(os.getenv("NOTIFICATION_DIGEST_WINDOW_SECONDS", 60))
+NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", 5000))
+# A claimed group not recorded as sent or failed within this long is re-queued;
+# keep it above the slowest transport's retries and timeouts
+NOTIFICATION_SEND_TIMEOUT_SECONDS = float(os.getenv("NOTIFICATION_SEND_TIMEOUT_SECONDS", 300))
+SMTP_HOST = os.getenv("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
+SMTP_USERNAME = os.getenv("SMTP_USERNAME")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_FROM_EMAIL = os.getenv("SMTP_FROM_EMAIL", "noreply@localhost")
+SMTP_FROM_NAME = os.getenv("SMTP_FROM_NAME", "Deadman Switch")
+
+
+class LogTransport:
+    """Writes messages to the log instead of sending them (development default)"""
+
+    async def send(self, recipient: str, subject: str, body: str) -> None:
+        logger.info("Notification to %s: %s\n%s", recipient, subject, body)
+
+
+class SmtpTransport:
+    """Sends email through the configured SMTP relay"""
+
+    def __init__(self, host: str = SMTP_HOST, port: int = SMTP_PORT,
+                 username: Optional[str] = SMTP_USERNAME, password: Optional[str] = SMTP_PASSWORD):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+
+    async def send(self, recipient: str, subject: str, body: str) -> None:
+        message = EmailMessage()
+        message["From"] = f"{SMTP_FROM_NAME} <{SMTP_FROM_EMAIL}>"
+        message["To"] = recipient
+        message["Subject"] = subject
+        message.set_content(body)
+        await asyncio.to_thread(self._send, message)
+
+    def _send(self, message: EmailMessage) -> None:
+        with smtplib.SMTP(self.host, self.port, timeout=30) as smtp:
+            smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            smtp.send_message(message)
+
+
+def create_transport(name: str = NOTIFICATION_TRANSPORT):
+    if name == "smtp":
+        return SmtpTransport()
+    return LogTransport()
+
+
+def _naive_utc(moment: Optional[datetime]) -> Optional[datetime]:
+    if moment is not None and moment.tzinfo is not None:
+        return moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def _address(notification: Notification) -> Tuple[str, str]:
+    """(transport, address) that notifications are grouped by"""
+    if notification.transport == "webhook":
+        return "webhook", notification.webhook_url
+    return "email", notification.recipient_email.strip().lower()
+
+
+def compose_digest(notifications: List[Notification]) -> Tuple[str, str]:
+    """Subject and body for a digest; ``notifications`` are already deduplicated"""
+    subject = f"Deadman Switch: {len(notifications)} notifications"
+    sections = [
+        f"{i}. {n.subject or 'Notification'}\n\n{n.message}"
+        for i, n in enumerate(notifications, start=1)
+    ]
+    body = f"You have {len(notifications)} notifications.\n\n" + "\n\n----------\n\n".join(sections)
+    return subject, body
+
+
+class NotificationDispatcher:
+    """Sends pending notifications, folding each recipient's backlog into one message.
+
+    Pending notifications are grouped by transport and address (email or
+    webhook URL). A group is held until its oldest notification is ``window``
+    seconds old, so a trigger wave lands in a single digest rather than one
+    send per switch. Identical subject/body pairs are sent once.
+
+    Ready groups are claimed (marked ``sending``) in one short transaction,
+    delivered concurrently outside any transaction, and each group's outcome
+    is committed on its own as soon as it is known, so slow transports never
+    hold the database and a crash re-sends only the groups in flight. Claims
+    older than ``send_timeout`` are presumed abandoned and re-queued. Folded
+    rows end up ``digested`` and point at the ``NotificationDigest`` that
+    carried them.
+    """
+
+    def __init__(
+        self,
+        transport=None,
+        webhook=None,
+        window: float = NOTIFICATION_DIGEST_WINDOW_SECONDS,
+        batch_size: int = NOTIFICATION_BATCH_SIZE,
+        poll_interval: float = NOTIFICATION_POLL_SECONDS,
+        send_timeout: float = NOTIFICATION_SEND_TIMEOUT_SECONDS,
+        session_factory=AsyncSessionLocal
+    ):
+        self.transports = {
+            "email": transport or create_transport(),
+            "webhook": webhook or webhook_transport,
+        }
+        self.window = timedelta(seconds=window)
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.send_timeout = timedelta(seconds=send_timeout)
+        self.session_factory = session_factory
+
+    async def dispatch_once(self) -> int:
+        """Send every group whose window has closed; returns transport calls made"""
+        sends = await self._claim(datetime.utcnow())
+        # Recipients are independent; webhook hosts are throttled by the transport
+        await asyncio.gather(*(self._send(*send) for send in sends))
+        return len(sends)
+
+    async def _claim(self, now: datetime) -> list:
+        """Mark ready groups ``sending``; returns (record, notification ids, message) per group"""
+        async with self.session_factory() as db:
+            await self._release_abandoned(db, now)
+            query = (
+                select(Notification)
+                .where(
+                    Notification.status == NotificationStatus.PENDING,
+                    or_(Notification.scheduled_for.is_(None), Notification.scheduled_for <= now)
+                )
+                .order_by(Notification.id)
+                .limit(self.batch_size)
+            )
+            if db.bind.dialect.name == "postgresql":
+                # Dispatchers on other hosts skip rows this one is claiming
+                query = query.with_for_update(skip_locked=True)
+            result = await db.execute(query)
+            groups: Dict[Tuple[str, str], List[Notification]] = defaultdict(list)
+            for notification in result.scalars():
+                groups[_address(notification)].append(notification)
+
+            sends = []
+            for (transport, address), group in groups.items():
+                oldest = min(_naive_utc(n.created_at) or now for n in group)
+                if now - oldest < self.window:
+                    continue
+                record, subject, body = await self._prepare(db, group, now)
+                sends.append((record, [n.id for n in group], (transport, address, subject, body)))
+            await db.commit()
+        return [((type(record), record.id), ids, message) for record, ids, message in sends]
+
+    async def _release_abandoned(self, db, now: datetime) -> None:
+        """Re-queue claims whose dispatcher died before recording a result"""
+        abandoned = (await db.execute(
+            select(Notification.id, Notification.digest_id).where(
+                Notification.status == NotificationStatus.SENDING,
+                Notification.claimed_at <= now - self.send_timeout
+            )
+        )).all()
+        if not abandoned:
+            return
+        digest_ids = {digest_id for _, digest_id in abandoned if digest_id is not None}
+        await db.execute(
+            update(Notification)
+            .where(Notification.id.in_([notification_id for notification_id, _ in abandoned]))
+            .values(status=NotificationStatus.PENDING, digest_id=None, claimed_at=None)
+        )
+        if digest_ids:
+            await db.execute(
+                update(NotificationDigest)
+                .where(NotificationDigest.id.in_(digest_ids))
+                .values(status=NotificationStatus.FAILED, error_message="Delivery interrupted; notifications re-queued")
+            )
+        logger.warning("Re-queued %d notifications abandoned mid-delivery", len(abandoned))
+        metrics.inc("notifications_requeued_total", len(abandoned))
+
+    async def _prepare(self, db, group: List[Notification], now: datetime):
+        """Claim one recipient's group; returns (record to mark, subject, body)"""
+        for notification in group:
+            notification.status = NotificationStatus.SENDING
+            notification.claimed_at = now
+        if len(group) == 1:
+            notification = group[0]
+            return notification, notification.subject or "Deadman Switch", notification.message
+
+        unique: Dict[Tuple[Optional[str], str], Notification] = {}
+        for notification in group:
+            unique.setdefault((notification.subject, notification.message), notification)
+        subject, body = compose_digest(list(unique.values()))
+        digest = NotificationDigest(
+            recipient_email=group[0].recipient_email,
+            webhook_url=group[0].webhook_url,
+            transport=group[0].transport or "email",
+            subject=subject,
+            message=body,
+            notification_count=len(group),
+            status=NotificationStatus.SENDING
+        )
+        db.add(digest)
+        await db.flush()
+        for notification in group:
+            notification.digest_id = digest.id
+        metrics.inc("notifications_folded_total", len(group))
+        metrics.inc("notifications_deduplicated_total", len(group) - len(unique))
+        return digest, subject, body
+
+    async def _send(self, record: Tuple[type, int], notification_ids: List[int], message: tuple) -> None:
+        error = await self._deliver(*message)
+        try:
+            await self._mark(record, notification_ids, error)
+        except Exception:
+            # The claim expires and the group is re-sent
+            logger.exception("Could not record delivery of notifications %s", notification_ids)
+
+    async def _deliver(self, transport: str, recipient: str, subject: str, body: str) -> Optional[Exception]:
+        metrics.inc("notification_transport_calls_total", transport=transport)
+        try:
+            await self.transports[transport].send(recipient, subject, body)
+        except Exception as e:
+            logger.warning("Notification to %s failed: %s", recipient, e)
+            metrics.inc("notification_transport_errors_total", transport=transport)
+            return e
+        return None
+
+    async def _mark(self, record: Tuple[type, int], notification_ids: List[int], error: Optional[Exception]) -> None:
+        """Record one group's outcome in its own transaction"""
+        model, record_id = record
+        now = datetime.utcnow()
+        claimed = Notification.id.in_(notification_ids), Notification.status == NotificationStatus.SENDING
+        async with self.session_factory() as db:
+            if error is None:
+                await db.execute(
+                    update(model).where(model.id == record_id)
+                    .values(status=NotificationStatus.SENT, sent_at=now)
+                )
+                if model is NotificationDigest:
+                    await db.execute(update(Notification).where(*claimed).values(status=NotificationStatus.DIGESTED))
+            else:
+                # Folded rows go to the dead-letter queue too, so they can be replayed individually
+                await db.execute(update(Notification).where(*claimed).values(
+                    status=NotificationStatus.FAILED,
+                    error_message=str(error),
+                    error_class=type(error).__name__,
+                    failed_at=now
+                ))
+                await db.execute(
+                    update(model).where(model.id == record_id)
+                    .values(status=NotificationStatus.FAILED, error_message=str(error))
+                )
+            await db.commit()
+
+    async def run_forever(self) -> None:
+        while True:
+            try:
+                await self.dispatch_once()
+            except Exception:
+                logger.exception("Notification dispatch failed")
+            await asyncio.sleep(self.poll_interval)
+
+
+notification_dispatcher = NotificationDispatcher()
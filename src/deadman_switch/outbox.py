@@ -0,0 +1,234 @@
+"""
+Transactional Outbox for Switch Events
+"""
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .cache import REDIS_URL
+from .database import AsyncSessionLocal
+from .metrics import metrics
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+OUTBOX_RELAY_ENABLED = os.getenv("OUTBOX_RELAY_ENABLED", "true").lower() == "true"
+OUTBOX_BACKEND = os.getenv("OUTBOX_BACKEND", "queue")  # "queue", "redis" or "file"
+OUTBOX_REDIS_STREAM = os.getenv("OUTBOX_REDIS_STREAM", "deadman-switch:events")
+OUTBOX_REDIS_MAXLEN = int(os.getenv("OUTBOX_REDIS_MAXLEN", 100000))
+OUTBOX_FILE_PATH = os.getenv("OUTBOX_FILE_PATH", "./outbox_events.jsonl")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 500))
+OUTBOX_POLL_INTERVAL_MS = int(os.getenv("OUTBOX_POLL_INTERVAL_MS", 500))
+OUTBOX_RETENTION_HOURS = int(os.getenv("OUTBOX_RETENTION_HOURS", 24))
+
+# Event types
+SWITCH_CREATED = "switch.created"
+SWITCH_UPDATED = "switch.updated"
+SWITCH_ENABLED = "switch.enabled"
+SWITCH_DISABLED = "switch.disabled"
+SWITCH_DELETED = "switch.deleted"
+SWITCH_CHECKED_IN = "switch.checked_in"
+SWITCH_TRIGGERED = "switch.triggered"
+SWITCH_ACKNOWLEDGED = "switch.acknowledged"
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Unserializable outbox payload value: {value!r}")
+
+
+def event_row(event_type: str, switch_id: int, **payload) -> dict:
+    """Column values for an outbox row, for Core bulk inserts"""
+    return {
+        "event_type": event_type,
+        "switch_id": switch_id,
+        "payload": json.dumps(payload, separators=(",", ":"), default=_json_default),
+    }
+
+
+def add_event(db: AsyncSession, event_type: str, switch_id: int, **payload) -> OutboxEvent:
+    """Stage an event in the caller's transaction, next to the state change it describes"""
+    event = OutboxEvent(**event_row(event_type, switch_id, **payload))
+    db.add(event)
+    return event
+
+
+def serialize(event) -> dict:
+    return {
+        "id": event.id,
+        "type": event.event_type,
+        "switch_id": event.switch_id,
+        "payload": json.loads(event.payload),
+        "created_at": event.created_at.isoformat() if event.created_at else None,
+    }
+
+
+class QueuePublisher:
+    """Fans events out to in-process subscribers (bounded queues)"""
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self._subscribers: List[asyncio.Queue] = []
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.maxsize)
+        self._subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.remove(queue)
+
+    async def publish(self, events: List[dict]) -> None:
+        for queue in self._subscribers:
+            for event in events:
+                try:
+                    queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    metrics.inc("outbox_subscriber_dropped_total")
+
+
+class RedisStreamPublisher:
+    """Appends events to a Redis stream in one pipelined round trip"""
+
+    def __init__(self, url: str = REDIS_URL, stream: str = OUTBOX_REDIS_STREAM, maxlen: int = OUTBOX_REDIS_MAXLEN):
+        import redis.asyncio as redis
+
+        self.stream = stream
+        self.maxlen = maxlen
+        self._client = redis.from_url(url, decode_responses=True)
+
+    async def publish(self, events: List[dict]) -> None:
+        async with self._client.pipeline(transaction=False) as pipe:
+            for event in events:
+                pipe.xadd(
+                    self.stream,
+                    {"id": event["id"], "type": event["type"], "data": json.dumps(event, separators=(",", ":"))},
+                    maxlen=self.maxlen,
+                    approximate=True
+                )
+            await pipe.execute()
+
+
+class FilePublisher:
+    """Appends events as JSON lines and fsyncs once per batch"""
+
+    def __init__(self, path: str = OUTBOX_FILE_PATH):
+        self.path = path
+
+    async def publish(self, events: List[dict]) -> None:
+        lines = "".join(json.dumps(event, separators=(",", ":")) + "\n" for event in events)
+        await asyncio.to_thread(self._append, lines)
+
+    def _append(self, lines: str) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def create_publisher(backend: str = OUTBOX_BACKEND):
+    if backend == "redis":
+        return RedisStreamPublisher()
+    if backend == "file":
+        return FilePublisher()
+    return QueuePublisher()
+
+
+class OutboxRelay:
+    """Publishes undelivered outbox rows in id order.
+
+    Each batch is published before it is marked delivered with one bulk
+    update, so delivery is at-least-once: consumers should de-duplicate on
+    the event ``id``. Delivered rows are deleted after ``retention``.
+    Run one relay per database.
+    """
+
+    def __init__(
+        self,
+        publisher=None,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        poll_interval: float = OUTBOX_POLL_INTERVAL_MS / 1000,
+        retention: timedelta = timedelta(hours=OUTBOX_RETENTION_HOURS),
+        session_factory=AsyncSessionLocal
+    ):
+        self.publisher = publisher or create_publisher()
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.session_factory = session_factory
+        self._last_compaction: Optional[datetime] = None
+
+    async def relay_once(self) -> int:
+        """Publish one batch; returns the number of events delivered"""
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(OutboxEvent)
+                .where(OutboxEvent.delivered_at.is_(None))
+                .order_by(OutboxEvent.id)
+                .limit(self.batch_size)
+            )
+            events = result.scalars().all()
+            if not events:
+                return 0
+
+            await self.publisher.publish([serialize(event) for event in events])
+            await db.execute(
+                update(OutboxEvent)
+                .where(OutboxEvent.id.in_([event.id for event in events]))
+                .values(delivered_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        metrics.inc("outbox_events_delivered_total", len(events))
+        return len(events)
+
+    async def compact(self) -> int:
+        """Delete delivered events older than the retention window"""
+        cutoff = datetime.utcnow() - self.retention
+        async with self.session_factory() as db:
+            result = await db.execute(
+                delete(OutboxEvent)
+                .where(OutboxEvent.delivered_at < cutoff)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        self._last_compaction = datetime.utcnow()
+        metrics.inc("outbox_events_compacted_total", result.rowcount)
+        return result.rowcount
+
+    async def run_forever(self) -> None:
+        while True:
+            try:
+                # Drain back-to-back while full batches keep coming
+                while await self.relay_once() == self.batch_size:
+                    pass
+                if self._last_compaction is None or datetime.utcnow() - self._last_compaction > timedelta(hours=1):
+                    await self.compact()
+            except Exception:
+                logger.exception("Outbox relay failed")
+                metrics.inc("outbox_relay_errors_total")
+            await asyncio.sleep(self.poll_interval)
+
+
+outbox_relay = OutboxRelay()
+
+
+def main():
+    """Entry point for a dedicated outbox relay process"""
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(outbox_relay.run_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
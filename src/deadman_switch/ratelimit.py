@@ -0,0 +1,297 @@
+"""
+Rate Limiting and Admission Control
+"""
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+from .auth import decode_access_token
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # "memory" or "redis"
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() == "true"
+# Reverse proxies in front of the app, each appending to X-Forwarded-For; the
+# client is the entry added by the outermost one
+RATE_LIMIT_PROXY_HOPS = int(os.getenv("RATE_LIMIT_PROXY_HOPS", 1 if RATE_LIMIT_TRUST_PROXY else 0))
+# Largest login form read to find the username; bigger bodies get a 413
+RATE_LIMIT_MAX_FORM_BYTES = int(os.getenv("RATE_LIMIT_MAX_FORM_BYTES", 4096))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100000))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+class RateLimitPolicy(BaseModel):
+    """Token bucket policy: ``limit`` requests per ``period`` seconds per key"""
+    name: str
+    path: str  # regular expression matched against the full request path
+    methods: List[str] = ["POST"]
+    key: str = "ip"  # "ip", "username" (login form field) or "user" (token subject)
+    limit: int
+    period: float = 60.0
+
+    @property
+    def rate(self) -> float:
+        return self.limit / self.period
+
+
+DEFAULT_POLICIES = [
+    RateLimitPolicy(name="login-ip", path=r"^/auth/(login|api/token)$", key="ip", limit=20),
+    RateLimitPolicy(name="login-username", path=r"^/auth/(login|api/token)$", key="username", limit=5),
+    RateLimitPolicy(name="register-ip", path=r"^/auth/register$", key="ip", limit=10, period=3600),
+    RateLimitPolicy(name="check-in-user", path=r"^/(api/v1|client)/switches/\d+/check-in$", key="user", limit=30),
+]
+
+
+def load_policies() -> List[RateLimitPolicy]:
+    """Policies from RATE_LIMIT_POLICIES (a JSON list) or the defaults"""
+    raw = os.getenv("RATE_LIMIT_POLICIES")
+    if not raw:
+        return list(DEFAULT_POLICIES)
+    return [RateLimitPolicy(**policy) for policy in json.loads(raw)]
+
+
+class MemoryBucketStore:
+    """Per-process token buckets"""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, rate: float, burst: int) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                allowed, retry_after = True, 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                allowed, retry_after = False, (1 - tokens) / rate
+            if len(self._buckets) > self.max_keys:
+                self._evict(now)
+        return allowed, retry_after
+
+    def _evict(self, now: float) -> None:
+        # Buckets idle long enough to have refilled carry no state worth keeping;
+        # if that is not enough, drop the oldest half
+        idle = [k for k, (_, ts) in self._buckets.items() if now - ts > 3600]
+        for key in idle:
+            del self._buckets[key]
+        if len(self._buckets) > self.max_keys:
+            by_age = sorted(self._buckets.items(), key=lambda item: item[1][1])
+            for key, _ in by_age[: len(by_age) // 2]:
+                del self._buckets[key]
+
+
+class RedisBucketStore:
+    """Token buckets shared across workers, updated atomically by a Lua script"""
+
+    SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local burst = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    local allowed = 0
+    local retry_after = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    else
+        retry_after = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return {allowed, tostring(retry_after)}
+    """
+
+    def __init__(self, url: str = REDIS_URL):
+        import redis.asyncio as redis
+
+        self._client = redis.from_url(url)
+        self._script = self._client.register_script(self.SCRIPT)
+        self._fallback = MemoryBucketStore()
+
+    async def take(self, key: str, rate: float, burst: int) -> Tuple[bool, float]:
+        try:
+            allowed, retry_after = await self._script(
+                keys=[f"ratelimit:{key}"], args=[rate, burst, time.time()]
+            )
+            return bool(allowed), float(retry_after)
+        except Exception as e:
+            # Never take the site down with the limiter; degrade to local buckets
+            logger.warning("Redis rate limiter unavailable, using local buckets: %s", e)
+            metrics.inc("ratelimit_backend_errors_total")
+            return await self._fallback.take(key, rate, burst)
+
+
+class RateLimiter:
+    """Matches requests to policies and consults the bucket store"""
+
+    def __init__(self, policies: Optional[List[RateLimitPolicy]] = None, store=None):
+        self.policies = policies if policies is not None else load_policies()
+        self._compiled = [(re.compile(p.path), p) for p in self.policies]
+        if store is None:
+            store = RedisBucketStore() if RATE_LIMIT_BACKEND == "redis" else MemoryBucketStore()
+        self.store = store
+
+    def match(self, method: str, path: str) -> List[RateLimitPolicy]:
+        return [p for pattern, p in self._compiled if method in p.methods and pattern.match(path)]
+
+    async def hit(self, policy: RateLimitPolicy, key_value: str) -> Tuple[bool, float]:
+        allowed, retry_after = await self.store.take(
+            f"{policy.name}:{key_value}", policy.rate, policy.limit
+        )
+        outcome = "allowed" if allowed else "rejected"
+        metrics.inc(f"ratelimit_{outcome}_total", policy=policy.name)
+        return allowed, retry_after
+
+
+class BodyTooLarge(Exception):
+    """A form body the limiter will not buffer"""
+
+
+class RateLimitMiddleware:
+    """ASGI middleware rejecting over-limit requests before routing, DB or bcrypt.
+
+    Policies keyed by ip or user are checked first, so a flood is throttled
+    before any body is read; the login form is then read, up to
+    RATE_LIMIT_MAX_FORM_BYTES, only for the username policies.
+    """
+
+    def __init__(self, app, limiter: Optional[RateLimiter] = None):
+        self.app = app
+        self.limiter = limiter or RateLimiter()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        policies = self.limiter.match(scope["method"], scope["path"])
+        if not policies:
+            await self.app(scope, receive, send)
+            return
+
+        form = None
+        ordered = sorted(policies, key=lambda p: p.key == "username")
+        for policy in ordered:
+            if policy.key == "username" and form is None:
+                try:
+                    body = await _read_body(scope, receive, RATE_LIMIT_MAX_FORM_BYTES)
+                except BodyTooLarge:
+                    metrics.inc("ratelimit_body_too_large_total")
+                    response = JSONResponse({"detail": "Request body too large"}, status_code=413)
+                    await response(scope, receive, send)
+                    return
+                receive = _replay(body, receive)
+                form = _parse_form(scope, body)
+            key_value = self._key_value(policy, scope, form)
+            if key_value is None:
+                continue
+            allowed, retry_after = await self.limiter.hit(policy, key_value)
+            if not allowed:
+                response = JSONResponse(
+                    {"detail": "Too many requests"},
+                    status_code=429,
+                    headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+                )
+                await response(scope, receive, send)
+                return
+
+        await self.app(scope, receive, send)
+
+    def _key_value(self, policy: RateLimitPolicy, scope, form: Optional[dict]) -> Optional[str]:
+        if policy.key == "ip":
+            return _client_ip(scope)
+        if policy.key == "username":
+            username = (form or {}).get("username")
+            return username.lower() if username else None
+        if policy.key == "user":
+            token = _bearer_token(scope)
+            claims = decode_access_token(token) if token else None
+            return claims.get("sub") if claims else None
+        return None
+
+
+def _headers(scope) -> Dict[str, str]:
+    return {k.decode("latin-1"): v.decode("latin-1") for k, v in scope.get("headers", [])}
+
+
+def _client_ip(scope) -> str:
+    if RATE_LIMIT_PROXY_HOPS > 0:
+        # Entries left of the trusted proxies' own are client-controlled
+        forwarded = [hop.strip() for hop in _headers(scope).get("x-forwarded-for", "").split(",") if hop.strip()]
+        if len(forwarded) >= RATE_LIMIT_PROXY_HOPS:
+            return forwarded[-RATE_LIMIT_PROXY_HOPS]
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def _bearer_token(scope) -> Optional[str]:
+    headers = _headers(scope)
+    authorization = headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        return authorization[7:]
+    for part in headers.get("cookie", "").split(";"):
+        name, _, value = part.strip().partition("=")
+        if name == "access_token":
+            value = value.strip('"')
+            if value.startswith("Bearer "):
+                return value[7:]
+    return None
+
+
+def _parse_form(scope, body: bytes) -> dict:
+    content_type = _headers(scope).get("content-type", "")
+    if not content_type.startswith("application/x-www-form-urlencoded"):
+        return {}
+    parsed = parse_qs(body.decode("latin-1"))
+    return {k: v[0] for k, v in parsed.items() if v}
+
+
+async def _read_body(scope, receive, limit: int) -> bytes:
+    """The whole request body; raises BodyTooLarge past ``limit`` bytes"""
+    length = _headers(scope).get("content-length", "")
+    if length.isdigit() and int(length) > limit:
+        raise BodyTooLarge()
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > limit:
+            raise BodyTooLarge()
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+def _replay(body: bytes, receive):
+    """Hand the already-consumed body to the app, then defer to the real channel"""
+    sent = False
+
+    async def replay_receive():
+        nonlocal sent
+        if sent:
+            return await receive()
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    return replay_receive
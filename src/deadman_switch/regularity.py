@@ -0,0 +1,123 @@
+"""
+Check-in Regularity Statistics and Miss Risk
+"""
+import math
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+from .models import SwitchStatus
+
+# Configuration
+# Check-in gaps a switch needs before it gets a miss-risk score
+MISS_RISK_MIN_SAMPLES = int(os.getenv("MISS_RISK_MIN_SAMPLES", 5))
+# Floor on the lateness spread, as a fraction of the interval, so a perfectly
+# regular history does not read as zero risk right up to the deadline
+MISS_RISK_MIN_SPREAD = float(os.getenv("MISS_RISK_MIN_SPREAD", 0.02))
+
+# DeadmanSwitch columns holding the running statistics
+STAT_COLUMNS = ("check_in_samples", "gap_mean", "gap_m2", "lateness_mean", "lateness_m2", "late_check_ins")
+
+
+def _naive(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def stats_of(switch) -> dict:
+    """The STAT_COLUMNS values of a switch or row, with unset ones as zero"""
+    return {column: getattr(switch, column) or 0 for column in STAT_COLUMNS}
+
+
+def observe(stats: dict, gap: float, lateness: float) -> dict:
+    """Welford update of the gap (seconds) and lateness (fraction of the interval) statistics"""
+    n = stats["check_in_samples"] + 1
+    gap_delta = gap - stats["gap_mean"]
+    gap_mean = stats["gap_mean"] + gap_delta / n
+    lateness_delta = lateness - stats["lateness_mean"]
+    lateness_mean = stats["lateness_mean"] + lateness_delta / n
+    return {
+        "check_in_samples": n,
+        "gap_mean": gap_mean,
+        "gap_m2": stats["gap_m2"] + gap_delta * (gap - gap_mean),
+        "lateness_mean": lateness_mean,
+        "lateness_m2": stats["lateness_m2"] + lateness_delta * (lateness - lateness_mean),
+        "late_check_ins": stats["late_check_ins"] + (1 if lateness > 0 else 0),
+    }
+
+
+def advance(
+    stats: dict,
+    last_check_in: Optional[datetime],
+    next_check_in_due: Optional[datetime],
+    interval: timedelta,
+    check_in_times: Iterable[datetime]
+) -> dict:
+    """Fold new check-ins, oldest first, into a switch's statistics.
+
+    A check-in's gap is measured from the one before it and its lateness
+    from the deadline that was pending, so a reset due date (re-enabling
+    a switch) counts from the reset. Check-ins no newer than the last one
+    are history only, and the first ever check-in just sets the baseline.
+    """
+    interval_seconds = interval.total_seconds()
+    last, due = _naive(last_check_in), _naive(next_check_in_due)
+    for check_in_time in sorted(map(_naive, check_in_times)):
+        if last is not None and check_in_time <= last:
+            continue
+        if last is not None and interval_seconds > 0:
+            due = due or last + interval
+            stats = observe(
+                stats,
+                (check_in_time - last).total_seconds(),
+                (check_in_time - due).total_seconds() / interval_seconds
+            )
+        last, due = check_in_time, check_in_time + interval
+    return stats
+
+
+def observe_check_ins(switch, check_in_times: Iterable[datetime]) -> None:
+    """Update a loaded switch's statistics for new check-ins; call before moving its due date"""
+    if not switch.is_enabled:
+        return
+    stats = advance(
+        stats_of(switch), switch.last_check_in, switch.next_check_in_due,
+        switch.check_in_interval, check_in_times
+    )
+    for column, value in stats.items():
+        setattr(switch, column, value)
+
+
+def _survival(x: float, mean: float, spread: float) -> float:
+    """P(X > x) for a normal distribution"""
+    return 0.5 * math.erfc((x - mean) / (spread * math.sqrt(2)))
+
+
+def miss_risk(switch, next_due: Optional[datetime], now: datetime) -> Optional[float]:
+    """Chance, from 0 to 1, that the switch's pending check-in misses its grace period.
+
+    Models lateness as normal with the switch's running mean and variance,
+    conditioned on the check-in not having happened yet, so the risk rises
+    as ``now`` passes the user's usual check-in time. None for paused
+    switches and until MISS_RISK_MIN_SAMPLES gaps have been seen.
+    """
+    if switch.status == SwitchStatus.TRIGGERED:
+        return 1.0
+    samples = switch.check_in_samples or 0
+    if not switch.is_enabled or samples < MISS_RISK_MIN_SAMPLES or next_due is None:
+        return None
+    interval_seconds = switch.check_in_interval.total_seconds()
+    if interval_seconds <= 0:
+        return None
+
+    threshold = switch.grace_period.total_seconds() / interval_seconds
+    elapsed = (now - _naive(next_due)).total_seconds() / interval_seconds
+    if elapsed >= threshold:
+        return 1.0
+    mean = switch.lateness_mean or 0.0
+    spread = max(math.sqrt(max(switch.lateness_m2 or 0.0, 0.0) / (samples - 1)), MISS_RISK_MIN_SPREAD)
+    still_pending = _survival(elapsed, mean, spread)
+    if still_pending <= 0:
+        return 1.0
+    return round(min(_survival(threshold, mean, spread) / still_pending, 1.0), 3)
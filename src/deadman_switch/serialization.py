@@ -0,0 +1,137 @@
+"""
+Fast JSON Serialization for API Responses
+"""
+import json
+from datetime import date, datetime, timezone
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+from .models import CheckIn, DeadmanSwitch, EmergencyContact
+from .regularity import miss_risk
+
+try:
+    import orjson  # optional: pip install orjson
+except ImportError:
+    orjson = None
+
+
+def _isoformat(value: datetime) -> str:
+    # Match pydantic, which writes UTC offsets as "Z"
+    text = value.isoformat()
+    return text[:-6] + "Z" if text.endswith("+00:00") else text
+
+
+def _default(value: Any):
+    if isinstance(value, datetime):
+        return _isoformat(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Compact JSON, via orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+        default=_default
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with :func:`dumps`.
+
+    Handlers that return one directly skip FastAPI's response_model
+    validation, so build its content with the ``*_to_dict`` helpers below,
+    which produce the same shape as the declared response models.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+# Columns read for each response shape; select these instead of whole ORM rows
+SWITCH_COLUMNS = (
+    DeadmanSwitch.id,
+    DeadmanSwitch.name,
+    DeadmanSwitch.description,
+    DeadmanSwitch.check_in_interval,
+    DeadmanSwitch.grace_period,
+    DeadmanSwitch.status,
+    DeadmanSwitch.is_enabled,
+    DeadmanSwitch.last_check_in,
+    DeadmanSwitch.next_check_in_due,
+    DeadmanSwitch.created_at,
+    DeadmanSwitch.check_in_samples,
+    DeadmanSwitch.lateness_mean,
+    DeadmanSwitch.lateness_m2,
+)
+
+CHECK_IN_COLUMNS = (
+    CheckIn.id,
+    CheckIn.check_in_time,
+    CheckIn.notes,
+    CheckIn.location,
+)
+
+CONTACT_COLUMNS = (
+    EmergencyContact.id,
+    EmergencyContact.name,
+    EmergencyContact.email,
+    EmergencyContact.phone,
+    EmergencyContact.contact_relationship,
+    EmergencyContact.priority,
+    EmergencyContact.webhook_url,
+)
+
+
+def switch_to_dict(row, now: datetime) -> dict:
+    """SwitchResponse fields from a SWITCH_COLUMNS row; ``now`` is naive UTC"""
+    next_due = row.next_check_in_due
+    if next_due is None:
+        next_due = (row.last_check_in or row.created_at) + row.check_in_interval
+    deadline = next_due + row.grace_period
+    if deadline.tzinfo is not None:
+        deadline = deadline.astimezone(timezone.utc).replace(tzinfo=None)
+    return {
+        "id": row.id,
+        "name": row.name,
+        "description": row.description,
+        "check_in_interval_hours": int(row.check_in_interval.total_seconds() // 3600),
+        "grace_period_hours": int(row.grace_period.total_seconds() // 3600),
+        "status": row.status,
+        "is_enabled": bool(row.is_enabled),
+        "last_check_in": row.last_check_in,
+        "next_check_in_due": next_due,
+        "created_at": row.created_at,
+        "is_overdue": now > deadline,
+        "miss_risk": miss_risk(row, next_due, now),
+    }
+
+
+def check_in_to_dict(row) -> dict:
+    """CheckInResponse fields from a CHECK_IN_COLUMNS row"""
+    return {
+        "id": row.id,
+        "check_in_time": row.check_in_time,
+        "notes": row.notes,
+        "location": row.location,
+    }
+
+
+def contact_to_dict(row) -> dict:
+    """EmergencyContactResponse fields from a CONTACT_COLUMNS row"""
+    return {
+        "id": row.id,
+        "name": row.name,
+        "email": row.email,
+        "phone": row.phone,
+        "contact_relationship": row.contact_relationship,
+        "priority": row.priority,
+        "webhook_url": row.webhook_url,
+    }
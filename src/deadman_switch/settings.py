@@ -0,0 +1,162 @@
+"""
+In-Memory System Settings with Cross-Worker Invalidation
+"""
+import asyncio
+import logging
+import os
+import secrets
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import AsyncSessionLocal
+from .metrics import metrics
+from .models import SystemSettings
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+SETTINGS_POLL_SECONDS = float(os.getenv("SETTINGS_POLL_SECONDS", 5))
+
+# Row whose value changes with every update; other workers poll it
+VERSION_KEY = "settings.version"
+
+TRUE_VALUES = {"1", "true", "yes", "on"}
+
+
+def _insert_for(db: AsyncSession):
+    """The dialect's INSERT with ON CONFLICT support, or None"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert
+    if dialect == "sqlite":
+        return sqlite.insert
+    return None
+
+
+async def _upsert(db: AsyncSession, rows: List[dict]) -> None:
+    dialect_insert = _insert_for(db)
+    if dialect_insert is not None:
+        stmt = dialect_insert(SystemSettings).values(rows)
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[SystemSettings.key],
+            set_={"value": stmt.excluded.value, "updated_at": func.now()}
+        ))
+        return
+
+    # Other dialects: update the keys that exist, then insert the rest
+    missing = []
+    for row in rows:
+        result = await db.execute(
+            update(SystemSettings)
+            .where(SystemSettings.key == row["key"])
+            .values(value=row["value"], updated_at=func.now())
+        )
+        if result.rowcount == 0:
+            missing.append(row)
+    if missing:
+        await db.execute(insert(SystemSettings), missing)
+
+
+class SettingsService:
+    """Every ``system_settings`` row, held in memory.
+
+    Reads are dictionary lookups and never touch the database, so tunables
+    can be read on hot paths. Updates are written as one bulk upsert (one
+    UPDATE per key plus an INSERT on databases without ON CONFLICT) that
+    also replaces the version row; each worker polls that single row and
+    reloads everything when it changes. The worker that made the update
+    applies it immediately.
+    """
+
+    def __init__(self, poll_interval: float = SETTINGS_POLL_SECONDS, session_factory=AsyncSessionLocal):
+        self.poll_interval = poll_interval
+        self.session_factory = session_factory
+        self.version: Optional[str] = None
+        self.loaded_at: Optional[datetime] = None
+        self._values: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    async def load(self) -> int:
+        async with self.session_factory() as db:
+            result = await db.execute(select(SystemSettings.key, SystemSettings.value))
+            rows = result.all()
+        values = {row.key: row.value for row in rows}
+        self.version = values.pop(VERSION_KEY, None)
+        self._values = values
+        self.loaded_at = datetime.utcnow()
+        metrics.inc("settings_reloads_total")
+        return len(values)
+
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        value = self._values.get(key)
+        return default if value is None or value == "" else value
+
+    def get_int(self, key: str, default: int) -> int:
+        try:
+            return int(self.get(key, default))
+        except ValueError:
+            logger.warning("Setting %s is not an integer, using %s", key, default)
+            return default
+
+    def get_float(self, key: str, default: float) -> float:
+        try:
+            return float(self.get(key, default))
+        except ValueError:
+            logger.warning("Setting %s is not a number, using %s", key, default)
+            return default
+
+    def get_bool(self, key: str, default: bool) -> bool:
+        value = self.get(key)
+        if value is None:
+            return default
+        return value.strip().lower() in TRUE_VALUES
+
+    def items(self) -> List[Tuple[str, str]]:
+        return sorted(self._values.items())
+
+    async def update(self, values: Dict[str, str]) -> int:
+        """Upsert ``values`` and the version row in one transaction"""
+        if not values:
+            return 0
+        version = secrets.token_hex(8)
+        rows = [
+            {"key": key, "value": value, "description": f"Setting for {key}"}
+            for key, value in values.items()
+        ]
+        rows.append({"key": VERSION_KEY, "value": version, "description": "Changes on every settings update"})
+
+        async with self.session_factory() as db:
+            await _upsert(db, rows)
+            await db.commit()
+
+        self._values.update(values)
+        self.version = version
+        metrics.inc("settings_updates_total")
+        return len(values)
+
+    async def poll_once(self) -> bool:
+        """Reload if another worker changed the settings; returns True on reload"""
+        async with self.session_factory() as db:
+            result = await db.execute(select(SystemSettings.value).where(SystemSettings.key == VERSION_KEY))
+            version = result.scalar_one_or_none()
+        if version == self.version:
+            return False
+        await self.load()
+        return True
+
+    async def refresh_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.poll_once()
+            except Exception:
+                logger.exception("Settings refresh failed")
+
+
+settings_service = SettingsService()
@@ -0,0 +1,380 @@
+"""
+Horizontal Sharding of Users and Their Switches
+"""
+import asyncio
+import bisect
+import hashlib
+import logging
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import func, insert, select, text, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from .database import DATABASE_URL, AsyncSessionLocal, async_engine, create_async_engine_for
+from .metrics import metrics
+from .models import (
+    CheckIn, DeadmanSwitch, Device, EmergencyContact, Notification, ShardAssignment, ShardState,
+    SwitchStatus, User, UserActivitySummary
+)
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+# Comma-separated database URLs of shards 1..n; DATABASE_URL is always shard 0
+# and keeps the global tables (users, the shard directory, settings)
+DATABASE_SHARD_URLS = [url.strip() for url in os.getenv("DATABASE_SHARD_URLS", "").split(",") if url.strip()]
+SHARD_VIRTUAL_NODES = int(os.getenv("SHARD_VIRTUAL_NODES", 64))
+SHARD_DIRECTORY_POLL_SECONDS = float(os.getenv("SHARD_DIRECTORY_POLL_SECONDS", 5))
+# How long a move holds a user's requests off before copying, so requests and
+# check-in batches already routed to the old shard finish first
+SHARD_MOVE_SETTLE_SECONDS = float(os.getenv("SHARD_MOVE_SETTLE_SECONDS", 2 * SHARD_DIRECTORY_POLL_SECONDS))
+SHARD_MOVE_BATCH_SIZE = int(os.getenv("SHARD_MOVE_BATCH_SIZE", 1000))
+# Ids on shard n start at n * SHARD_ID_BLOCK; ids are 32-bit on PostgreSQL,
+# so the block must leave room for every shard below 2**31
+SHARD_ID_BLOCK = int(os.getenv("SHARD_ID_BLOCK", 100_000_000))
+
+# Re-read directory rows this far behind the newest one seen, so a row whose
+# transaction committed late is not skipped by the incremental poll
+DIRECTORY_POLL_OVERLAP = timedelta(seconds=30)
+
+# Tables holding a user's rows, in foreign key order
+MOVED_MODELS = (Device, DeadmanSwitch, EmergencyContact, CheckIn, Notification, UserActivitySummary)
+# The ones whose ids must be unique across shards
+ID_MODELS = tuple(model for model in MOVED_MODELS if "id" in model.__table__.c)
+
+
+class ShardMovingError(RuntimeError):
+    """The user's rows are being moved between shards; retry shortly"""
+
+    def __init__(self, user_id: int):
+        super().__init__(f"User {user_id} is being moved to another shard")
+        self.user_id = user_id
+
+
+class ShardMoveError(RuntimeError):
+    """A user cannot be moved right now"""
+
+
+class ShardIdError(RuntimeError):
+    """A shard would hand out ids outside its reserved block"""
+
+
+class Shard(NamedTuple):
+    index: int
+    url: str
+    engine: AsyncEngine
+    session_factory: Callable[[], AsyncSession]
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hashing of user ids onto shard indexes.
+
+    Each shard owns ``virtual_nodes`` points on the ring, so adding a shard
+    moves roughly 1/n of the users, drawn evenly from every existing shard.
+    """
+
+    def __init__(self, shard_count: int, virtual_nodes: int = SHARD_VIRTUAL_NODES):
+        points = sorted(
+            (_hash(f"shard-{shard}-{vnode}"), shard)
+            for shard in range(shard_count)
+            for vnode in range(virtual_nodes)
+        )
+        self._points = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def shard_for(self, user_id: int) -> int:
+        position = bisect.bisect(self._points, _hash(f"user-{user_id}")) % len(self._points)
+        return self._shards[position]
+
+
+def _owned_rows(model, user_id: int):
+    """All of a user's rows in one of MOVED_MODELS"""
+    if model in (EmergencyContact, Notification):
+        switch_ids = select(DeadmanSwitch.id).where(DeadmanSwitch.user_id == user_id)
+        return model.__table__.c.deadman_switch_id.in_(switch_ids.scalar_subquery())
+    return model.__table__.c.user_id == user_id
+
+
+class ShardRouter:
+    """Routes a user's switches, check-ins and notifications to one database.
+
+    New users are placed on a consistent-hash ring and recorded in the
+    ``shard_directory`` table on the primary; users without a directory row
+    predate sharding and live on the primary. Every worker keeps the
+    directory in memory and polls it for moves. A user being moved is marked
+    ``moving`` and their requests fail with ShardMovingError until the copy
+    is done. With no DATABASE_SHARD_URLS everything stays on the primary and
+    the directory is never read.
+    """
+
+    def __init__(
+        self,
+        urls: Optional[List[str]] = None,
+        virtual_nodes: int = SHARD_VIRTUAL_NODES,
+        poll_interval: float = SHARD_DIRECTORY_POLL_SECONDS
+    ):
+        self.shards = [Shard(0, DATABASE_URL, async_engine, AsyncSessionLocal)]
+        for index, url in enumerate(DATABASE_SHARD_URLS if urls is None else urls, start=1):
+            engine = create_async_engine_for(url)
+            self.shards.append(Shard(
+                index, url, engine, sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+            ))
+        self.ring = HashRing(len(self.shards), virtual_nodes)
+        self.poll_interval = poll_interval
+        self._directory: Dict[int, Tuple[int, str]] = {}  # user_id -> (shard, state)
+        self._synced_until: Optional[datetime] = None
+        self._mirrored: Set[Tuple[int, int]] = set()  # (shard, user_id) with a user row
+        self._id_blocks_checked = False
+
+    @property
+    def enabled(self) -> bool:
+        return len(self.shards) > 1
+
+    @property
+    def primary(self) -> Shard:
+        return self.shards[0]
+
+    async def load(self) -> int:
+        """Read directory rows changed since the last poll"""
+        if not self.enabled:
+            return 0
+        if not self._id_blocks_checked:
+            await self.check_id_blocks()
+            self._id_blocks_checked = True
+        query = select(ShardAssignment.user_id, ShardAssignment.shard, ShardAssignment.state, ShardAssignment.updated_at)
+        if self._synced_until is not None:
+            query = query.where(ShardAssignment.updated_at >= self._synced_until - DIRECTORY_POLL_OVERLAP)
+        async with self.primary.session_factory() as db:
+            rows = (await db.execute(query)).all()
+        for row in rows:
+            self._directory[row.user_id] = (row.shard, row.state)
+            if self._synced_until is None or row.updated_at > self._synced_until:
+                self._synced_until = row.updated_at
+        metrics.set("shard_directory_size", len(self._directory))
+        return len(rows)
+
+    async def check_id_blocks(self) -> None:
+        """Refuse to run unless every shard allocates ids inside its own block.
+
+        Switch ids are unique only because shard n hands out ids from
+        ``n * SHARD_ID_BLOCK`` (``rebalance_shards.py init``); the heartbeat
+        and deadline indexes, heartbeat packets and locate_switch key on the
+        id alone.
+        """
+        async def last_ids(db: AsyncSession) -> Dict[str, int]:
+            last = {}
+            for model in ID_MODELS:
+                table = model.__tablename__
+                if db.bind.dialect.name == "postgresql":
+                    value = (await db.execute(
+                        text("SELECT pg_sequence_last_value(pg_get_serial_sequence(:table, 'id')::regclass)"),
+                        {"table": table}
+                    )).scalar()
+                else:
+                    # Without sequences new rows take MAX(id) + 1
+                    value = (await db.execute(select(func.max(model.__table__.c.id)))).scalar()
+                last[table] = value or 0
+            return last
+
+        for shard, last in zip(self.shards, await self.gather(last_ids)):
+            floor = shard.index * SHARD_ID_BLOCK
+            for table, value in last.items():
+                if not floor <= value < floor + SHARD_ID_BLOCK - 1:
+                    raise ShardIdError(
+                        f"Shard {shard.index} would assign {table} ids after {value}, outside its block "
+                        f"[{floor}, {floor + SHARD_ID_BLOCK}); run `python rebalance_shards.py init` "
+                        f"on PostgreSQL shards"
+                    )
+
+    async def refresh_forever(self) -> None:
+        if not self.enabled:
+            return
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.load()
+            except Exception:
+                logger.exception("Shard directory refresh failed")
+
+    async def shard_for(self, user_id: int) -> Shard:
+        """The shard holding a user's rows; raises ShardMovingError mid-move"""
+        if not self.enabled:
+            return self.primary
+        entry = self._directory.get(user_id)
+        if entry is None:
+            # Registered by another worker since the last poll, or a legacy user
+            async with self.primary.session_factory() as db:
+                row = (await db.execute(
+                    select(ShardAssignment.shard, ShardAssignment.state).where(ShardAssignment.user_id == user_id)
+                )).first()
+            entry = (row.shard, row.state) if row else (0, ShardState.ACTIVE.value)
+            self._directory[user_id] = entry
+        shard, state = entry
+        if state == ShardState.MOVING:
+            raise ShardMovingError(user_id)
+        return self.shards[shard]
+
+    @asynccontextmanager
+    async def session(self, user_id: int):
+        """``async with shard_router.session(user_id) as db:`` on the user's shard"""
+        shard = await self.shard_for(user_id)
+        async with shard.session_factory() as db:
+            yield db
+
+    def assign(self, db: AsyncSession, user_id: int) -> Optional[int]:
+        """Place a new user on the ring, in the caller's (primary) transaction"""
+        if not self.enabled:
+            return None
+        shard = self.ring.shard_for(user_id)
+        db.add(ShardAssignment(user_id=user_id, shard=shard, state=ShardState.ACTIVE, updated_at=datetime.utcnow()))
+        self._directory[user_id] = (shard, ShardState.ACTIVE.value)
+        return shard
+
+    async def mirror_user(self, db: AsyncSession, shard: Shard, user: User) -> None:
+        """Copy a user's row to a shard so its foreign keys resolve.
+
+        Shard copies carry no password; authentication always reads the
+        primary.
+        """
+        if shard.index == 0 or (shard.index, user.id) in self._mirrored:
+            return
+        exists = (await db.execute(select(User.id).where(User.id == user.id))).scalar()
+        if exists is None:
+            try:
+                await db.execute(insert(User.__table__).values(
+                    id=user.id,
+                    username=user.username,
+                    email=user.email,
+                    full_name=user.full_name,
+                    hashed_password="",
+                    role=user.role,
+                    is_active=user.is_active
+                ))
+                await db.commit()
+            except IntegrityError:
+                await db.rollback()  # mirrored concurrently by another worker
+        self._mirrored.add((shard.index, user.id))
+
+    async def gather(self, fn: Callable[[AsyncSession], Awaitable], db: Optional[AsyncSession] = None) -> list:
+        """Run ``fn(session)`` on every shard concurrently; one result per shard.
+
+        ``db``, a session on the primary, is reused for shard 0.
+        """
+        async def run(shard: Shard):
+            if shard.index == 0 and db is not None:
+                return await fn(db)
+            async with shard.session_factory() as session:
+                return await fn(session)
+
+        return list(await asyncio.gather(*(run(shard) for shard in self.shards)))
+
+    async def scatter(self, statement) -> list:
+        """Rows of a read-only query, concatenated across shards"""
+        async def fetch(db: AsyncSession):
+            return (await db.execute(statement)).all()
+
+        return [row for rows in await self.gather(fetch) for row in rows]
+
+    async def locate_switch(self, switch_id: int) -> Optional[Shard]:
+        """The shard holding a switch, found through its owner"""
+        if not self.enabled:
+            return self.primary
+        rows = await self.scatter(select(DeadmanSwitch.user_id).where(DeadmanSwitch.id == switch_id))
+        if not rows:
+            return None
+        return await self.shard_for(rows[0].user_id)
+
+    async def dispose(self) -> None:
+        for shard in self.shards[1:]:
+            await shard.engine.dispose()
+
+    async def _write_directory(self, user_id: int, shard: int, state: ShardState) -> None:
+        now = datetime.utcnow()
+        async with self.primary.session_factory() as db:
+            result = await db.execute(
+                update(ShardAssignment)
+                .where(ShardAssignment.user_id == user_id)
+                .values(shard=shard, state=state, updated_at=now)
+            )
+            if result.rowcount == 0:
+                db.add(ShardAssignment(user_id=user_id, shard=shard, state=state, updated_at=now))
+            await db.commit()
+        self._directory[user_id] = (shard, state.value)
+
+    async def move_user(self, user_id: int, target: int, settle: float = SHARD_MOVE_SETTLE_SECONDS) -> int:
+        """Move a user's rows to another shard while the app keeps serving.
+
+        The user is marked ``moving`` (their requests get a 503) and, after
+        ``settle`` seconds for in-flight work to finish, their rows are copied
+        with their ids in one transaction, the directory is pointed at the
+        target and the old rows are deleted. A failed copy leaves the user
+        on the source shard. Returns the number of rows copied.
+        """
+        self._directory.pop(user_id, None)  # the tool's cache may be stale
+        source = await self.shard_for(user_id)
+        destination = self.shards[target]
+        if destination.index == source.index:
+            return 0
+
+        async with self.primary.session_factory() as db:
+            user = (await db.execute(select(User).where(User.id == user_id))).scalar_one_or_none()
+        if user is None:
+            raise ShardMoveError(f"User {user_id} does not exist")
+        async with source.session_factory() as db:
+            escalating = (await db.execute(
+                select(func.count(DeadmanSwitch.id)).where(
+                    DeadmanSwitch.user_id == user_id,
+                    DeadmanSwitch.status == SwitchStatus.TRIGGERED,
+                    DeadmanSwitch.acknowledged_at.is_(None)
+                )
+            )).scalar()
+        if escalating:
+            # Escalation timers live in the source shard's scheduler
+            raise ShardMoveError(f"User {user_id} has {escalating} triggered switches still escalating")
+
+        await self._write_directory(user_id, source.index, ShardState.MOVING)
+        try:
+            await asyncio.sleep(settle)
+            copied = await self._copy_rows(user, source, destination)
+        except BaseException:
+            await self._write_directory(user_id, source.index, ShardState.ACTIVE)
+            raise
+        await self._write_directory(user_id, destination.index, ShardState.ACTIVE)
+
+        async with source.session_factory() as db:
+            for model in reversed(MOVED_MODELS):
+                await db.execute(model.__table__.delete().where(_owned_rows(model, user_id)))
+            await db.commit()
+        metrics.inc("shard_moves_total")
+        metrics.inc("shard_moved_rows_total", copied)
+        logger.info("Moved user %d from shard %d to shard %d (%d rows)", user_id, source.index, destination.index, copied)
+        return copied
+
+    async def _copy_rows(self, user: User, source: Shard, destination: Shard) -> int:
+        copied = 0
+        async with source.session_factory() as src, destination.session_factory() as dst:
+            await self.mirror_user(dst, destination, user)
+            for model in MOVED_MODELS:
+                result = await src.stream(select(model.__table__).where(_owned_rows(model, user.id)))
+                async for rows in result.mappings().partitions(SHARD_MOVE_BATCH_SIZE):
+                    values = [dict(row) for row in rows]
+                    if model is Notification:
+                        # Digests are per database; moved history keeps no link
+                        for value in values:
+                            value["digest_id"] = None
+                    await dst.execute(insert(model.__table__), values)
+                    copied += len(values)
+            await dst.commit()
+        return copied
+
+
+shard_router = ShardRouter()
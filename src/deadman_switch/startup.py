@@ -0,0 +1,43 @@
+"""
+Startup Time Breakdown
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """Wall-clock time of each startup phase, published once the app is ready"""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+
+    def record(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0) + seconds
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def report(self) -> float:
+        """Log the breakdown and expose it as ``startup_phase_seconds`` gauges"""
+        total = sum(self.phases.values())
+        for name, seconds in self.phases.items():
+            metrics.set("startup_phase_seconds", round(seconds, 6), phase=name)
+        metrics.set("startup_seconds", round(total, 6))
+        breakdown = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.phases.items())
+        logger.info("Process %d ready in %.0f ms (%s)", os.getpid(), total * 1000, breakdown)
+        return total
+
+
+startup_timer = StartupTimer()
@@ -0,0 +1,54 @@
+"""
+Shared Jinja2 Templates
+"""
+import os
+
+from .assets import static_url
+
+# Configuration
+TEMPLATE_BYTECODE_CACHE = os.getenv("TEMPLATE_BYTECODE_CACHE", "true").lower() == "true"
+TEMPLATE_BYTECODE_CACHE_DIR = os.getenv("TEMPLATE_BYTECODE_CACHE_DIR") or None  # None = system temp dir
+
+
+class LazyTemplates:
+    """Jinja2Templates built on first use, so importing a router stays cheap.
+
+    Attribute access (``TemplateResponse``, ``env``, ...) is forwarded to
+    the real instance; ``warm_up`` builds it and loads every template
+    during startup instead of on the first request that renders one.
+    Compiled templates go to a bytecode cache on disk, so only the first
+    worker after a template change pays for compiling them.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._templates = None
+
+    def _load(self):
+        if self._templates is None:
+            from fastapi.templating import Jinja2Templates
+            from jinja2 import FileSystemBytecodeCache
+
+            options = {}
+            if TEMPLATE_BYTECODE_CACHE:
+                # Compiled templates shared by every worker and across restarts
+                options["bytecode_cache"] = FileSystemBytecodeCache(TEMPLATE_BYTECODE_CACHE_DIR)
+            templates = Jinja2Templates(directory=self.directory, **options)
+            templates.env.globals["static_url"] = static_url
+            self._templates = templates
+        return self._templates
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def warm_up(self) -> int:
+        """Compile every template into the environment's cache"""
+        env = self._load().env
+        names = env.list_templates(extensions=["html"])
+        for name in names:
+            env.get_template(name)
+        return len(names)
+
+
+# One environment for every router, so helpers and the template cache are shared
+templates = LazyTemplates(directory="templates")
@@ -0,0 +1,226 @@
+"""
+Pooled Webhook Transport with Per-Host Circuit Breakers
+"""
+import asyncio
+import importlib.util
+import ipaddress
+import logging
+import os
+import random
+import socket
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+WEBHOOK_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_TIMEOUT_SECONDS", 10))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", 100))
+WEBHOOK_PER_HOST_CONCURRENCY = int(os.getenv("WEBHOOK_PER_HOST_CONCURRENCY", 10))
+WEBHOOK_MAX_RETRIES = int(os.getenv("WEBHOOK_MAX_RETRIES", 3))
+WEBHOOK_BACKOFF_BASE_MS = int(os.getenv("WEBHOOK_BACKOFF_BASE_MS", 500))
+WEBHOOK_BACKOFF_MAX_MS = int(os.getenv("WEBHOOK_BACKOFF_MAX_MS", 10000))
+WEBHOOK_BREAKER_THRESHOLD = int(os.getenv("WEBHOOK_BREAKER_THRESHOLD", 5))
+WEBHOOK_BREAKER_RESET_SECONDS = float(os.getenv("WEBHOOK_BREAKER_RESET_SECONDS", 60))
+# Hosts allowed even though they resolve to private, loopback or link-local addresses
+WEBHOOK_ALLOWED_HOSTS = {
+    host.strip().lower() for host in os.getenv("WEBHOOK_ALLOWED_HOSTS", "").split(",") if host.strip()
+}
+
+# HTTP/2 needs the optional h2 package (pip install httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+def _is_public_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+async def is_valid_webhook_url(url: str) -> bool:
+    """An http(s) URL whose host resolves only to public addresses, or is in WEBHOOK_ALLOWED_HOSTS"""
+    try:
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port
+    except ValueError:
+        return False
+    if parts.scheme not in ("http", "https") or not host:
+        return False
+    if host.lower() in WEBHOOK_ALLOWED_HOSTS:
+        return True
+    try:
+        addresses = await asyncio.get_running_loop().getaddrinfo(
+            host, port or (443 if parts.scheme == "https" else 80), type=socket.SOCK_STREAM
+        )
+    except (socket.gaierror, UnicodeError):
+        return False
+    return bool(addresses) and all(_is_public_address(info[4][0]) for info in addresses)
+
+
+class WebhookError(Exception):
+    """Delivery failed permanently or after all retries"""
+
+
+class CircuitOpenError(WebhookError):
+    """The target host is failing; requests are short-circuited"""
+
+
+class CircuitBreaker:
+    """Opens after ``threshold`` consecutive failures and lets one probe through after ``reset_timeout``"""
+
+    def __init__(self, threshold: int = WEBHOOK_BREAKER_THRESHOLD, reset_timeout: float = WEBHOOK_BREAKER_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.opened_at is not None or self.failures >= self.threshold:
+            # A failed probe re-opens for another full timeout
+            self.opened_at = time.monotonic()
+
+
+class WebhookTransport:
+    """POSTs JSON to webhook URLs over one shared, keep-alive connection pool.
+
+    Each host gets its own concurrency limit and circuit breaker, so one slow
+    or failing endpoint cannot use up the pool or be retried indefinitely.
+    Connection errors, timeouts, 429 and 5xx responses are retried with full
+    jitter backoff; other 4xx responses fail immediately.
+    """
+
+    def __init__(
+        self,
+        timeout: float = WEBHOOK_TIMEOUT_SECONDS,
+        max_connections: int = WEBHOOK_MAX_CONNECTIONS,
+        per_host_concurrency: int = WEBHOOK_PER_HOST_CONCURRENCY,
+        max_retries: int = WEBHOOK_MAX_RETRIES,
+        backoff_base: float = WEBHOOK_BACKOFF_BASE_MS / 1000,
+        backoff_max: float = WEBHOOK_BACKOFF_MAX_MS / 1000,
+        breaker_threshold: int = WEBHOOK_BREAKER_THRESHOLD,
+        breaker_reset: float = WEBHOOK_BREAKER_RESET_SECONDS
+    ):
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.per_host_concurrency = per_host_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                ),
+                headers={"User-Agent": "deadman-switch-webhook/1.0"}
+            )
+        return self._client
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(self.breaker_threshold, self.breaker_reset)
+        return breaker
+
+    def _semaphore(self, host: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._semaphores[host] = asyncio.Semaphore(self.per_host_concurrency)
+        return semaphore
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def post(self, url: str, payload: dict) -> httpx.Response:
+        host = urlsplit(url).netloc
+        # Checked again at delivery, as the host may resolve differently than when it was saved
+        if not await is_valid_webhook_url(url):
+            metrics.inc("webhook_requests_total", outcome="blocked")
+            raise WebhookError(f"Webhook host {host} is not allowed")
+        breaker = self.breaker(host)
+        last_error = "no attempt made"
+        for attempt in range(self.max_retries + 1):
+            if not breaker.allow():
+                metrics.inc("webhook_requests_total", outcome="circuit-open")
+                raise CircuitOpenError(f"Circuit open for {host}")
+
+            retry_after = None
+            try:
+                async with self._semaphore(host):
+                    response = await self.client.post(url, json=payload)
+            except httpx.HTTPError as e:
+                last_error = f"{type(e).__name__}: {e}"
+            else:
+                if response.status_code < 400:
+                    breaker.record_success()
+                    metrics.inc("webhook_requests_total", outcome="ok")
+                    return response
+                if response.status_code != 429 and response.status_code < 500:
+                    # The endpoint is up but rejected the request; retrying won't help
+                    breaker.record_success()
+                    metrics.inc("webhook_requests_total", outcome="rejected")
+                    raise WebhookError(f"HTTP {response.status_code} from {host}")
+                last_error = f"HTTP {response.status_code}"
+                retry_after = response.headers.get("retry-after")
+
+            breaker.record_failure()
+            metrics.inc("webhook_requests_total", outcome="error")
+            if attempt < self.max_retries:
+                await asyncio.sleep(self._backoff(attempt, retry_after))
+
+        raise WebhookError(f"{last_error} from {host} after {self.max_retries + 1} attempts")
+
+    async def send(self, recipient: str, subject: str, body: str) -> None:
+        """Notification transport interface; ``recipient`` is the webhook URL"""
+        await self.post(recipient, {"subject": subject, "message": body})
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+webhook_transport = WebhookTransport()